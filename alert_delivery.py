@@ -0,0 +1,151 @@
+# alert_delivery.py
+import asyncio
+import itertools
+import logging
+import time
+from telegram.error import NetworkError, RetryAfter
+from config import Config
+from zone_config import SIGNAL_PRIORITY
+from scan_metrics import DELIVERY_SECONDS, DELIVERIES_TOTAL, DELIVERY_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+
+def signal_priority(signal):
+    """اولویت یک سیگنال بر اساس SIGNAL_PRIORITY (عدد بزرگ‌تر = ارسال زودتر)"""
+    signal_type = signal.get('signal_type', '')
+    upper_type = signal_type.upper()
+    if 'ORIGIN' in upper_type:
+        key = 'ORIGIN_ZONE'
+    elif upper_type.startswith('GEM_'):
+        key = 'TIER1_BREAKOUT' if 'BREAKOUT' in upper_type else 'TIER1_APPROACHING'
+    elif signal_type == 'PULLBACK_RETEST_CONFIRMED':
+        key = 'TIER1_BREAKOUT'
+    else:
+        tier = signal.get('zone_tier') or 'TIER2'
+        if 'BREAKOUT' in upper_type or 'BREAKDOWN' in upper_type:
+            key = f"{tier}_BREAKOUT"
+        elif 'APPROACHING' in upper_type:
+            key = f"{tier}_APPROACHING"
+        else:
+            key = None
+    return SIGNAL_PRIORITY.get(key, 0)
+
+
+class AlertDeliveryQueue:
+    """
+    صف ارسال هشدارها به تلگرام با worker جداگانه: ترتیب بر اساس اولویت سیگنال،
+    رعایت فاصله پیام‌ها در هر چت و سقف کلی، و تلاش مجدد برای RetryAfter و خطاهای شبکه.
+    """
+
+    def __init__(self, send_func, chat_min_interval=None, global_rate=None, max_retries=None):
+        # send_func(signal, chat_id) باید RetryAfter/NetworkError را بالا بیندازد
+        self.send_func = send_func
+        self.chat_min_interval = Config.ALERT_CHAT_MIN_INTERVAL if chat_min_interval is None else chat_min_interval
+        self.global_interval = 1.0 / (global_rate or Config.ALERT_GLOBAL_RATE)
+        self.max_retries = Config.ALERT_MAX_RETRIES if max_retries is None else max_retries
+        self.queue = asyncio.PriorityQueue()
+        self.running = False
+        self._sequence = itertools.count()
+        self._last_chat_send = {}
+        self._last_global_send = 0.0
+        # تلاش‌های مجدد در انتظار (event loop فقط ارجاع ضعیف به taskها نگه می‌دارد)
+        self._retry_tasks = set()
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def enqueue(self, signal, chat_id):
+        """افزودن هشدار بدون انتظار؛ اسکنر هرگز منتظر تلگرام نمی‌ماند"""
+        priority = signal_priority(signal)
+        item = (-priority, next(self._sequence), time.monotonic(), 0, chat_id, signal)
+        self.queue.put_nowait(item)
+        DELIVERY_QUEUE_DEPTH.set(self.queue.qsize())
+        logger.info(f"📬 Queued {signal.get('signal_type')} for {signal.get('symbol')} (priority {priority}, depth {self.queue.qsize()})")
+
+    async def _pace(self, chat_id):
+        """صبر تا رعایت فاصله حداقل در چت و سقف کلی ارسال"""
+        now = time.monotonic()
+        ready_at = max(
+            self._last_chat_send.get(chat_id, 0.0) + self.chat_min_interval,
+            self._last_global_send + self.global_interval,
+        )
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _deliver(self, item):
+        neg_priority, sequence, enqueued_at, attempt, chat_id, signal = item
+        await self._pace(chat_id)
+        try:
+            await self.send_func(signal, chat_id)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+            self._requeue(item, retry_after, f"RetryAfter {retry_after:.0f}s")
+            # محدودیت تلگرام برای کل ربات است؛ همه ارسال‌ها عقب می‌افتند
+            self._last_global_send = time.monotonic() + retry_after
+            return
+        except NetworkError as e:
+            # شامل TimedOut؛ هشدار تکراری احتمالی بهتر از هشدار از دست رفته است
+            self._requeue(item, min(2 ** attempt, 60), f"network error: {e}")
+            return
+        finally:
+            sent_at = time.monotonic()
+            self._last_chat_send[chat_id] = sent_at
+            self._last_global_send = max(self._last_global_send, sent_at)
+
+        DELIVERIES_TOTAL.inc('delivered')
+        DELIVERY_SECONDS.observe(time.monotonic() - enqueued_at)
+
+    def _requeue(self, item, delay, reason):
+        neg_priority, sequence, enqueued_at, attempt, chat_id, signal = item
+        if attempt + 1 > self.max_retries:
+            DELIVERIES_TOTAL.inc('failed')
+            logger.error(f"❌ Giving up on alert for {signal.get('symbol')} after {attempt + 1} attempts ({reason})")
+            return
+        DELIVERIES_TOTAL.inc('retried')
+        logger.warning(f"🔁 Retrying alert for {signal.get('symbol')} in {delay:.1f}s ({reason})")
+        retry_item = (neg_priority, sequence, enqueued_at, attempt + 1, chat_id, signal)
+
+        async def _delayed_put():
+            await asyncio.sleep(delay)
+            self.queue.put_nowait(retry_item)
+            DELIVERY_QUEUE_DEPTH.set(self.queue.qsize())
+
+        task = asyncio.create_task(_delayed_put())
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def run(self):
+        """worker ارسال؛ تا running=False ادامه می‌دهد"""
+        self.running = True
+        logger.info("📮 Alert delivery worker started.")
+        while self.running:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                continue
+            DELIVERY_QUEUE_DEPTH.set(self.queue.qsize())
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                DELIVERIES_TOTAL.inc('failed')
+                logger.error(f"❌ Alert delivery failed: {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
+        logger.info("📮 Alert delivery worker stopped.")
+
+    async def stop(self, drain_timeout=10):
+        """ارسال هشدارهای صف (حداکثر drain_timeout ثانیه)، سپس توقف worker و لغو تلاش‌های مجدد معوق"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.running = False
+        retries = list(self._retry_tasks)
+        for task in retries:
+            task.cancel()
+        if retries:
+            await asyncio.gather(*retries, return_exceptions=True)
+        undelivered = self.queue.qsize() + len(retries)
+        if undelivered:
+            logger.warning(f"⚠️ Alert delivery stopped with {undelivered} alerts undelivered")
@@ -4,53 +4,81 @@ from datetime import datetime, timedelta
 from database_manager import db_manager
 import httpx
 from token_cache import TokenCache
+from config import Config
+from shared_cache import shared_cache, candle_ttl
+from candle_store import candle_store, with_indicators
 from scipy.signal import argrelextrema
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.patches as patches
 import io
-import time
 from zone_config import *
 
+
+def next_fibonacci_state(fibo_state, df, token_address, timeframe_str):
+    """
+    پیشرفت state فیبوناچی با آخرین قیمت: invalidation، برخورد به اهداف و ساخت state جدید.
+    خروجی (state برای تحلیل، state برای ذخیره یا None اگر تغییری نکرده).
+    """
+    current_price = df['close'].iloc[-1]
+    changed = False
+
+    if fibo_state and fibo_state['status'] in ['ACTIVE', 'TARGET_1_HIT']:
+        # Check invalidation
+        if current_price < fibo_state['low_point'] * 0.97:
+            fibo_state, changed = dict(fibo_state, status='INVALIDATED'), True
+        # Check target hits
+        elif fibo_state['status'] == 'ACTIVE' and current_price > fibo_state['target1_price']:
+            fibo_state = dict(fibo_state, status='TARGET_1_HIT')
+            return fibo_state, fibo_state
+        elif fibo_state['status'] == 'TARGET_1_HIT' and current_price > fibo_state['target2_price']:
+            fibo_state, changed = dict(fibo_state, status='COMPLETED'), True
+        else:
+            return fibo_state, None
+
+    # Create new state if needed
+    high_point = df['high'].max()
+    low_point = df['low'].min()
+    price_range = high_point - low_point
+
+    if price_range <= 0:
+        return None, (fibo_state if changed else None)
+
+    new_state = {
+        'token_address': token_address,
+        'timeframe': timeframe_str,
+        'high_point': float(high_point),
+        'low_point': float(low_point),
+        'target1_price': float(high_point + (price_range * 0.272)),
+        'target2_price': float(high_point + (price_range * 0.618)),
+        'status': 'ACTIVE'
+    }
+    return new_state, new_state
+
+
 class AnalysisEngine:
     def __init__(self):
         self.token_cache = TokenCache()
-        # In-Memory Cache for analysis results
-        self.analysis_cache = {}
-        self.cache_duration = 300  # 5 minutes cache validity
-
-    def _is_cache_valid(self, cache_key):
-        """Check if cached analysis is still valid"""
-        from datetime import datetime, timedelta
-        if cache_key not in self.analysis_cache:
-            return False
-        
-        cached_time = self.analysis_cache[cache_key].get('cached_at')
-        if not cached_time:
-            return False
-            
-        return datetime.now() - cached_time < timedelta(seconds=self.cache_duration)
 
-    async def perform_full_analysis(self, pool_id, token_address, timeframe="hour", aggregate="1", symbol=""):
-        """Main analysis function - Single Source of Truth"""
-        from datetime import datetime
-        
-        cache_key = f"{pool_id}_{timeframe}_{aggregate}_{int(time.time()/300)}"  # هر 5 دقیقه
+    async def perform_full_analysis(self, pool_id, token_address, timeframe="hour", aggregate="1", symbol="", context=None):
+        """Main analysis function - Single Source of Truth (context: ScanContext اسکن جاری برای استفاده از کندل‌های دریافت شده)"""
+        cache_key = f"analysis:{pool_id}:{timeframe}:{aggregate}"
         
-        # Check cache first
-        if self._is_cache_valid(cache_key):
+        # Check cache first (کش مشترک بین workerها، حداکثر تا بسته شدن کندل؛ نه برای کندل‌های لحظه‌ای stream)
+        cached_result = None if context is not None and context.live else await shared_cache.get(cache_key)
+        if cached_result is not None:
             print(f"✅ [CACHE] Using cached result for {pool_id}")
-            return self.analysis_cache[cache_key]['result']
+            return cached_result
         
         # Perform full analysis
-        analysis_result = await self._do_full_analysis(pool_id, token_address, timeframe, aggregate, symbol)
+        analysis_result = await self._do_full_analysis(pool_id, token_address, timeframe, aggregate, symbol, context)
         
         if analysis_result and self._validate_analysis_result(analysis_result):
             # Cache the result
-            self.analysis_cache[cache_key] = {
-                'result': analysis_result,
-                'cached_at': datetime.now()
-            }
+            await shared_cache.set(
+                cache_key, analysis_result,
+                candle_ttl(timeframe, aggregate, Config.CACHE_ANALYSIS_MAX_TTL)
+            )
             return analysis_result
             
         return None
@@ -71,14 +99,12 @@ class AnalysisEngine:
             
         return True
 
-    async def _do_full_analysis(self, pool_id, token_address, timeframe, aggregate, symbol):
+    async def _do_full_analysis(self, pool_id, token_address, timeframe, aggregate, symbol, context=None):
         """Core analysis logic - computes all technical data"""
-        from datetime import datetime
-        
         # Get historical data
         print(f"🔄 DEBUG: Starting analysis - Pool: {pool_id}, TF: {timeframe}/{aggregate}")
         
-        df = await self.get_historical_data(pool_id, timeframe, aggregate, limit=500)
+        df = await self.get_historical_data(pool_id, timeframe, aggregate, limit=500, context=context)
         print(f"🔍 DEBUG: Historical data shape: {df.shape if df is not None and not df.empty else 'Empty/None'}")
         
         if df is None or df.empty:
@@ -97,6 +123,13 @@ class AnalysisEngine:
             print(f"❌ DEBUG: Insufficient data - only {len(df)} candles (need {min_candles} for {timeframe})")
             return None
             
+        fibo_state = await self._get_or_create_fibonacci_state(df, token_address, timeframe, aggregate)
+        return self.analyze_frame(df, fibo_state, pool_id, symbol, timeframe, aggregate)
+
+    def analyze_frame(self, df, fibo_state, pool_id, symbol, timeframe, aggregate):
+        """محاسبه zoneها، فیبوناچی و tierها از کندل‌ها و state فیبوناچی (بدون شبکه و دیتابیس؛ در backtest هم استفاده می‌شود)"""
+        from datetime import datetime
+
         # Calculate zones
         # شناسایی Origin Zone (برای توکن‌های جدید)
         origin_zone = self.find_origin_zone(df)
@@ -110,7 +143,6 @@ class AnalysisEngine:
             
         # Calculate fibonacci
         # --- Start of New Smart Fibonacci System ---
-        fibo_state = await self._get_or_create_fibonacci_state(df, token_address, timeframe, aggregate)
         fibonacci_data = self._calculate_fibonacci_from_state(fibo_state)
         fibonacci_extensions = self._calculate_extensions_from_state(fibo_state)
         # --- End of New Smart Fibonacci System ---
@@ -234,48 +266,11 @@ class AnalysisEngine:
         from database_manager import db_manager
         
         timeframe_str = f"{timeframe}_{aggregate}"
-        current_price = df['close'].iloc[-1]
-        
-        # Get existing state
-        fibo_state = db_manager.get_fibo_state(token_address, timeframe_str)
-        
-        if fibo_state and fibo_state['status'] in ['ACTIVE', 'TARGET_1_HIT']:
-            # Check invalidation
-            if current_price < fibo_state['low_point'] * 0.97:
-                fibo_state['status'] = 'INVALIDATED'
-                db_manager.upsert_fibo_state(fibo_state)
-                fibo_state = None
-            else:
-                # Check target hits
-                if fibo_state['status'] == 'ACTIVE' and current_price > fibo_state['target1_price']:
-                    fibo_state['status'] = 'TARGET_1_HIT'
-                    db_manager.upsert_fibo_state(fibo_state)
-                elif fibo_state['status'] == 'TARGET_1_HIT' and current_price > fibo_state['target2_price']:
-                    fibo_state['status'] = 'COMPLETED'
-                    db_manager.upsert_fibo_state(fibo_state)
-                    fibo_state = None
-        
-        # Create new state if needed
-        if not fibo_state or fibo_state['status'] in ['INVALIDATED', 'COMPLETED']:
-            high_point = df['high'].max()
-            low_point = df['low'].min()
-            price_range = high_point - low_point
-            
-            if price_range <= 0:
-                return None
-                
-            new_state = {
-                'token_address': token_address,
-                'timeframe': timeframe_str,
-                'high_point': float(high_point),
-                'low_point': float(low_point),
-                'target1_price': float(high_point + (price_range * 0.272)),
-                'target2_price': float(high_point + (price_range * 0.618)),
-                'status': 'ACTIVE'
-            }
-            db_manager.upsert_fibo_state(new_state)
-            return new_state
-            
+        fibo_state, state_to_save = next_fibonacci_state(
+            db_manager.get_fibo_state(token_address, timeframe_str), df, token_address, timeframe_str
+        )
+        if state_to_save:
+            db_manager.upsert_fibo_state(state_to_save)
         return fibo_state
 
     def calculate_rsi(self, prices, period=14):
@@ -287,8 +282,16 @@ class AnalysisEngine:
         rsi = 100 - (100 / (1 + rs))
         return rsi
 
-    async def get_historical_data(self, pool_id, timeframe="hour", aggregate="1", limit=200):
-        """Get historical OHLCV data for analysis"""
+    async def get_historical_data(self, pool_id, timeframe="hour", aggregate="1", limit=200, context=None, on_network=None):
+        """Get historical OHLCV data for analysis (با context از کندل‌های همین اسکن توکن؛ on_network() فقط قبل از درخواست API صدا زده می‌شود)"""
+        if context is not None:
+            return await context.candles(timeframe, aggregate, limit)
+
+        cache_key = f"ohlcv:{pool_id}:{timeframe}:{aggregate}:{limit}"
+        cached_df = await shared_cache.get(cache_key)
+        if cached_df is not None:
+            return cached_df
+
         network, pool_address = pool_id.split('_')
         url = f"https://api.geckoterminal.com/api/v2/networks/{network}/pools/{pool_address}/ohlcv/{timeframe}"
 
@@ -297,6 +300,8 @@ class AnalysisEngine:
             'limit': str(limit)
         }
 
+        if on_network:
+            on_network()
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(url, params=params)
@@ -318,13 +323,13 @@ class AnalysisEngine:
 
                     df = pd.DataFrame(df_data)
                     if not df.empty:
-                        df = df.sort_values('timestamp').reset_index(drop=True)
-
-                        if len(df) >= 50:
-                            df['ema_50'] = df['close'].ewm(span=50, adjust=False).mean()
-                        if len(df) >= 200:
-                            df['ema_200'] = df['close'].ewm(span=200, adjust=False).mean()
+                        df = with_indicators(df.sort_values('timestamp').reset_index(drop=True))
+                        if Config.RECORD_CANDLES:
+                            candle_store.save(pool_id, timeframe, aggregate, df)
 
+                        await shared_cache.set(
+                            cache_key, df, candle_ttl(timeframe, aggregate, Config.CACHE_OHLCV_MAX_TTL)
+                        )
                         return df
         except Exception as e:
             print(f"Error fetching historical data: {e}")
@@ -427,6 +432,8 @@ class AnalysisEngine:
         
         zones = []
         avg_volume = df['volume'].mean()
+        closes = df['close'].values
+        volumes = df['volume'].values
         
         # بررسی Swing Highs
         for idx in high_points:
@@ -436,21 +443,16 @@ class AnalysisEngine:
                 
             level_price = highs[idx]
             
-            # شمارش تعداد برخورد
-            touches = 0
-            reactions = []
-            
-            for i in range(len(df)):
-                if abs(df['high'].iloc[i] - level_price) / level_price < 0.005:
-                    touches += 1
-                    if i + 5 < len(df):
-                        reaction = abs(df['close'].iloc[i+5] - level_price) / avg_atr
-                        reactions.append(reaction)
+            # شمارش تعداد برخورد (برداری روی همه کندل‌ها)
+            touched = np.flatnonzero(np.abs(highs - level_price) / level_price < 0.005)
+            touches = len(touched)
+            touched = touched[touched + 5 < len(df)]
+            reactions = list(np.abs(closes[touched + 5] - level_price) / avg_atr)
             
             min_touches = 1 if len(df) < 100 else 2
             if touches >= min_touches:
                 score = self._calculate_zone_score(
-                    touches, reactions, df['volume'].iloc[idx], 
+                    touches, reactions, volumes[idx], 
                     avg_volume, 'resistance'
                 )
                 
@@ -468,19 +470,14 @@ class AnalysisEngine:
                 continue
                 
             level_price = lows[idx]
-            touches = 0
-            reactions = []
-            
-            for i in range(len(df)):
-                if abs(df['low'].iloc[i] - level_price) / level_price < 0.005:
-                    touches += 1
-                    if i + 5 < len(df):
-                        reaction = abs(df['close'].iloc[i+5] - level_price) / avg_atr
-                        reactions.append(reaction)
+            touched = np.flatnonzero(np.abs(lows - level_price) / level_price < 0.005)
+            touches = len(touched)
+            touched = touched[touched + 5 < len(df)]
+            reactions = list(np.abs(closes[touched + 5] - level_price) / avg_atr)
             
             if touches >= 2:
                 score = self._calculate_zone_score(
-                    touches, reactions, df['volume'].iloc[idx],
+                    touches, reactions, volumes[idx],
                     avg_volume, 'support'
                 )
                 
@@ -969,6 +966,25 @@ class AnalysisEngine:
             ax.plot([start_dt, end_dt], [start_price, end_price], 
                     'o', color='#FF9500', markersize=4, alpha=0.9)
 
+    async def get_chart_bytes(self, analysis_result):
+        """PNG چارت یک نتیجه تحلیل؛ از کش مشترک اگر worker دیگری همین تحلیل را رسم کرده باشد"""
+        if not analysis_result:
+            return None
+        metadata = analysis_result['metadata']
+        cache_key = f"chart:{metadata['pool_id']}:{metadata['timeframe']}:{metadata['aggregate']}:{metadata['timestamp']}"
+        chart_bytes = await shared_cache.get(cache_key)
+        if chart_bytes is not None:
+            return chart_bytes
+        chart_image = await self.create_chart(analysis_result)
+        if not chart_image:
+            return None
+        chart_bytes = chart_image.getvalue()
+        await shared_cache.set(
+            cache_key, chart_bytes,
+            candle_ttl(metadata['timeframe'], metadata['aggregate'], Config.CACHE_ANALYSIS_MAX_TTL)
+        )
+        return chart_bytes
+
     async def create_chart(self, analysis_result):
         """Create candlestick chart from pre-analyzed data"""
         if not analysis_result:
@@ -1,11 +1,26 @@
 import asyncio
+import io
 import logging
 import time
-from token_health import TokenHealthChecker
-from datetime import datetime
+from token_health import TokenHealthChecker, UNHEALTHY_STATUSES
+from datetime import datetime, timedelta
 from token_cache import TokenCache
+from zone_trigger import ZoneTriggerIndex
+from alert_delivery import AlertDeliveryQueue
+from scanner_cluster import ScannerCluster
+from watchlist_manager import WatchlistManager
+from scan_metrics import (
+    STAGE_SECONDS, CYCLE_SECONDS, TOKENS_TOTAL, SKIPS_TOTAL, CYCLES_TOTAL, LAST_CYCLE_TOKENS,
+    TIME_TO_FIRST_CYCLE, TIME_TO_FIRST_SIGNAL
+)
+from scanner_snapshot import ScannerSnapshotter, restore_state, restore_shared_cache
+from shared_cache import shared_cache
+from scan_scheduler import ScanScheduler, nearest_zone_distance, recent_volatility
+from scan_context import ScanContext
+from candle_stream import StreamingScanner, create_candle_source
 from strategy_engine import StrategyEngine
 from telegram import Bot
+from telegram.error import NetworkError, RetryAfter
 from config import Config
 from database_manager import db_manager
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -18,14 +33,106 @@ class BackgroundScanner:
         self.chat_id = chat_id
         self.scan_interval = scan_interval
         self.running = False
+        # stop() این event را set می‌کند تا انتظارهای حلقه اسکن فوراً بیدار شوند
+        self._stop_event = asyncio.Event()
         self.logger = logging.getLogger(__name__)
         self.last_scan_time = None
         self.scan_count = 0
         self.health_checker = TokenHealthChecker()
         self.last_error = None
+        self.scheduler = ScanScheduler()
+        self.zone_trigger = ZoneTriggerIndex()
+        self.watchlist_manager = WatchlistManager()
+        self.delivery_queue = AlertDeliveryQueue(self.send_signal_alert)
+        # در حالت sharding هر worker فقط سهم خودش از توکن‌ها را اسکن می‌کند
+        self.cluster = ScannerCluster() if Config.SCANNER_SHARDING else None
+        self.snapshotter = self._create_snapshotter()
+        # توکن‌های چرخه جاری که هنوز اسکن نشده‌اند (موقعیت اسکن برای snapshot)
+        self.pending_addresses = []
+        self.start_mode = 'cold'
+        self.started_at = None
+        self.time_to_first_cycle = None
+        self.time_to_first_signal = None
+        # حالت stream: توکن‌هایی که منبع لحظه‌ای پوشش می‌دهد روی رویدادها بررسی می‌شوند، بقیه poll
+        source = create_candle_source() if Config.SCANNER_FEED_MODE == 'stream' else None
+        self.stream = StreamingScanner(self, source) if source else None
 
-    async def send_signal_alert(self, signal):
-       """یک هشدار سیگنال را بر اساس نوع آن به تلگرام ارسال می‌کند."""
+    def _create_snapshotter(self):
+        """snapshot هر worker در فایل خودش؛ workerهای یک host/volume وضعیت یکدیگر را بازیابی نمی‌کنند"""
+        if not Config.SNAPSHOT_PATH:
+            return None
+        if not self.cluster:
+            return ScannerSnapshotter()
+        if not Config.SCANNER_WORKER_ID:
+            # شناسه پیش‌فرض (host-pid) با هر ری‌استارت عوض می‌شود و snapshot آن هرگز بازیابی نمی‌شد
+            self.logger.warning("⚠️ Scanner snapshots disabled: sharding needs a stable SCANNER_WORKER_ID")
+            return None
+        return ScannerSnapshotter(f"{Config.SNAPSHOT_PATH}.{self.cluster.worker_id}")
+
+    def status(self):
+        """خلاصه وضعیت اسکنر برای /scanner-status و جدول service_state"""
+        return {
+            "running": self.running,
+            "scan_count": self.scan_count,
+            "last_scan_time": self.last_scan_time,
+            "last_error": self.last_error,
+            "scheduler": self.scheduler.stats(),
+            "zone_trigger": self.zone_trigger.stats(),
+            "delivery_queue_depth": len(self.delivery_queue),
+            "watchlist": self.watchlist_manager.last_report,
+            "worker_id": self.cluster.worker_id if self.cluster else None,
+            "start_mode": self.start_mode,
+            "time_to_first_cycle": self.time_to_first_cycle,
+            "time_to_first_signal": self.time_to_first_signal,
+            "stream": self.stream.stats() if self.stream else None,
+        }
+
+    async def restore_snapshot(self):
+        """
+        warm start از snapshot: وضعیت کوچک (scheduler، zone trigger، موقعیت اسکن) فوراً بازیابی می‌شود
+        و کش کندل/تحلیل در پس‌زمینه، همزمان با دریافت اولیه توکن‌ها، بارگذاری می‌شود.
+        """
+        if not self.snapshotter:
+            return None
+        snapshot = self.snapshotter.open()
+        if snapshot is None:
+            return None
+        try:
+            tokens = restore_state(self, snapshot)
+        except Exception as e:
+            self.logger.error(f"❌ Error restoring scanner snapshot: {e}")
+            return None
+        self.start_mode = 'warm'
+        self.logger.info(f"♻️ Warm start from {snapshot.age:.0f}s old snapshot: {tokens} scheduled tokens, {len(self.zone_trigger)} indexed")
+
+        async def load_cache():
+            try:
+                await asyncio.to_thread(snapshot.section, 'shared_cache')
+                self.logger.info(f"♻️ Restored {restore_shared_cache(shared_cache, snapshot)} cache entries from snapshot")
+            except Exception as e:
+                self.logger.error(f"❌ Error restoring cache snapshot: {e}")
+
+        return asyncio.create_task(load_cache())
+
+    def rebalance_watchlist(self):
+        """امتیازدهی مجدد watchlist بعد از دریافت ترندها (ارتقای توکن‌های تازه، تنزل و حذف توکن‌های سرد)"""
+        try:
+            self.watchlist_manager.rebalance()
+        except Exception as e:
+            self.logger.error(f"❌ Error rebalancing watchlist: {e}")
+
+    async def save_snapshot(self):
+        if not self.snapshotter:
+            return
+        try:
+            sections = self.snapshotter.collect(self, shared_cache)
+            await asyncio.to_thread(self.snapshotter.save, sections)
+        except Exception as e:
+            self.logger.error(f"❌ Error saving scanner snapshot: {e}")
+
+    async def send_signal_alert(self, signal, chat_id=None):
+       """یک هشدار سیگنال را بر اساس نوع آن به تلگرام ارسال می‌کند. RetryAfter و خطاهای شبکه برای تلاش مجدد صف بالا می‌روند."""
+       chat_id = chat_id or self.chat_id
        try:
            signal_type = signal.get('signal_type', '')
            zone_tier = signal.get('zone_tier', '')
@@ -36,6 +143,7 @@ class BackgroundScanner:
            token_address = signal.get('token_address')
            analysis_result = signal.get('analysis_result')
            current_price = signal.get('current_price', 0)
+           holder_info_text = ""
 
            # ساخت پیام بر اساس نوع سیگنال
            if signal_type.startswith('GEM_'):
@@ -131,11 +239,14 @@ class BackgroundScanner:
                    f"Time: `{signal.get('timestamp', '')}`"
                )
 
-           # ساخت چارت
-           chart_image = None
-           if analysis_result:
+           # ساخت چارت (یک بار؛ در تلاش‌های مجدد از بایت‌های ذخیره شده استفاده می‌شود)
+           chart_bytes = signal.get('chart_bytes')
+           if chart_bytes is None and analysis_result:
                self.logger.info(f"🎨 Creating chart for {symbol}...")
-               chart_image = await self.strategy_engine.analysis_engine.create_chart(analysis_result)
+               with STAGE_SECONDS.time('chart_render'):
+                   chart_bytes = await self.strategy_engine.analysis_engine.get_chart_bytes(analysis_result)
+               chart_bytes = signal['chart_bytes'] = chart_bytes or b""
+           chart_image = io.BytesIO(chart_bytes) if chart_bytes else None
 
            # دریافت message_id قبلی برای reply
            placeholder = "%s" if db_manager.is_postgres else "?"
@@ -144,6 +255,7 @@ class BackgroundScanner:
            reply_to_message_id = result.get('last_message_id') if result and result.get('last_message_id') else None
 
            # ارسال پیام
+           send_started = time.perf_counter()
            try:
                if chart_image:
                    try:
@@ -163,7 +275,7 @@ class BackgroundScanner:
                            reply_markup = None
                        sent_message = await asyncio.wait_for(
                            self.bot.send_photo(
-                               chat_id=self.chat_id, 
+                               chat_id=chat_id, 
                                photo=chart_image, 
                                caption=message,
                                parse_mode='Markdown', 
@@ -177,7 +289,7 @@ class BackgroundScanner:
                        # اگر چارت timeout شد، پیام متنی بفرست
                        sent_message = await asyncio.wait_for(
                            self.bot.send_message(
-                               chat_id=self.chat_id, 
+                               chat_id=chat_id, 
                                text=message, 
                                parse_mode='Markdown',
                                reply_to_message_id=reply_to_message_id
@@ -188,7 +300,7 @@ class BackgroundScanner:
                else:
                    sent_message = await asyncio.wait_for(
                        self.bot.send_message(
-                           chat_id=self.chat_id, 
+                           chat_id=chat_id, 
                            text=message, 
                            parse_mode='Markdown',
                            reply_to_message_id=reply_to_message_id
@@ -200,13 +312,19 @@ class BackgroundScanner:
                # آپدیت message_id در دیتابیس
                if sent_message:
                    update_query = f"UPDATE watchlist_tokens SET last_message_id = {placeholder} WHERE address = {placeholder}"
-                   db_manager.execute(update_query, (sent_message.message_id, token_address))
+                   db_manager.execute_deferred(update_query, (sent_message.message_id, token_address))
                    
            except asyncio.TimeoutError:
                self.logger.error(f"⏱️ Telegram timeout for {symbol} - skipping")
+           except (RetryAfter, NetworkError):
+               raise
            except Exception as e:
                self.logger.error(f"❌ Error sending alert for {symbol}: {e}")
+           finally:
+               STAGE_SECONDS.observe(time.perf_counter() - send_started, 'telegram_send')
 
+       except (RetryAfter, NetworkError):
+           raise
        except Exception as e:
            self.logger.error(f"❌ Error sending Telegram alert for {signal.get('symbol', 'N/A')}: {e}", exc_info=True)
 
@@ -215,6 +333,7 @@ class BackgroundScanner:
         self.last_scan_time = datetime.now().isoformat()
         self.scan_count += 1
         self.logger.info(f"🔍 [SCAN #{self.scan_count}] Starting scan...")
+        cycle_started = time.perf_counter()
 
         # *** منطق نهایی و اصلاح شده برای حل کامل مشکل حجم ***
         
@@ -222,7 +341,9 @@ class BackgroundScanner:
         trending_data = {t['address']: t for t in self.token_cache.get_trending_tokens(limit=50)}
         
         # 2. لیست کامل watchlist را دریافت می‌کنیم
-        watchlist_tokens = self.token_cache.get_watchlist_tokens(limit=150)
+        watchlist_tokens = self.token_cache.get_watchlist_tokens(limit=Config.WATCHLIST_HOT_SIZE)
+        # توکن‌های ناسالمی که زمان re-check آن‌ها رسیده (برای بازگشت احتمالی به active)
+        watchlist_tokens += self.token_cache.get_health_recheck_tokens()
         
         # 3. یک لیست نهایی برای اسکن آماده می‌کنیم
         unique_tokens = []
@@ -244,141 +365,321 @@ class BackgroundScanner:
                 unique_tokens.append(token)
                 seen_addresses.add(address)
         
-        self.logger.info(f"📊 Scanning {len(unique_tokens)} unique tokens...")
+        # 5.5. در حالت sharding فقط توکن‌های متعلق به این worker
+        if self.cluster:
+            await self.cluster.refresh()
+            unique_tokens = [t for t in unique_tokens if self.cluster.owns(t['address'])]
+
+        # 5.6. در حالت stream توکن‌هایی که منبع لحظه‌ای پوشش می‌دهد از poll خارج می‌شوند
+        if self.stream:
+            await self.stream.sync(unique_tokens)
+            unique_tokens = [t for t in unique_tokens if not self.stream.tracks(t['pool_id'])]
+
+        # 6. فقط توکن‌هایی که در زمان‌بندی سررسید شده‌اند، به ترتیب سررسید
+        tokens_by_address = {token['address']: token for token in unique_tokens}
+        self.scheduler.sync(tokens_by_address)
+        due_tokens = [tokens_by_address[address] for address in self.scheduler.pop_due()]
+        self.pending_addresses = [token['address'] for token in due_tokens]
+
+        self.logger.info(f"📊 Scanning {len(due_tokens)} due tokens out of {len(unique_tokens)} unique tokens...")
+
+        # 7. قیمت لحظه‌ای همه توکن‌های سررسید با چند درخواست سبک برای zone trigger
+        snapshot_prices = await self.token_cache.fetch_token_prices([t['address'] for t in due_tokens]) if due_tokens else {}
+        # 8. verdictهای سلامت کش شده با یک کوئری
+        health_verdicts = self.token_cache.get_health_verdicts([t['address'] for t in due_tokens])
+        for token in due_tokens:
+            token['snapshot_price'] = snapshot_prices.get(token['address'])
+            token['health_verdict'] = health_verdicts.get(token['address'])
+        LAST_CYCLE_TOKENS.set(len(due_tokens))
         signals_found = 0
-                    
-        for token in unique_tokens:
-            # Health Check قبل از اسکن
+
+        # نوشتن‌های هر توکن در بافر جمع و بعد از اسکن آن به صورت گروهی flush می‌شوند
+        with db_manager.write_batch() as write_buffer:
+            for token in due_tokens:
+                if not self.running:
+                    # توکن‌های باقی‌مانده در pending_addresses برای snapshot می‌مانند
+                    break
+                if self.cluster and not await self.cluster.acquire_lease(token['address'], Config.SCANNER_LEASE_TTL):
+                    self.logger.info(f"🔒 {token['symbol']} is leased by another worker - skipped")
+                    self.pending_addresses.remove(token['address'])
+                    # بعد از انقضای lease دوباره تلاش می‌شود (اگر worker دیگر از کار افتاده باشد)
+                    self.scheduler.reschedule(token['address'], Config.SCANNER_LEASE_TTL)
+                    continue
+                fetched = False
+                try:
+                    signalled, fetched = await self.scan_token(token)
+                    if signalled:
+                        signals_found += 1
+                finally:
+                    self.pending_addresses.remove(token['address'])
+                    try:
+                        # نوشتن‌های هر توکن قبل از توکن بعدی (و قبل از آزاد شدن lease) ثبت می‌شوند
+                        # تا zone_states و alert_history کهنه خوانده نشوند
+                        write_buffer.flush()
+                    finally:
+                        if self.cluster:
+                            await self.cluster.release_lease(token['address'])
+                # مکث فقط بعد از توکن‌هایی که کندل از API گرفته‌اند (نه کش یا skip قبل از دریافت)
+                if fetched:
+                    await self._sleep(5.0)
+        
+        CYCLE_SECONDS.observe(time.perf_counter() - cycle_started)
+        CYCLES_TOTAL.inc()
+        if self.time_to_first_cycle is None:
+            self.time_to_first_cycle = round(time.monotonic() - self.started_at, 1)
+            TIME_TO_FIRST_CYCLE.set(self.time_to_first_cycle, self.start_mode)
+        self.logger.info(
+            f"📊 Scan #{self.scan_count} complete. {signals_found} new signals found. "
+            f"DB: {write_buffer.total_writes} writes in {write_buffer.flush_count} flushes. "
+            f"Zone trigger: {self.zone_trigger.stats()}"
+        )
+
+    async def scan_token(self, token):
+        """اسکن یک توکن و زمان‌بندی اسکن بعدی آن. (ارسال سیگنال، دریافت کندل از API) را برمی‌گرداند."""
+        observation = {'volume_24h': token.get('volume_24h')}
+        signalled = await self._scan_token(token, observation)
+        skip_reason = observation.pop('skip_reason', None)
+        fetched = observation.pop('candle_fetches', 0) > 0
+        TOKENS_TOTAL.inc('scanned')
+        if skip_reason:
+            TOKENS_TOTAL.inc('skipped')
+            SKIPS_TOTAL.inc(skip_reason)
+        if signalled:
+            TOKENS_TOTAL.inc('signalled')
+        interval = self.scheduler.record(token['address'], signalled=signalled, **observation)
+        self.logger.debug(f"🗓️ Next scan for {token.get('symbol')} in {interval}s")
+        return signalled, fetched
+
+    def remember_pool_age(self, token, age_hours):
+        """ثبت زمان ساخت تخمینی pool (از probe کندل‌ها) تا اسکن‌های بعدی بدون probe انجام شوند"""
+        if age_hours is not None and not token.get('pool_created_at'):
+            token['pool_created_at'] = datetime.now() - timedelta(hours=age_hours)
+            self.token_cache.save_pool_created_at(token['address'], token['pool_created_at'])
+
+    async def _scan_token(self, token, observation, context=None):
+        """اسکن یک توکن: health check، انتخاب تایم‌فریم، تحلیل و ارسال سیگنال. ویژگی‌های لازم برای زمان‌بندی در observation ثبت می‌شوند."""
+        # کندل‌های دریافت شده در این اسکن بین health check، انتخاب تایم‌فریم، استراتژی‌ها و تحلیل مشترک‌اند
+        # (در حالت stream، context با کندل‌های بافر از قبل پر شده است)
+        context = context or ScanContext(token, self.strategy_engine.analysis_engine)
+        try:
+            return await self._scan_token_with_context(token, observation, context)
+        finally:
+            observation['candle_fetches'] = sum(context.network_fetches.values())
+            repeated = context.repeated_fetches()
+            if repeated:
+                self.logger.warning(f"⚠️ {token.get('symbol')} candles fetched more than once this scan: {repeated}")
+
+    async def _scan_token_with_context(self, token, observation, context):
+        # Health Check قبل از اسکن (از کش تا زمان re-check)
+        verdict = token.get('health_verdict')
+        context.health_verdict = verdict
+        if self.health_checker.is_fresh(verdict):
+            if verdict['status'] in UNHEALTHY_STATUSES:
+                self.logger.info(f"🚫 Skipping {token['symbol']} - cached {verdict['status'].upper()} until {verdict['next_health_check']:%H:%M}")
+                observation['unhealthy'] = True
+                observation['skip_reason'] = f"cached_{verdict['status']}"
+                return False
+        else:
             try:
                 # دریافت داده‌های قیمت برای health check
-                quick_df = await self.strategy_engine.analysis_engine.get_historical_data(
-                    token['pool_id'], "hour", "1", limit=100
-                )
+                with STAGE_SECONDS.time('health_fetch'):
+                    quick_df = await self.strategy_engine.analysis_engine.get_historical_data(
+                        token['pool_id'], "hour", "1", limit=100, context=context
+                    )
+                    health_result = None
+                    if quick_df is not None and not quick_df.empty:
+                        health_result = await self.health_checker.check_token_health(token, context=context)
+                        context.health_result = health_result
                                
-                if quick_df is not None and not quick_df.empty:
-                    health_result = await self.health_checker.check_token_health(token, quick_df)
+                if health_result:
+                    observation['volatility'] = recent_volatility(quick_df)
+                    if not token.get('snapshot_price'):
+                        token['snapshot_price'] = float(quick_df['close'].iloc[-1])
+
+                    # ثبت verdict جدید (وضعیت توکن هم همراه آن به‌روز می‌شود)
+                    verdict = context.health_verdict = self.health_checker.build_verdict(health_result, verdict)
+                    self.token_cache.save_health_verdict(token['address'], verdict)
                                        
                     # *** منطق جدید و اصلاح شده برای رد کردن توکن‌های ناسالم ***
-                    if health_result['status'] in ['rugged', 'warning']:
+                    if health_result['status'] in UNHEALTHY_STATUSES:
                         status_msg = health_result['status'].upper()
-                        self.logger.warning(f"🚫 Skipping {token['symbol']} - Status: {status_msg} (Score: {health_result['health_score']:.0f})")
-                        
-                        # آپدیت دیتابیس با وضعیت جدید
-                        placeholder = "%s" if db_manager.is_postgres else "?"
-                        db_manager.execute(
-                            f"UPDATE watchlist_tokens SET status = {placeholder}, health_score = {placeholder}, last_health_check = {placeholder} WHERE address = {placeholder}",
-                            (health_result['status'], health_result['health_score'], datetime.now().isoformat(), token['address'])
+                        self.logger.warning(
+                            f"🚫 Skipping {token['symbol']} - Status: {status_msg} (Score: {health_result['health_score']:.0f}, "
+                            f"re-check in {(verdict['next_health_check'] - verdict['last_health_check']).total_seconds():.0f}s)"
                         )
-                        continue # برای هر دو وضعیت rugged و warning از تحلیل صرف نظر کن
+                        observation['unhealthy'] = True
+                        observation['skip_reason'] = health_result['status']
+                        return False # برای هر دو وضعیت rugged و warning از تحلیل صرف نظر کن
                                            
             except Exception as e:
                 self.logger.error(f"Health check error for {token['symbol']}: {e}")
                 # در صورت خطا، به تحلیل ادامه می‌دهیم تا ربات متوقف نشود
 
-            signal = None
-            try:
-                timeframe_result = await self.strategy_engine.select_optimal_timeframe(token['pool_id'])
-                    
-                if timeframe_result[0]:
-                    timeframe_data, cached_df = timeframe_result
-                    timeframe, aggregate = timeframe_data
-                    
-                    if cached_df is not None and not cached_df.empty and 'timestamp' in cached_df.columns:
-                        first_ts = cached_df['timestamp'].iloc[0]
-                        last_ts = cached_df['timestamp'].iloc[-1]
-                        age_hours = (last_ts - first_ts) / 3600
-                        age_days = age_hours / 24
-                    else:
-                        age_hours = len(cached_df) if cached_df is not None else 0
-                        age_days = age_hours / 24
-                    
-                    if age_days < 5:
-                        self.logger.info(f"💎 [GEM HUNTER] Routing {token['symbol']} (Age: {age_days:.2f} days / {age_hours:.1f} hours)")
+        signal = None
+        try:
+            # عمر از زمان ساخت pool ثبت شده؛ probe کندل‌ها فقط یک بار برای poolهای بدون آن
+            with STAGE_SECONDS.time('timeframe_selection'):
+                timeframe_data, age_hours = await self.strategy_engine.select_optimal_timeframe(
+                    token['pool_id'], token.get('pool_created_at'), context=context
+                )
+            self.remember_pool_age(token, age_hours)
+
+            if timeframe_data:
+                timeframe, aggregate = timeframe_data
+                age_days = age_hours / 24 if age_hours is not None else None
+                if age_days is not None:
+                    observation['age_days'] = age_days
+                
+                if age_days is not None and age_days < 5:
+                    self.logger.info(f"💎 [GEM HUNTER] Routing {token['symbol']} (Age: {age_days:.2f} days / {age_hours:.1f} hours)")
+                    with STAGE_SECONDS.time('analysis'):
                         df_gem = await self.strategy_engine.analysis_engine.get_historical_data(
-                            token['pool_id'], timeframe, aggregate, limit=300
+                            token['pool_id'], timeframe, aggregate, limit=300, context=context
                         )
-                        if df_gem is not None and not df_gem.empty and len(df_gem) >= 12:
-                            signal = await self.strategy_engine.detect_gem_momentum_signal(df_gem, token, timeframe, aggregate)
-                        else:
-                            self.logger.info(f"⏳ {token['symbol']} is too new, waiting for more 5m data...")
+                    if df_gem is not None and not df_gem.empty and len(df_gem) >= 12:
+                        with STAGE_SECONDS.time('signal_detection'):
+                            signal = await self.strategy_engine.detect_gem_momentum_signal(df_gem, token, timeframe, aggregate, context=context)
                     else:
-                        self.logger.info(f"📈 [SMART] Routing {token['symbol']} (Age: {age_days:.1f} days) → {aggregate}{timeframe[0].upper()}")
+                        self.logger.info(f"⏳ {token['symbol']} is too new, waiting for more 5m data...")
+                else:
+                    # تحلیل کامل فقط وقتی قیمت وارد ناحیه جدیدی نسبت به سطوح شده یا سطوح کهنه‌اند
+                    snapshot_price = token.get('snapshot_price')
+                    needs_analysis, reason = self.zone_trigger.should_analyze(token['address'], snapshot_price)
+                    if not needs_analysis:
+                        observation['zone_distance'] = self.zone_trigger.nearest_distance(token['address'], snapshot_price)
+                        self.logger.info(f"💤 [SMART] {token['symbol']} quiet near indexed levels - analysis skipped")
+                        observation['skip_reason'] = 'quiet'
+                        return False
+
+                    self.logger.info(f"📈 [SMART] Routing {token['symbol']} (Age: {f'{age_days:.1f} days' if age_days is not None else 'unknown'}, Trigger: {reason}) → {aggregate}{timeframe[0].upper()}")
+                    with STAGE_SECONDS.time('analysis'):
                         analysis_result = await self.strategy_engine.analysis_engine.perform_full_analysis(
-                            token['pool_id'], token['address'], timeframe, aggregate, token['symbol']
+                            token['pool_id'], token['address'], timeframe, aggregate, token['symbol'], context=context
                         )
-                        if analysis_result:
+                    self.zone_trigger.update(token['address'], analysis_result)
+                    if analysis_result:
+                        observation['zone_distance'] = nearest_zone_distance(analysis_result)
+                        with STAGE_SECONDS.time('signal_detection'):
                             signal = await self.strategy_engine.detect_breakout_signal(analysis_result, token["address"])
                             
                             # اگر سیگنال breakout نبود، pullback/retest را چک کن
                             if not signal:
                                 signal = await self.strategy_engine.detect_pullback_retest_signal(analysis_result, token["address"])
-                
-                if signal:
-                    self.logger.info(f"📍 Signal detected - Type: {signal.get('signal_type')}, Symbol: {signal.get('symbol')}, Tier: {signal.get('zone_tier', 'N/A')}")
-                    is_recent = await self.strategy_engine.has_recent_alert(signal)
-                    if not is_recent:
-                        signals_found += 1
-                        await self.strategy_engine.save_alert(signal)
-                        await self.send_signal_alert(signal)
-                        self.logger.info(f"✅ Signal for {signal['symbol']} ({signal.get('signal_type')}) processed and sent.")
-                    else:
-                        self.logger.info(f"🔵 Cooldown active for {signal['symbol']}. Signal skipped.")
+            
+            if signal:
+                self.logger.info(f"📍 Signal detected - Type: {signal.get('signal_type')}, Symbol: {signal.get('symbol')}, Tier: {signal.get('zone_tier', 'N/A')}")
+                is_recent = await self.strategy_engine.has_recent_alert(signal)
+                if not is_recent and self.cluster and not await self.cluster.claim_alert(signal):
+                    # worker دیگری همین هشدار را ارسال کرده و هنوز در دیتابیس ثبت نشده
+                    is_recent = True
+                if not is_recent:
+                    await self.strategy_engine.save_alert(signal)
+                    self.delivery_queue.enqueue(signal, self.chat_id)
+                    if self.time_to_first_signal is None:
+                        self.time_to_first_signal = round(time.monotonic() - self.started_at, 1)
+                        TIME_TO_FIRST_SIGNAL.set(self.time_to_first_signal, self.start_mode)
+                        self.logger.info(f"⏱️ First signal {self.time_to_first_signal}s after {self.start_mode} start")
+                    self.logger.info(f"✅ Signal for {signal['symbol']} ({signal.get('signal_type')}) processed and queued.")
+                    return True
+                else:
+                    self.logger.info(f"🔵 Cooldown active for {signal['symbol']}. Signal skipped.")
 
-            except Exception as e:
-                self.last_error = str(e)
-                self.logger.error(f"❌ Error scanning {token.get('symbol', 'Unknown')}: {e}", exc_info=True)
-    
-            await asyncio.sleep(5.0)
-        
-        self.logger.info(f"📊 Scan #{self.scan_count} complete. {signals_found} new signals found.")
+        except Exception as e:
+            self.last_error = str(e)
+            self.logger.error(f"❌ Error scanning {token.get('symbol', 'Unknown')}: {e}", exc_info=True)
+
+        return False
+
+    def stop(self):
+        """توقف اسکنر؛ انتظار جاری بیدار می‌شود و start_scanning بعد از توکن جاری پاکسازی می‌کند"""
+        self.running = False
+        self._stop_event.set()
+
+    async def _sleep(self, seconds):
+        """انتظاری که با stop() زودتر تمام می‌شود"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
 
     async def start_scanning(self):
         """اسکن مداوم پس‌زمینه را آغاز می‌کند."""
         self.running = True
+        self._stop_event.clear()
+        self.started_at = time.monotonic()
         last_fetch_time = 0
         FETCH_INTERVAL = 600  # 10 دقیقه = 600 ثانیه
         
         self.logger.info(f"🚀 Background scanner started (Interval: {self.scan_interval}s, Token refresh: {FETCH_INTERVAL}s).")
 
-        # Initial fetch برای شروع سریع‌تر
+        if self.cluster:
+            await self.cluster.start()
+
+        # پاکسازی در finally تا با لغو task (مثلاً timeout توقف) هم انجام شود
         try:
-            initial_tokens = await self.token_cache.fetch_trending_tokens()
-            if initial_tokens:
-                self.logger.info(f"✅ Initial token list with {len(initial_tokens)} tokens fetched and saved.")
-                last_fetch_time = time.time()
-            else:
-                self.logger.warning("Initial token list could not be fetched.")
-        except Exception as e:
-            self.logger.error(f"❌ Error fetching initial token list: {e}")
+            # ارسال هشدارها در worker جداگانه تا اسکن منتظر تلگرام نماند
+            self.delivery_task = asyncio.create_task(self.delivery_queue.run())
+            if self.stream:
+                self.stream_task = asyncio.create_task(self.stream.run())
+            self.snapshot_restore_task = await self.restore_snapshot()
 
-        while self.running:
+            # Initial fetch برای شروع سریع‌تر
             try:
-                current_time = time.time()
-                
-                # هر 10 دقیقه توکن‌های جدید را دریافت کن
-                if current_time - last_fetch_time >= FETCH_INTERVAL:
-                    self.logger.info("🔄 Fetching latest trending tokens from API...")
-                    try:
-                        new_tokens = await self.token_cache.fetch_trending_tokens()
-                        if new_tokens:
-                            self.logger.info(f"✅ Updated token list with {len(new_tokens)} tokens.")
-                            last_fetch_time = current_time
-                        else:
-                            self.logger.warning("⚠️ Could not fetch new tokens, using existing list.")
-                    except Exception as e:
-                        self.logger.error(f"❌ Error fetching new tokens: {e}")
+                initial_tokens = await self.token_cache.fetch_trending_tokens()
+                if initial_tokens:
+                    self.logger.info(f"✅ Initial token list with {len(initial_tokens)} tokens fetched and saved.")
+                    last_fetch_time = time.time()
+                    self.rebalance_watchlist()
+                else:
+                    self.logger.warning("Initial token list could not be fetched.")
+            except Exception as e:
+                self.logger.error(f"❌ Error fetching initial token list: {e}")
+
+            while self.running:
+                try:
+                    current_time = time.time()
                 
-                # اسکن توکن‌ها با داده‌های به‌روز
-                await self.scan_tokens()
-                self.logger.info(f"⏳ Waiting {self.scan_interval} seconds for the next scan...")
-                await asyncio.sleep(self.scan_interval)
+                    # هر 10 دقیقه توکن‌های جدید را دریافت کن
+                    # در حالت sharding فقط یک worker در هر بازه لیست ترند را می‌گیرد
+                    if current_time - last_fetch_time >= FETCH_INTERVAL and self.cluster and not await self.cluster.try_lock("trending_fetch", FETCH_INTERVAL):
+                        last_fetch_time = current_time
+                    if current_time - last_fetch_time >= FETCH_INTERVAL:
+                        self.logger.info("🔄 Fetching latest trending tokens from API...")
+                        try:
+                            new_tokens = await self.token_cache.fetch_trending_tokens()
+                            if new_tokens:
+                                self.logger.info(f"✅ Updated token list with {len(new_tokens)} tokens.")
+                                last_fetch_time = current_time
+                                self.rebalance_watchlist()
+                            else:
+                                self.logger.warning("⚠️ Could not fetch new tokens, using existing list.")
+                        except Exception as e:
+                            self.logger.error(f"❌ Error fetching new tokens: {e}")
                 
-            except KeyboardInterrupt:
-                self.running = False
-            except Exception as e:
-                self.last_error = str(e)
-                self.logger.critical(f"❌ CRITICAL SCANNER ERROR: {e}", exc_info=True)
-                self.logger.info("⏳ Waiting 60 seconds due to critical error...")
-                await asyncio.sleep(60)
+                    # اسکن توکن‌ها با داده‌های به‌روز
+                    await self.scan_tokens()
+                    if self.snapshotter and self.snapshotter.due():
+                        await self.save_snapshot()
 
-        self.logger.info("\n🛑 Scanner stopped.")
+                    # تا سررسید بعدی صبر کن (حداکثر scan_interval تا لیست توکن‌ها هم تازه بماند)
+                    next_due = self.scheduler.next_due_in()
+                    wait = self.scan_interval if next_due is None else min(self.scan_interval, max(next_due, 5))
+                    self.logger.info(f"⏳ Waiting {wait:.0f} seconds for the next scan... Scheduler: {self.scheduler.stats()}")
+                    await self._sleep(wait)
+                
+                except KeyboardInterrupt:
+                    self.running = False
+                except Exception as e:
+                    self.last_error = str(e)
+                    self.logger.critical(f"❌ CRITICAL SCANNER ERROR: {e}", exc_info=True)
+                    self.logger.info("⏳ Waiting 60 seconds due to critical error...")
+                    await self._sleep(60)
+        finally:
+            self.running = False
+            await self.delivery_queue.stop()
+            if self.stream:
+                await self.stream.stop()
+            await self.save_snapshot()
+            if self.cluster:
+                await self.cluster.stop()
+            self.logger.info("\n🛑 Scanner stopped.")
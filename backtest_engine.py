@@ -0,0 +1,424 @@
+# backtest_engine.py
+"""
+Backtest استراتژی‌های اسکنر روی کندل‌های ذخیره شده در جدول candles.
+
+    python -m backtest_engine record --timeframe minute --aggregate 5 --days 30
+    python -m backtest_engine run --timeframe minute --aggregate 5 --output backtest_report.csv
+
+هر توکن در یک پروسه جدا replay می‌شود: zoneها با همان analyze_frame تحلیل زنده، ماشین حالت
+zoneها با evaluate_zone_transitions و cooldownها با cooldown_rule؛ بازده آینده هر سیگنال در
+چند افق (تعداد کندل) محاسبه و نرخ موفقیت به تفکیک استراتژی و نوع سیگنال گزارش می‌شود.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from config import Config
+from candle_store import candle_store, OHLCV
+from database_manager import db_manager
+from analysis_engine import next_fibonacci_state
+from strategy_engine import (
+    StrategyEngine, evaluate_zone_transitions, signal_priorities, cooldown_rule,
+    gem_signal_frame, pullback_retest_levels
+)
+from zone_config import (
+    TIER1_APPROACH_THRESHOLD, TIER1_BREAKOUT_THRESHOLD,
+    TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD,
+    ZONE_BUCKET_WIDTH, RESET_DISTANCE, zone_bucket
+)
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('breakout', 'pullback', 'gem')
+# افق‌های بازده آینده (تعداد کندل؛ برای 5 دقیقه‌ای 1 ساعت، 4 ساعت و 1 روز)
+DEFAULT_HORIZONS = (12, 48, 288)
+# سیگنال‌هایی که با ریزش قیمت درست محسوب می‌شوند
+BEARISH_SIGNALS = {'support_breakdown', 'approaching_resistance'}
+# طول پنجره تحلیل (همان limit در _do_full_analysis) و حداقل کندل هر تایم‌فریم
+ANALYSIS_WINDOW = 500
+MIN_CANDLES = {'minute': 30, 'hour': 20, 'day': 7}
+
+
+class ZoneStateBook:
+    """جایگزین درون حافظه جدول zone_states برای یک توکن با همان قاعده تطبیق bucket مجاور"""
+
+    def __init__(self):
+        # zone_bucket -> (zone_price, current_state)
+        self._rows = {}
+
+    def match(self, zone_price):
+        """(bucket، ردیف) نزدیک‌ترین ردیف منطبق یا None"""
+        bucket = zone_bucket(zone_price)
+        best = None
+        for candidate in (bucket - 1, bucket, bucket + 1):
+            row = self._rows.get(candidate)
+            if row is None or abs(zone_price - row[0]) / row[0] >= ZONE_BUCKET_WIDTH:
+                continue
+            if best is None or abs(zone_price - row[0]) < abs(zone_price - best[1][0]):
+                best = (candidate, row)
+        return best
+
+    def write(self, bucket, zone_price, state):
+        self._rows[bucket] = (zone_price, state)
+
+
+def important_zones(analysis_result):
+    """[(tier، قیمت zone)] zoneهای Tier 1/2 به همان ترتیب detect_breakout_signals"""
+    zones = analysis_result['technical_levels']['zones']
+    result = []
+    for tier, key in (('TIER1', 'tier1_critical'), ('TIER2', 'tier2_major')):
+        for zone in zones.get(key, []):
+            zone_price = zone.get('level_price', zone.get('zone_bottom', 0))
+            if zone_price > 0:
+                result.append((tier, float(zone_price)))
+    return result
+
+
+def zone_timeline(analysis_engine, df, pool_id, timeframe, aggregate, analysis_every=12):
+    """
+    zoneهای مهم در طول تاریخچه: هر analysis_every کندل یک تحلیل کامل روی ANALYSIS_WINDOW کندل
+    اخیر (همراه با پیشرفت state فیبوناچی). خروجی [(شروع، پایان، tierها، قیمت‌ها)] که تا تحلیل
+    بعدی معتبرند؛ گران‌ترین بخش replay و مستقل از آستانه‌های approach/breakout و cooldown.
+    """
+    timeframe_str = f"{timeframe}_{aggregate}"
+    fibo_state = None
+    timeline = []
+    for start in range(MIN_CANDLES.get(timeframe, 7) - 1, len(df), analysis_every):
+        window = df.iloc[max(0, start + 1 - ANALYSIS_WINDOW):start + 1].reset_index(drop=True)
+        fibo_state, _ = next_fibonacci_state(fibo_state, window, pool_id, timeframe_str)
+        # analyze_frame برای توکن‌های جدید print می‌کند
+        with contextlib.redirect_stdout(io.StringIO()):
+            analysis = analysis_engine.analyze_frame(window, fibo_state, pool_id, pool_id, timeframe, aggregate)
+        zones = important_zones(analysis)
+        if zones:
+            timeline.append((start, min(start + analysis_every, len(df)),
+                             [tier for tier, _ in zones], np.array([price for _, price in zones])))
+    return timeline
+
+
+def _zone_regions(distances, approach, breakout, reset_distance=RESET_DISTANCE):
+    """ناحیه قیمت نسبت به هر zone با همان شرط‌های evaluate_zone_transitions (برای رد کردن کندل‌های بدون تغییر)"""
+    abs_distances = np.abs(distances)
+    broken_up = (distances > breakout) & (distances < reset_distance)
+    broken_down = ~broken_up & (distances < -breakout) & (distances > -reset_distance)
+    near = ~broken_up & ~broken_down & (abs_distances < approach)
+    return np.select(
+        [broken_up, broken_down, near & (distances > 0), near & (distances < 0), abs_distances > reset_distance],
+        [1, 2, 3, 4, 5], default=0
+    )
+
+
+def replay_zone_signals(df, timeline, thresholds=None):
+    """
+    ماشین حالت zoneها روی هر کندل با state درون حافظه؛ مثل detect_breakout_signals فقط zone برنده
+    و بازگشت‌های IDLE ذخیره می‌شوند. کندل‌هایی که ناحیه قیمت هیچ zoneی در آن‌ها تغییر نکرده و
+    کندل قبل state را تغییر نداده بدون ارزیابی رد می‌شوند (نتیجه یکسان است).
+    """
+    thresholds = thresholds or {}
+    tier1_approach = thresholds.get('TIER1_APPROACH_THRESHOLD', TIER1_APPROACH_THRESHOLD)
+    tier1_breakout = thresholds.get('TIER1_BREAKOUT_THRESHOLD', TIER1_BREAKOUT_THRESHOLD)
+    tier2_approach = thresholds.get('TIER2_APPROACH_THRESHOLD', TIER2_APPROACH_THRESHOLD)
+    tier2_breakout = thresholds.get('TIER2_BREAKOUT_THRESHOLD', TIER2_BREAKOUT_THRESHOLD)
+    reset_distance = thresholds.get('RESET_DISTANCE', RESET_DISTANCE)
+
+    close = df['close'].to_numpy(dtype=float)
+    book = ZoneStateBook()
+    signals = []
+    for start, end, tiers, prices in timeline:
+        tier1 = np.array([tier == 'TIER1' for tier in tiers])
+        approach = np.where(tier1, tier1_approach, tier2_approach)
+        breakout = np.where(tier1, tier1_breakout, tier2_breakout)
+        distances = (close[start:end, None] - prices[None, :]) / prices[None, :]
+        regions = _zone_regions(distances, approach, breakout, reset_distance)
+        changes = np.flatnonzero((regions[1:] != regions[:-1]).any(axis=1)) + 1
+
+        matches = [book.match(price) for price in prices]
+        offset = 0
+        while offset < end - start:
+            states = [row[1][1] if row else 'IDLE' for row in matches]
+            new_states, signal_types = evaluate_zone_transitions(distances[offset], approach, breakout, states, reset_distance)
+            priorities = signal_priorities(tiers, signal_types)
+            winner = int(priorities.argmax())
+            changed = False
+            if priorities[winner] >= 0:
+                bucket = matches[winner][0] if matches[winner] else zone_bucket(prices[winner])
+                book.write(bucket, prices[winner], new_states[winner])
+                signals.append({
+                    'strategy': 'breakout',
+                    'signal_type': str(signal_types[winner]),
+                    'index': start + offset,
+                    'zone_tier': tiers[winner],
+                    'zone_price': float(prices[winner]),
+                })
+                changed = True
+            for i, row in enumerate(matches):
+                if row and new_states[i] == 'IDLE' and states[i] != 'IDLE':
+                    book.write(row[0], row[1][0], 'IDLE')
+                    changed = True
+
+            if changed:
+                matches = [book.match(price) for price in prices]
+                # zoneهای بازنده همچنان شرط سیگنال دارند و کندل بعد دوباره ارزیابی می‌شوند
+                offset += 1
+            else:
+                following = changes[changes > offset]
+                offset = int(following[0]) if len(following) else end - start
+    return signals
+
+
+def pullback_signals(df):
+    levels = pullback_retest_levels(df)
+    return [{'strategy': 'pullback', 'signal_type': 'PULLBACK_RETEST_CONFIRMED', 'index': int(i), 'zone_price': float(levels[i])}
+            for i in np.flatnonzero(~np.isnan(levels))]
+
+
+def gem_signals(df):
+    # تحلیل زنده بدون ema_50 (کمتر از 50 کندل) اجرا نمی‌شود
+    frame = gem_signal_frame(df)
+    hits = np.flatnonzero((frame['signal_type'] != '').to_numpy() & (np.arange(len(df)) >= 49))
+    return [{'strategy': 'gem', 'signal_type': frame['signal_type'].iat[i], 'index': int(i)} for i in hits]
+
+
+def apply_cooldowns(strategy_engine, signals, df, token_address):
+    """فیلتر اطمینان و cooldown هشدار زنده با زمان کندل‌ها؛ ستون alerted سیگنال‌های ارسال شدنی را مشخص می‌کند"""
+    close = df['close'].to_numpy(dtype=float)
+    timestamps = df['timestamp'].to_numpy()
+    last_alerts = {}
+    for signal in sorted(signals, key=lambda s: s['index']):
+        signal['token_address'] = token_address
+        signal['symbol'] = token_address
+        signal['current_price'] = price = float(close[signal['index']])
+        signal['timestamp'] = int(timestamps[signal['index']])
+        signal['alerted'] = False
+        if not strategy_engine._is_signal_confident(signal):
+            continue
+        threshold, min_hours = cooldown_rule(signal['signal_type'])
+        last = last_alerts.get(signal['signal_type'])
+        if last and last[0] > 0 and price > 0:
+            if abs(price - last[0]) / last[0] < threshold and (signal['timestamp'] - last[1]) / 3600 < min_hours:
+                continue
+        last_alerts[signal['signal_type']] = (price, signal['timestamp'])
+        signal['alerted'] = True
+    return signals
+
+
+def forward_returns(df, signals, horizons=DEFAULT_HORIZONS):
+    """DataFrame سیگنال‌ها با بازده آینده هر افق و بیشترین حرکت موافق/مخالف تا طولانی‌ترین افق (هم‌جهت با سیگنال)"""
+    frame = pd.DataFrame(signals)
+    if frame.empty:
+        return frame
+    close = df['close'].to_numpy(dtype=float)
+    index = frame['index'].to_numpy()
+    direction = np.where(frame['signal_type'].isin(BEARISH_SIGNALS), -1.0, 1.0)
+    frame['direction'] = direction
+    for horizon in horizons:
+        target = index + horizon
+        valid = target < len(close)
+        returns = np.full(len(index), np.nan)
+        returns[valid] = close[target[valid]] / close[index[valid]] - 1
+        frame[f'return_{horizon}'] = returns * direction
+
+    longest = max(horizons)
+    # بیشترین high و کمترین low در longest کندل بعد از هر کندل
+    future_high = pd.Series(df['high'].to_numpy()[::-1]).rolling(longest, min_periods=1).max().to_numpy()[::-1]
+    future_low = pd.Series(df['low'].to_numpy()[::-1]).rolling(longest, min_periods=1).min().to_numpy()[::-1]
+    future_high = np.append(future_high[1:], np.nan)
+    future_low = np.append(future_low[1:], np.nan)
+    max_up = future_high[index] / close[index] - 1
+    max_down = future_low[index] / close[index] - 1
+    frame['max_favorable'] = np.where(direction > 0, max_up, -max_down)
+    frame['max_adverse'] = np.where(direction > 0, max_down, -max_up)
+    return frame
+
+
+def replay_pool(strategy_engine, df, pool_id, timeframe, aggregate, analysis_every=12,
+                horizons=DEFAULT_HORIZONS, strategies=STRATEGIES, timeline=None, thresholds=None):
+    """همه سیگنال‌های یک pool با وضعیت alerted و بازده آینده"""
+    if df is None or len(df) < MIN_CANDLES.get(timeframe, 7):
+        return pd.DataFrame()
+    signals = []
+    if 'breakout' in strategies:
+        if timeline is None:
+            timeline = zone_timeline(strategy_engine.analysis_engine, df, pool_id, timeframe, aggregate, analysis_every)
+        signals += replay_zone_signals(df, timeline, thresholds)
+    if 'pullback' in strategies:
+        signals += pullback_signals(df)
+    if 'gem' in strategies:
+        signals += gem_signals(df)
+    frame = forward_returns(df, apply_cooldowns(strategy_engine, signals, df, pool_id), horizons)
+    if not frame.empty:
+        frame.insert(0, 'pool_id', pool_id)
+    return frame
+
+
+_strategy_engine = None
+
+
+def _init_worker():
+    global _strategy_engine
+    # لاگ‌های INFO هر رد شدن سیگنال در replay فقط سربار است
+    logging.getLogger().setLevel(logging.WARNING)
+    _strategy_engine = StrategyEngine()
+
+
+def backtest_pool(pool_id, timeframe, aggregate, since=None, until=None, analysis_every=12,
+                  horizons=DEFAULT_HORIZONS, strategies=STRATEGIES):
+    """اجرای backtest یک pool در پروسه worker (کندل‌ها در همان پروسه خوانده می‌شوند)"""
+    if _strategy_engine is None:
+        _init_worker()
+    df = candle_store.load(pool_id, timeframe, aggregate, since, until)
+    return replay_pool(_strategy_engine, df, pool_id, timeframe, aggregate, analysis_every, horizons, strategies)
+
+
+def run_backtest(pools, timeframe, aggregate, since=None, until=None, analysis_every=12,
+                 horizons=DEFAULT_HORIZONS, strategies=STRATEGIES, workers=None):
+    """replay موازی poolها روی همه هسته‌ها؛ DataFrame همه سیگنال‌ها"""
+    workers = workers or os.cpu_count() or 1
+    args = (timeframe, aggregate, since, until, analysis_every, tuple(horizons), tuple(strategies))
+    frames = []
+    started = time.perf_counter()
+    if workers == 1:
+        for pool_id in pools:
+            frames.append(backtest_pool(pool_id, *args))
+    else:
+        # spawn تا workerها کانکشن‌های دیتابیس پروسه اصلی را به ارث نبرند
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+            futures = {executor.submit(backtest_pool, pool_id, *args): pool_id for pool_id in pools}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    frames.append(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Backtest failed for {futures[future]}: {e}")
+                if done % 50 == 0:
+                    logger.info(f"⏳ Backtested {done}/{len(pools)} pools")
+    logger.info(f"✅ Backtested {len(pools)} pools in {time.perf_counter() - started:.1f}s")
+    frames = [frame for frame in frames if not frame.empty]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def hit_rate_report(signals, horizons=DEFAULT_HORIZONS):
+    """
+    نرخ موفقیت (بازده هم‌جهت با سیگنال مثبت) و میانگین بازده هر افق به تفکیک استراتژی و نوع
+    سیگنال، برای همه سیگنال‌ها و فقط سیگنال‌های عبور کرده از فیلتر اطمینان و cooldown.
+    """
+    if signals.empty:
+        return pd.DataFrame()
+    rows = []
+    groups = [(strategy, '*', frame) for strategy, frame in signals.groupby('strategy')]
+    groups += [(strategy, signal_type, frame) for (strategy, signal_type), frame in signals.groupby(['strategy', 'signal_type'])]
+    for strategy, signal_type, frame in groups:
+        alerted = frame[frame['alerted']]
+        row = {'strategy': strategy, 'signal_type': signal_type, 'signals': len(frame),
+               'alerted': len(alerted), 'pools': frame['pool_id'].nunique()}
+        for horizon in horizons:
+            column = f'return_{horizon}'
+            row[f'hit_rate_{horizon}'] = (frame[column].dropna() > 0).mean()
+            row[f'avg_return_{horizon}'] = frame[column].mean()
+            row[f'alerted_hit_rate_{horizon}'] = (alerted[column].dropna() > 0).mean() if len(alerted) else np.nan
+        row['avg_max_favorable'] = frame['max_favorable'].mean()
+        row['avg_max_adverse'] = frame['max_adverse'].mean()
+        rows.append(row)
+    return pd.DataFrame(rows).sort_values(['strategy', 'signal_type']).reset_index(drop=True)
+
+
+async def fetch_history(client, pool_id, timeframe, aggregate, days):
+    """دریافت تاریخچه کندل‌های یک pool از GeckoTerminal به صفحه‌های 1000 تایی (با before_timestamp) و ذخیره آن"""
+    network, pool_address = pool_id.split('_')
+    url = f"https://api.geckoterminal.com/api/v2/networks/{network}/pools/{pool_address}/ohlcv/{timeframe}"
+    before = int(time.time())
+    cutoff = before - days * 86400
+    delay = 60 / Config.GECKOTERMINAL_RATE_LIMIT
+    saved = 0
+    while before > cutoff:
+        response = await client.get(url, params={'aggregate': aggregate, 'limit': '1000', 'before_timestamp': str(before)})
+        await asyncio.sleep(delay)
+        if response.status_code == 429:
+            await asyncio.sleep(60)
+            continue
+        if response.status_code != 200:
+            logger.warning(f"⚠️ OHLCV request for {pool_id} failed with {response.status_code}")
+            break
+        ohlcv_list = response.json().get('data', {}).get('attributes', {}).get('ohlcv_list', [])
+        if not ohlcv_list:
+            break
+        df = pd.DataFrame(ohlcv_list, columns=['timestamp'] + OHLCV)
+        candle_store.save(pool_id, timeframe, aggregate, df)
+        saved += len(df)
+        oldest = int(df['timestamp'].min())
+        if oldest >= before:
+            break
+        before = oldest
+    return saved
+
+
+async def record_history(pools, timeframe, aggregate, days):
+    async with httpx.AsyncClient(timeout=30) as client:
+        for i, pool_id in enumerate(pools, 1):
+            try:
+                saved = await fetch_history(client, pool_id, timeframe, aggregate, days)
+                logger.info(f"📥 [{i}/{len(pools)}] {pool_id}: {saved} candles")
+            except Exception as e:
+                logger.error(f"❌ Error recording {pool_id}: {e}")
+
+
+def watchlist_pools():
+    rows = db_manager.fetchall(
+        "SELECT DISTINCT pool_id FROM watchlist_tokens WHERE pool_id IS NOT NULL AND pool_id != ''"
+    )
+    return [row['pool_id'] for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest the scanner strategies on stored candles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    record = subparsers.add_parser('record', help="download candle history for watchlist pools")
+    run = subparsers.add_parser('run', help="replay stored candles and report hit rates")
+    for sub in (record, run):
+        sub.add_argument('--timeframe', default='minute')
+        sub.add_argument('--aggregate', default='5')
+        sub.add_argument('--pools', nargs='*', help="pool ids (default: watchlist for record, all stored for run)")
+    record.add_argument('--days', type=int, default=30)
+    run.add_argument('--since', type=int, help="unix timestamp of the first candle")
+    run.add_argument('--until', type=int, help="unix timestamp of the last candle")
+    run.add_argument('--analysis-every', type=int, default=12, help="candles between full zone analyses")
+    run.add_argument('--horizons', default=",".join(map(str, DEFAULT_HORIZONS)), help="forward return horizons in candles")
+    run.add_argument('--strategies', default=",".join(STRATEGIES))
+    run.add_argument('--workers', type=int, default=None)
+    run.add_argument('--output', default='backtest_report.csv')
+    run.add_argument('--signals-output', help="optional CSV with every replayed signal")
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        asyncio.run(record_history(args.pools or watchlist_pools(), args.timeframe, args.aggregate, args.days))
+        return
+
+    pools = args.pools or [pool_id for pool_id, _ in candle_store.pools(args.timeframe, args.aggregate, MIN_CANDLES.get(args.timeframe, 7))]
+    horizons = tuple(int(h) for h in args.horizons.split(','))
+    signals = run_backtest(pools, args.timeframe, args.aggregate, args.since, args.until, args.analysis_every,
+                           horizons, tuple(args.strategies.split(',')), args.workers)
+    report = hit_rate_report(signals, horizons)
+    if args.signals_output and not signals.empty:
+        signals.to_csv(args.signals_output, index=False)
+    if report.empty:
+        logger.info("No signals produced")
+        return
+    report.to_csv(args.output, index=False)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(report.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    logger.info(f"📊 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
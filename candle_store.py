@@ -0,0 +1,90 @@
+# candle_store.py
+import pandas as pd
+from database_manager import db_manager
+
+COLUMNS = ['pool_id', 'timeframe', 'aggregate', 'timestamp', 'open', 'high', 'low', 'close', 'volume']
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+
+def with_indicators(df):
+    """EMAهای 50 و 200 با همان شرط طول get_historical_data"""
+    if len(df) >= 50:
+        df['ema_50'] = df['close'].ewm(span=50, adjust=False).mean()
+    if len(df) >= 200:
+        df['ema_200'] = df['close'].ewm(span=200, adjust=False).mean()
+    return df
+
+
+class CandleStore:
+    """تاریخچه کندل‌های هر pool در جدول candles؛ ورودی backtest_engine و param_sweep"""
+
+    def __init__(self):
+        self.ensure_table()
+
+    def ensure_table(self):
+        try:
+            db_manager.execute('''
+                CREATE TABLE IF NOT EXISTS candles (
+                    pool_id TEXT NOT NULL,
+                    timeframe TEXT NOT NULL,
+                    aggregate TEXT NOT NULL,
+                    timestamp BIGINT NOT NULL,
+                    open DOUBLE PRECISION,
+                    high DOUBLE PRECISION,
+                    low DOUBLE PRECISION,
+                    close DOUBLE PRECISION,
+                    volume DOUBLE PRECISION,
+                    PRIMARY KEY (pool_id, timeframe, aggregate, timestamp)
+                )
+            ''')
+        except Exception as e:
+            print(f"❌ Error creating candles table: {e}")
+
+    def save(self, pool_id, timeframe, aggregate, df):
+        """ذخیره کندل‌های یک DataFrame (کندل باز آخر در ذخیره بعدی بازنویسی می‌شود)"""
+        if df is None or df.empty:
+            return 0
+        rows = [
+            (pool_id, timeframe, str(aggregate), int(timestamp), float(o), float(h), float(l), float(c), float(v))
+            for timestamp, o, h, l, c, v in df[['timestamp'] + OHLCV].itertuples(index=False)
+        ]
+        return db_manager.bulk_upsert('candles', COLUMNS, rows,
+                                      conflict_columns=COLUMNS[:4], update_columns=OHLCV)
+
+    def load(self, pool_id, timeframe, aggregate, since=None, until=None):
+        """کندل‌های ذخیره شده به ترتیب زمان با ستون‌های get_historical_data"""
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        query = f"""
+            SELECT timestamp, open, high, low, close, volume FROM candles
+            WHERE pool_id = {placeholder} AND timeframe = {placeholder} AND aggregate = {placeholder}
+        """
+        params = [pool_id, timeframe, str(aggregate)]
+        if since is not None:
+            query += f" AND timestamp >= {placeholder}"
+            params.append(int(since))
+        if until is not None:
+            query += f" AND timestamp <= {placeholder}"
+            params.append(int(until))
+        rows = db_manager.fetchall(query + " ORDER BY timestamp", tuple(params))
+        df = pd.DataFrame([dict(row) for row in rows], columns=['timestamp'] + OHLCV)
+        if df.empty:
+            return df
+        df['timestamp'] = df['timestamp'].astype('int64')
+        df[OHLCV] = df[OHLCV].astype(float)
+        return with_indicators(df)
+
+    def pools(self, timeframe, aggregate, min_candles=1):
+        """[(pool_id, تعداد کندل)] poolهایی که حداقل min_candles کندل دارند"""
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        query = f"""
+            SELECT pool_id, COUNT(*) AS candle_count FROM candles
+            WHERE timeframe = {placeholder} AND aggregate = {placeholder}
+            GROUP BY pool_id
+            HAVING COUNT(*) >= {placeholder}
+            ORDER BY pool_id
+        """
+        rows = db_manager.fetchall(query, (timeframe, str(aggregate), int(min_candles)))
+        return [(row['pool_id'], row['candle_count']) for row in rows]
+
+
+candle_store = CandleStore()
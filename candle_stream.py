@@ -0,0 +1,476 @@
+# candle_stream.py
+"""
+حالت stream اسکنر: یک منبع لحظه‌ای (WebSocket یا شبیه‌ساز درون پروسه) معاملات/کندل‌ها را به بافر
+کندل هر توکن می‌دهد و بررسی سیگنال به جای چرخه poll روی بسته شدن هر کندل، یا تیکی که نزدیک یک
+سطح ایندکس شده در zone trigger است، اجرا می‌شود.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import json
+import logging
+import time
+from collections import deque, namedtuple
+
+import pandas as pd
+
+from candle_store import OHLCV, with_indicators
+from config import Config
+from database_manager import db_manager
+from scan_context import ScanContext
+from scan_metrics import STREAM_UPDATES, STREAM_EVALUATIONS, STREAM_SIGNAL_SECONDS
+from shared_cache import TIMEFRAME_SECONDS
+from strategy_engine import pool_age_hours, timeframe_for_age
+
+logger = logging.getLogger(__name__)
+
+# یک معامله (timestamp به ثانیه epoch)
+Trade = namedtuple('Trade', 'pool_id timestamp price volume')
+# کندل (بسته یا در حال تشکیل) از منبع‌هایی که به جای معامله کندل می‌فرستند
+Candle = namedtuple('Candle', 'pool_id timestamp open high low close volume')
+
+
+def candle_trades(pool_id, df, timeframe, aggregate):
+    """معاملات مصنوعی از کندل‌ها (open، سقف/کف به ترتیب جهت کندل، close) برای replay تاریخچه candle_store"""
+    period = TIMEFRAME_SECONDS[timeframe] * int(aggregate)
+    trades = []
+    for timestamp, o, h, l, c, v in df[['timestamp'] + OHLCV].itertuples(index=False):
+        path = (o, l, h, c) if c >= o else (o, h, l, c)
+        for i, price in enumerate(path):
+            trades.append(Trade(pool_id, int(timestamp) + period * i / len(path), float(price), float(v) / len(path)))
+    return trades
+
+
+def parse_feed_message(message):
+    """
+    پیام پیش‌فرض feed به Trade/Candle: یک dict یا لیستی از آن‌ها با pool_id و timestamp (ثانیه یا میلی‌ثانیه)
+    و price/volume برای معامله یا open/high/low/close/volume برای کندل.
+    """
+    updates = []
+    for item in message if isinstance(message, list) else [message]:
+        if not isinstance(item, dict) or 'pool_id' not in item or 'timestamp' not in item:
+            continue
+        timestamp = float(item['timestamp'])
+        if timestamp > 1e12:
+            timestamp /= 1000
+        volume = float(item.get('volume') or 0)
+        if 'close' in item:
+            updates.append(Candle(item['pool_id'], timestamp, float(item['open']), float(item['high']),
+                                  float(item['low']), float(item['close']), volume))
+        elif 'price' in item:
+            updates.append(Trade(item['pool_id'], timestamp, float(item['price']), volume))
+    return updates
+
+
+class CandleBuffer:
+    """کندل‌های یک pool در یک تایم‌فریم (آخرین کندل در حال تشکیل) با ستون‌های get_historical_data"""
+
+    def __init__(self, timeframe, aggregate, maxlen=ScanContext.FETCH_LIMIT):
+        self.timeframe = timeframe
+        self.aggregate = str(aggregate)
+        self.period = TIMEFRAME_SECONDS[timeframe] * int(aggregate)
+        # [timestamp, open, high, low, close, volume]
+        self.rows = deque(maxlen=maxlen)
+        # پایان آخرین کندلی که بسته شدنش گزارش شده
+        self.closed_until = 0
+        self._frame = None
+
+    def seed(self, df):
+        """تاریخچه از API؛ آخرین کندل همان کندل جاری در حال تشکیل است"""
+        self.rows.clear()
+        for row in df[['timestamp'] + OHLCV].itertuples(index=False):
+            self.rows.append([int(row[0])] + [float(value) for value in row[1:]])
+        self.closed_until = self.rows[-1][0] if self.rows else 0
+        self._frame = None
+
+    @property
+    def last_price(self):
+        return self.rows[-1][4] if self.rows else None
+
+    def apply(self, update):
+        """
+        اعمال Trade یا Candle. True اگر کندل قبلی با آن بسته شد، False در غیر این صورت
+        و None برای به‌روزرسانی قدیمی‌تر از کندل جاری (نادیده گرفته می‌شود).
+        """
+        start = int(update.timestamp // self.period * self.period)
+        last = self.rows[-1] if self.rows else None
+        if last is not None and start < last[0]:
+            return None
+        self._frame = None
+
+        if isinstance(update, Candle):
+            values = [float(update.open), float(update.high), float(update.low), float(update.close), float(update.volume)]
+            if last is not None and start == last[0]:
+                last[1:] = values
+            else:
+                self.rows.append([start] + values)
+        elif last is not None and start == last[0]:
+            last[2] = max(last[2], update.price)
+            last[3] = min(last[3], update.price)
+            last[4] = update.price
+            last[5] += update.volume
+        else:
+            self.rows.append([start, update.price, update.price, update.price, update.price, update.volume])
+
+        if last is not None and start > last[0] and last[0] + self.period > self.closed_until:
+            self.closed_until = last[0] + self.period
+            return True
+        return False
+
+    def close_due(self, now):
+        """بسته شدن کندل جاری با گذشت زمان (بدون معامله جدید)؛ هر کندل فقط یک بار True"""
+        if not self.rows:
+            return False
+        end = self.rows[-1][0] + self.period
+        if now >= end > self.closed_until:
+            self.closed_until = end
+            return True
+        return False
+
+    def frame(self):
+        if self._frame is None:
+            df = pd.DataFrame(list(self.rows), columns=['timestamp'] + OHLCV)
+            df['timestamp'] = df['timestamp'].astype('int64')
+            self._frame = with_indicators(df)
+        return self._frame
+
+
+class CandleSource(ABC):
+    """رابط منبع لحظه‌ای: subscribe روی poolها و updates() که Trade/Candle برمی‌گرداند"""
+
+    @abstractmethod
+    async def subscribe(self, pool_ids):
+        """شروع دریافت به‌روزرسانی‌های این poolها"""
+
+    async def unsubscribe(self, pool_ids):
+        pass
+
+    @abstractmethod
+    def updates(self):
+        """async iterator از Trade/Candle تا بسته شدن منبع"""
+
+    def now(self):
+        """ساعت منبع (epoch) برای تشخیص بسته شدن کندل بدون معامله جدید"""
+        return time.time()
+
+    async def close(self):
+        pass
+
+
+class SimulatedCandleSource(CandleSource):
+    """
+    منبع درون پروسه برای اجرای آفلاین کل مسیر: به‌روزرسانی‌های داده شده به ترتیب زمان و (با follow)
+    سپس هرچه با push اضافه شود. ساعت منبع زمان آخرین رویداد است؛ speed ضریب شتاب پخش (None = بدون انتظار).
+    """
+
+    def __init__(self, updates=(), speed=None, follow=False):
+        self._scripted = sorted(updates, key=lambda update: update.timestamp)
+        self._queue = asyncio.Queue()
+        self.speed = speed
+        self.follow = follow
+        self.pool_ids = set()
+        self.closed = False
+        self._now = None
+
+    async def subscribe(self, pool_ids):
+        self.pool_ids.update(pool_ids)
+
+    async def unsubscribe(self, pool_ids):
+        self.pool_ids.difference_update(pool_ids)
+
+    def push(self, update):
+        self._queue.put_nowait(update)
+
+    async def updates(self):
+        for update in self._scripted:
+            if self.closed:
+                return
+            if update.pool_id not in self.pool_ids:
+                continue
+            if self.speed and self._now is not None:
+                await asyncio.sleep(max(update.timestamp - self._now, 0) / self.speed)
+            else:
+                # نوبت به taskهای دیگر (بررسی بسته شدن کندل، توقف) هم برسد
+                await asyncio.sleep(0)
+            self._now = update.timestamp
+            yield update
+        while self.follow and not self.closed:
+            update = await self._queue.get()
+            if update is None:
+                return
+            if update.pool_id in self.pool_ids:
+                self._now = update.timestamp
+                yield update
+
+    def now(self):
+        return time.time() if self._now is None else self._now
+
+    async def close(self):
+        self.closed = True
+        self._queue.put_nowait(None)
+
+
+class WebSocketCandleSource(CandleSource):
+    """
+    منبع WebSocket (aiohttp). پیام subscribe/unsubscribe و تبدیل پیام‌ها (parse_feed_message) قابل تعویض‌اند
+    تا با provider دلخواه کار کند. بعد از قطع اتصال با تاخیر دوباره وصل و همه poolها subscribe می‌شوند.
+    """
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self, url, subscribe_message=None, unsubscribe_message=None, parse=None):
+        self.url = url
+        self.subscribe_message = subscribe_message or (lambda pool_ids: {"type": "subscribe", "pools": pool_ids})
+        self.unsubscribe_message = unsubscribe_message or (lambda pool_ids: {"type": "unsubscribe", "pools": pool_ids})
+        self.parse = parse or parse_feed_message
+        self.pool_ids = set()
+        self.closed = False
+        self._session = None
+        self._ws = None
+
+    def _connected(self):
+        return self._ws is not None and not self._ws.closed
+
+    async def _connect(self):
+        import aiohttp
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        self._ws = await self._session.ws_connect(self.url, heartbeat=30)
+        logger.info(f"🔌 Candle feed connected ({len(self.pool_ids)} pools)")
+        if self.pool_ids:
+            await self._ws.send_json(self.subscribe_message(sorted(self.pool_ids)))
+
+    async def subscribe(self, pool_ids):
+        new = set(pool_ids) - self.pool_ids
+        self.pool_ids |= new
+        if new and self._connected():
+            await self._ws.send_json(self.subscribe_message(sorted(new)))
+
+    async def unsubscribe(self, pool_ids):
+        removed = set(pool_ids) & self.pool_ids
+        self.pool_ids -= removed
+        if removed and self._connected():
+            await self._ws.send_json(self.unsubscribe_message(sorted(removed)))
+
+    async def updates(self):
+        import aiohttp
+        while not self.closed:
+            try:
+                if not self._connected():
+                    await self._connect()
+                async for message in self._ws:
+                    if message.type == aiohttp.WSMsgType.TEXT:
+                        try:
+                            updates = self.parse(json.loads(message.data))
+                        except (ValueError, KeyError, TypeError) as e:
+                            logger.debug(f"Unparsable candle feed message: {e}")
+                            continue
+                        for update in updates:
+                            yield update
+                    elif message.type == aiohttp.WSMsgType.ERROR:
+                        break
+            except Exception as e:
+                logger.warning(f"⚠️ Candle feed connection error: {e}")
+            if not self.closed:
+                await asyncio.sleep(self.RECONNECT_DELAY)
+
+    async def close(self):
+        self.closed = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._session is not None:
+            await self._session.close()
+
+
+def create_candle_source():
+    """منبع حالت stream از تنظیمات (یا None اگر SCANNER_FEED_URL خالی است)"""
+    if not Config.SCANNER_FEED_URL:
+        logger.warning("⚠️ SCANNER_FEED_MODE=stream without SCANNER_FEED_URL - falling back to polling")
+        return None
+    return WebSocketCandleSource(Config.SCANNER_FEED_URL)
+
+
+class StreamingScanner:
+    """
+    اسکن رویدادمحور توکن‌هایی که منبع لحظه‌ای پوشش می‌دهد. health check، انتخاب تایم‌فریم، استراتژی‌ها،
+    cooldown و صف ارسال همان مسیر BackgroundScanner است؛ فقط کندل‌ها از بافر و زمان بررسی از رویدادها می‌آیند.
+    """
+
+    # فاصله بررسی بسته شدن کندل‌هایی که معامله جدید ندارند (ثانیه)
+    CLOSE_CHECK_INTERVAL = 5
+    # حداکثر poolهای جدید که در هر sync تاریخچه‌شان از API گرفته می‌شود (بقیه تا sync بعدی poll می‌شوند)
+    SEEDS_PER_SYNC = 10
+
+    def __init__(self, scanner, source, zone_distance=None, tick_interval=None, stale_after=None):
+        self.scanner = scanner
+        self.source = source
+        self.zone_distance = Config.STREAM_ZONE_DISTANCE if zone_distance is None else zone_distance
+        self.tick_interval = Config.STREAM_TICK_INTERVAL if tick_interval is None else tick_interval
+        self.stale_after = Config.STREAM_STALE_AFTER if stale_after is None else stale_after
+        # pool_id -> token و CandleBuffer
+        self.tokens = {}
+        self.buffers = {}
+        # pool_id -> زمان (monotonic) آخرین رویداد یا subscribe؛ برای بازگشت poolهای ساکت به poll
+        self.last_update = {}
+        # pool_id -> زمان رویداد آخرین بررسی سیگنال
+        self.last_check = {}
+        self.evaluations = 0
+        self.signals = 0
+        self.running = False
+        self._lock = asyncio.Lock()
+
+    def tracks(self, pool_id):
+        """آیا این pool با رویدادهای منبع اسکن می‌شود (subscribe شده و اخیراً رویداد داشته)؟"""
+        last = self.last_update.get(pool_id)
+        return last is not None and time.monotonic() - last < self.stale_after
+
+    def stats(self):
+        return {
+            'tracked': sum(1 for pool_id in self.buffers if self.tracks(pool_id)),
+            'subscribed': len(self.buffers),
+            'evaluations': self.evaluations,
+            'signals': self.signals,
+        }
+
+    async def _seed(self, token):
+        """انتخاب تایم‌فریم و بافر با تاریخچه API (یا None)"""
+        context = ScanContext(token, self.scanner.strategy_engine.analysis_engine)
+        timeframe_data, age_hours = await self.scanner.strategy_engine.select_optimal_timeframe(
+            token['pool_id'], token.get('pool_created_at'), context=context
+        )
+        self.scanner.remember_pool_age(token, age_hours)
+        if not timeframe_data:
+            return None
+        df = await context.candles(*timeframe_data, limit=ScanContext.FETCH_LIMIT)
+        if df is None or df.empty:
+            return None
+        buffer = CandleBuffer(*timeframe_data)
+        buffer.seed(df)
+        return buffer
+
+    async def sync(self, tokens):
+        """subscribe توکن‌های hot set با بافر از تاریخچه API؛ توکن‌های خارج شده unsubscribe می‌شوند"""
+        by_pool = {token['pool_id']: token for token in tokens if token.get('pool_id')}
+        removed = [pool_id for pool_id in self.tokens if pool_id not in by_pool]
+        for pool_id in removed:
+            for state in (self.tokens, self.buffers, self.last_update, self.last_check):
+                state.pop(pool_id, None)
+        if removed:
+            await self.source.unsubscribe(removed)
+
+        seeded = []
+        for pool_id, token in by_pool.items():
+            tracked = self.tokens.get(pool_id)
+            if tracked is not None:
+                # داده‌های تازه ترند، بدون از دست دادن verdict و زمان ساخت ثبت شده
+                tracked.update({key: value for key, value in token.items() if value is not None})
+                buffer = self.buffers[pool_id]
+                age_hours = pool_age_hours(tracked.get('pool_created_at'))
+                if age_hours is None or timeframe_for_age(age_hours) == (buffer.timeframe, buffer.aggregate):
+                    continue
+                token = tracked
+            elif len(seeded) >= self.SEEDS_PER_SYNC:
+                continue
+            try:
+                buffer = await self._seed(token)
+            except Exception as e:
+                logger.error(f"❌ Error seeding candle buffer for {token.get('symbol')}: {e}")
+                continue
+            if buffer is None:
+                continue
+            if pool_id not in self.tokens:
+                seeded.append(pool_id)
+                self.last_update[pool_id] = time.monotonic()
+            self.tokens[pool_id] = token
+            self.buffers[pool_id] = buffer
+
+        if seeded:
+            verdicts = self.scanner.token_cache.get_health_verdicts([self.tokens[pool_id]['address'] for pool_id in seeded])
+            for pool_id in seeded:
+                self.tokens[pool_id]['health_verdict'] = verdicts.get(self.tokens[pool_id]['address'])
+            await self.source.subscribe(seeded)
+            logger.info(f"📡 Streaming {len(seeded)} new pools ({len(self.buffers)} subscribed)")
+
+    def trigger_for(self, pool_id, closed, event_time):
+        """علت بررسی سیگنال برای این رویداد: candle_close، zone_tick (تیک نزدیک سطح ایندکس شده) یا None"""
+        if closed:
+            return 'candle_close'
+        last = self.last_check.get(pool_id)
+        if last is not None and event_time - last < self.tick_interval:
+            return None
+        distance = self.scanner.zone_trigger.nearest_distance(self.tokens[pool_id]['address'], self.buffers[pool_id].last_price)
+        if distance is None or distance > self.zone_distance:
+            return None
+        return 'zone_tick'
+
+    async def on_update(self, update):
+        """اعمال یک رویداد منبع و در صورت نیاز بررسی سیگنال. True اگر سیگنال ارسال شد."""
+        received = time.perf_counter()
+        buffer = self.buffers.get(update.pool_id)
+        if buffer is None:
+            STREAM_UPDATES.inc('untracked')
+            return False
+        self.last_update[update.pool_id] = time.monotonic()
+        closed = buffer.apply(update)
+        if closed is None:
+            STREAM_UPDATES.inc('late')
+            return False
+        STREAM_UPDATES.inc('candle' if isinstance(update, Candle) else 'trade')
+        trigger = self.trigger_for(update.pool_id, closed, update.timestamp)
+        if trigger is None:
+            return False
+        return await self.evaluate(update.pool_id, trigger, update.timestamp, received)
+
+    async def evaluate(self, pool_id, trigger, event_time, received=None):
+        """بررسی سیگنال یک pool با کندل‌های بافر از مسیر اسکن BackgroundScanner"""
+        received = time.perf_counter() if received is None else received
+        token, buffer = self.tokens[pool_id], self.buffers[pool_id]
+        self.last_check[pool_id] = event_time
+        token['snapshot_price'] = buffer.last_price
+        context = ScanContext(token, self.scanner.strategy_engine.analysis_engine)
+        context.seed(buffer.timeframe, buffer.aggregate, buffer.frame())
+        STREAM_EVALUATIONS.inc(trigger)
+        self.evaluations += 1
+
+        async with self._lock:
+            with db_manager.write_batch():
+                signalled = await self.scanner._scan_token(token, {}, context)
+        if context.health_verdict is not None:
+            token['health_verdict'] = context.health_verdict
+        if signalled:
+            self.signals += 1
+            STREAM_SIGNAL_SECONDS.observe(time.perf_counter() - received, trigger)
+        return signalled
+
+    async def _close_loop(self):
+        while self.running:
+            await asyncio.sleep(self.CLOSE_CHECK_INTERVAL)
+            now = self.source.now()
+            for pool_id, buffer in list(self.buffers.items()):
+                if pool_id in self.buffers and buffer.close_due(now):
+                    try:
+                        await self.evaluate(pool_id, 'candle_close', now)
+                    except Exception as e:
+                        logger.error(f"❌ Error evaluating closed candle for {pool_id}: {e}", exc_info=True)
+
+    async def run(self):
+        """مصرف رویدادهای منبع تا stop() یا پایان منبع"""
+        self.running = True
+        closer = asyncio.create_task(self._close_loop())
+        logger.info(f"📡 Streaming scanner started (zone distance: {self.zone_distance:.1%}, tick interval: {self.tick_interval}s)")
+        try:
+            async for update in self.source.updates():
+                if not self.running:
+                    break
+                try:
+                    await self.on_update(update)
+                except Exception as e:
+                    logger.error(f"❌ Error handling stream update for {update.pool_id}: {e}", exc_info=True)
+        finally:
+            self.running = False
+            closer.cancel()
+            await self.source.close()
+        logger.info("🛑 Streaming scanner stopped.")
+
+    async def stop(self):
+        self.running = False
+        await self.source.close()
@@ -17,11 +17,94 @@ class Config:
     # Database Settings
     DATABASE_URL = os.getenv("DATABASE_URL", "tokens.db")
     
+    # SQLite profile: "tuned" (WAL، کانکشن ماندگار، writer سریالی) یا "default" (رفتار قبلی)
+    SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE") or "268435456")  # 256MB
+    SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB") or "65536")  # 64MB
+    SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE") or "256")
+    
     # Scanner Settings - Safely convert to int
     SCAN_INTERVAL = int(os.getenv("SCAN_INTERVAL") or "300")
     TRENDING_TOKENS_LIMIT = int(os.getenv("TRENDING_TOKENS_LIMIT") or "50")
     GECKOTERMINAL_RATE_LIMIT = int(os.getenv("GECKOTERMINAL_RATE_LIMIT") or "30")
     
+    # Retention: افق نگهداری هر جدول (روز) و زمان‌بندی پاکسازی
+    ALERT_RETENTION_DAYS = float(os.getenv("ALERT_RETENTION_DAYS") or "30")
+    ZONE_STATE_RETENTION_DAYS = float(os.getenv("ZONE_STATE_RETENTION_DAYS") or "7")
+    FIBO_RETENTION_DAYS = float(os.getenv("FIBO_RETENTION_DAYS") or "14")
+    RUGGED_RETENTION_DAYS = float(os.getenv("RUGGED_RETENTION_DAYS") or "7")
+    RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL") or "3600")
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE") or "5000")
+    VACUUM_INTERVAL_HOURS = float(os.getenv("VACUUM_INTERVAL_HOURS") or "24")
+    
+    # Write buffer: حداکثر نوشتن‌های صف‌شده در یک چرخه اسکن قبل از flush زودهنگام
+    WRITE_BUFFER_MAX_SIZE = int(os.getenv("WRITE_BUFFER_MAX_SIZE") or "200")
+    
+    # Scan scheduler: بازه اسکن مجدد هر توکن بین این دو مقدار (ثانیه) بر اساس اولویت
+    SCHEDULER_MIN_INTERVAL = int(os.getenv("SCHEDULER_MIN_INTERVAL") or "60")
+    SCHEDULER_MAX_INTERVAL = int(os.getenv("SCHEDULER_MAX_INTERVAL") or "1800")
+    
+    # Zone trigger: حداکثر عمر سطوح ایندکس شده قبل از تحلیل کامل اجباری (ثانیه)
+    ZONE_TRIGGER_MAX_AGE = int(os.getenv("ZONE_TRIGGER_MAX_AGE") or "1800")
+    
+    # Health verdict cache: اعتبار نتیجه سالم و backoff نمایی برای re-check توکن‌های rugged/warning (ثانیه)
+    HEALTH_TTL_HEALTHY = int(os.getenv("HEALTH_TTL_HEALTHY") or "1800")
+    HEALTH_BACKOFF_BASE = int(os.getenv("HEALTH_BACKOFF_BASE") or "900")
+    HEALTH_BACKOFF_MAX = int(os.getenv("HEALTH_BACKOFF_MAX") or "86400")
+    
+    # Alert delivery: فاصله حداقل بین پیام‌ها در یک چت (گروه‌ها ~20 پیام در دقیقه)، سقف کلی پیام در ثانیه و تعداد تلاش مجدد
+    ALERT_CHAT_MIN_INTERVAL = float(os.getenv("ALERT_CHAT_MIN_INTERVAL") or "3.0")
+    ALERT_GLOBAL_RATE = float(os.getenv("ALERT_GLOBAL_RATE") or "25")
+    ALERT_MAX_RETRIES = int(os.getenv("ALERT_MAX_RETRIES") or "5")
+    
+    # Watchlist: اندازه hot set که اسکنر پوشش می‌دهد، سقف کل watchlist (مازاد حذف می‌شود)،
+    # پنجره شمارش سیگنال‌ها (روز) و مدتی که بعد از آن حضور در ترندها دیگر امتیاز ندارد (ساعت)
+    WATCHLIST_HOT_SIZE = int(os.getenv("WATCHLIST_HOT_SIZE") or "150")
+    WATCHLIST_MAX_SIZE = int(os.getenv("WATCHLIST_MAX_SIZE") or "1000")
+    WATCHLIST_SIGNAL_WINDOW_DAYS = int(os.getenv("WATCHLIST_SIGNAL_WINDOW_DAYS") or "7")
+    WATCHLIST_STALE_HOURS = int(os.getenv("WATCHLIST_STALE_HOURS") or "48")
+    
+    # Cooldown ledger: بازه‌ای از alert_history که در حافظه نگه داشته می‌شود (ساعت، بیشتر از طولانی‌ترین cooldown)
+    COOLDOWN_LEDGER_HOURS = int(os.getenv("COOLDOWN_LEDGER_HOURS") or "24")
+    
+    # Scanner mode: "embedded" (اسکنر داخل پروسه وب) یا "standalone" (پروسه جدا با python -m scanner_worker)
+    SCANNER_MODE = os.getenv("SCANNER_MODE", "embedded").lower()
+    SERVICE_STATE_INTERVAL = int(os.getenv("SERVICE_STATE_INTERVAL") or "30")
+    
+    # Warm restart: snapshot کش‌ها و وضعیت اسکنر روی دیسک (برای ماندن بین deployها باید روی volume باشد؛ خالی = غیرفعال)
+    SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "scanner_snapshot.bin")
+    SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL") or "300")
+    SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE") or "3600")
+    
+    # Feed mode: "poll" (اسکن دوره‌ای با زمان‌بندی) یا "stream" (بررسی سیگنال روی بسته شدن کندل و تیک نزدیک zone
+    # از منبع لحظه‌ای SCANNER_FEED_URL؛ توکن‌هایی که منبع پوشش نمی‌دهد همچنان poll می‌شوند)
+    SCANNER_FEED_MODE = os.getenv("SCANNER_FEED_MODE", "poll").lower()
+    SCANNER_FEED_URL = os.getenv("SCANNER_FEED_URL", "")
+    STREAM_ZONE_DISTANCE = float(os.getenv("STREAM_ZONE_DISTANCE") or "0.05")
+    STREAM_TICK_INTERVAL = int(os.getenv("STREAM_TICK_INTERVAL") or "15")
+    STREAM_STALE_AFTER = int(os.getenv("STREAM_STALE_AFTER") or "600")
+    
+    # Backtest: ذخیره کندل‌های دریافتی اسکنر در جدول candles برای replay با backtest_engine
+    RECORD_CANDLES = os.getenv("RECORD_CANDLES", "false").lower() in ("1", "true", "yes")
+    
+    # Scanner sharding: تقسیم watchlist بین چند worker از طریق REDIS_URL
+    SCANNER_SHARDING = os.getenv("SCANNER_SHARDING", "false").lower() in ("1", "true", "yes")
+    SCANNER_WORKER_ID = os.getenv("SCANNER_WORKER_ID", "")
+    SCANNER_HEARTBEAT_TTL = int(os.getenv("SCANNER_HEARTBEAT_TTL") or "30")
+    SCANNER_LEASE_TTL = int(os.getenv("SCANNER_LEASE_TTL") or "300")
+    SCANNER_ALERT_CLAIM_TTL = int(os.getenv("SCANNER_ALERT_CLAIM_TTL") or "900")
+    
+    # Shared cache: "memory" (فقط LRU درون پروسه) یا "redis" (LRU جلوی Redis مشترک بین workerها)
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE") or "512")
+    CACHE_OHLCV_MAX_TTL = int(os.getenv("CACHE_OHLCV_MAX_TTL") or "60")
+    CACHE_ANALYSIS_MAX_TTL = int(os.getenv("CACHE_ANALYSIS_MAX_TTL") or "300")
+    CACHE_POOL_TTL = int(os.getenv("CACHE_POOL_TTL") or "21600")
+    
+    # Subscription: اعتبار کش وضعیت اشتراک و فاصله اجرای sweeper انقضا (ثانیه)
+    SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL") or "300")
+    SUBSCRIPTION_SWEEP_INTERVAL = int(os.getenv("SUBSCRIPTION_SWEEP_INTERVAL") or "600")
+    
     # Admin and AI settings
     ADMIN_IDS_STR = os.getenv("ADMIN_IDS", "")
     ADMIN_IDS = [int(x) for x in ADMIN_IDS_STR.split(",") if x.strip().isdigit()]
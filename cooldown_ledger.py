@@ -0,0 +1,115 @@
+# cooldown_ledger.py
+import logging
+import time
+from datetime import datetime
+from config import Config
+from database_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "dexchart:cooldown"
+
+
+def _epoch(value):
+    """timestamp ستون alert_history (datetime در Postgres، رشته ISO در SQLite) به epoch"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class CooldownLedger:
+    """
+    آخرین هشدار هر (توکن، نوع سیگنال) با قیمت و زمان آن در حافظه، تا تصمیم cooldown بدون
+    کوئری باشد. یک بار از alert_history بارگذاری و با هر save_alert به‌روز می‌شود. در حالت
+    sharding هر رکورد در Redis هم نوشته می‌شود تا workerی که سهم یک توکن را تحویل می‌گیرد
+    هشدارهای worker قبلی را ببیند.
+    """
+
+    # بعد از خطای Redis تا این مدت فقط از ledger محلی استفاده می‌شود
+    REDIS_RETRY_AFTER = 30
+
+    def __init__(self, shared=None, redis_client=None, horizon_hours=None):
+        self.shared = Config.SCANNER_SHARDING if shared is None else shared
+        self.redis = redis_client
+        self.horizon = (horizon_hours or Config.COOLDOWN_LEDGER_HOURS) * 3600
+        # (token_address, signal_type) -> (price, epoch)
+        self._entries = {}
+        self.loaded = False
+        self._redis_disabled_until = 0
+        self._last_prune = time.time()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """بارگذاری آخرین هشدار هر (توکن، نوع سیگنال) در بازه horizon با یک کوئری"""
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        cutoff = datetime.fromtimestamp(time.time() - self.horizon)
+        query = f"""
+            SELECT token_address, signal_type, price_at_alert, timestamp
+            FROM alert_history
+            WHERE timestamp >= {placeholder}
+            ORDER BY timestamp
+        """
+        rows = db_manager.fetchall(query, (cutoff if db_manager.is_postgres else cutoff.isoformat(),))
+        entries = {}
+        for row in rows:
+            if row['timestamp'] and row['signal_type']:
+                entries[(row['token_address'], row['signal_type'])] = (
+                    float(row['price_at_alert'] or 0), _epoch(row['timestamp'])
+                )
+        self._entries = entries
+        self.loaded = True
+        logger.info(f"📒 Cooldown ledger loaded with {len(entries)} entries")
+
+    def _redis_client(self):
+        if not self.shared or time.time() < self._redis_disabled_until:
+            return None
+        if self.redis is None:
+            import redis.asyncio as redis_asyncio
+            self.redis = redis_asyncio.from_url(Config.REDIS_URL, decode_responses=True)
+        return self.redis
+
+    def _redis_failed(self, error):
+        logger.warning(f"⚠️ Cooldown ledger Redis unavailable, using local only for {self.REDIS_RETRY_AFTER}s: {error}")
+        self._redis_disabled_until = time.time() + self.REDIS_RETRY_AFTER
+
+    async def last_alert(self, token_address, signal_type):
+        """(قیمت، epoch) آخرین هشدار یا None"""
+        if not self.loaded:
+            self.load()
+        key = (token_address, signal_type)
+        entry = self._entries.get(key)
+        client = self._redis_client()
+        if client is not None:
+            try:
+                value = await client.get(f"{KEY_PREFIX}:{token_address}:{signal_type}")
+                if value:
+                    price, at = (float(part) for part in value.split("|"))
+                    if entry is None or at > entry[1]:
+                        entry = self._entries[key] = (price, at)
+            except Exception as e:
+                self._redis_failed(e)
+        return entry
+
+    async def record(self, token_address, signal_type, price, at=None):
+        at = time.time() if at is None else at
+        self._entries[(token_address, signal_type)] = (float(price), at)
+        client = self._redis_client()
+        if client is not None:
+            try:
+                await client.set(f"{KEY_PREFIX}:{token_address}:{signal_type}", f"{float(price)}|{at}", ex=int(self.horizon))
+            except Exception as e:
+                self._redis_failed(e)
+        if at - self._last_prune > 3600:
+            self.prune(at)
+
+    def prune(self, now=None):
+        """حذف رکوردهای قدیمی‌تر از horizon"""
+        now = time.time() if now is None else now
+        cutoff = now - self.horizon
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[1] >= cutoff}
+        self._last_prune = now
+
+
+cooldown_ledger = CooldownLedger()
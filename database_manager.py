@@ -1,18 +1,139 @@
+import io
+import json
+import csv
 import sqlite3
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch
 from config import Config
+from scan_metrics import DB_SECONDS
 from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# بافر نوشتن فعال برای task جاری (فقط چرخه اسکن آن را باز می‌کند)
+_active_write_buffer = contextvars.ContextVar('active_write_buffer', default=None)
+
+
+class WriteBuffer:
+    """
+    Unit of work اسکن: نوشتن‌های تک‌ردیفی جمع می‌شوند، بر اساس کوئری
+    (یعنی جدول و نوع نوشتن) گروه‌بندی و در یک تراکنش flush می‌شوند.
+    """
+
+    def __init__(self, db, max_size):
+        self.db = db
+        self.max_size = max_size
+        self.pending = OrderedDict()  # query -> [params, ...]
+        self.size = 0
+        self.flush_count = 0
+        self.total_writes = 0
+
+    def add(self, query, params):
+        self.add_many(query, [params])
+
+    def add_many(self, query, params_list):
+        self.pending.setdefault(query, []).extend(params_list)
+        self.size += len(params_list)
+        if self.size >= self.max_size:
+            self.flush()
+
+    def flush(self):
+        """
+        همه نوشتن‌های صف را در یک تراکنش اجرا می‌کند. در صورت خطا یک بار دیگر تلاش می‌شود؛
+        اگر باز هم شکست بخورد نوشتن‌ها در صف می‌مانند (flush بعدی دوباره آن‌ها را می‌نویسد) و خطا بالا می‌رود.
+        """
+        if not self.size:
+            return 0
+
+        written = self.size
+        try:
+            self.db.execute_grouped(self.pending)
+        except Exception as e:
+            logger.warning(f"⚠️ Write buffer flush failed ({written} writes), retrying once: {e}")
+            try:
+                self.db.execute_grouped(self.pending)
+            except Exception:
+                logger.error(f"❌ Write buffer flush failed twice, {written} writes kept for the next flush", exc_info=True)
+                raise
+        # صف فقط بعد از commit موفق خالی می‌شود
+        self.pending = OrderedDict()
+        self.size = 0
+        self.flush_count += 1
+        self.total_writes += written
+        return written
 
 class DatabaseManager:
-    def __init__(self):
-        self.db_url = Config.DATABASE_URL
+    def __init__(self, db_url=None, sqlite_profile=None):
+        self.db_url = db_url or Config.DATABASE_URL
         # تشخیص خودکار نوع دیتابیس از روی URL
         self.is_postgres = self.db_url.startswith('postgresql://') or self.db_url.startswith('postgres://')
+        # پروفایل tuned: WAL + کانکشن‌های ماندگار + یک writer سریالی
+        self.sqlite_profile = sqlite_profile or Config.SQLITE_PROFILE
+        self.is_tuned_sqlite = not self.is_postgres and self.sqlite_profile == 'tuned'
+        self._writer_conn = None
+        self._write_lock = threading.RLock()
+        self._readers = threading.local()
+
+    def _open_tuned_sqlite(self):
+        """کانکشن SQLite با pragmaهای پروفایل پرسرعت"""
+        conn = sqlite3.connect(
+            self.db_url,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=Config.SQLITE_STATEMENT_CACHE
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={Config.SQLITE_MMAP_SIZE}")
+        # مقدار منفی یعنی اندازه cache به کیلوبایت
+        conn.execute(f"PRAGMA cache_size=-{Config.SQLITE_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
 
     @contextmanager
-    def get_connection(self):
+    def _tuned_sqlite_connection(self, write):
+        """writer مشترک با قفل (نوشتن‌ها سریالی) یا reader ماندگار مخصوص هر thread"""
+        if not write:
+            conn = getattr(self._readers, 'conn', None)
+            if conn is None:
+                conn = self._readers.conn = self._open_tuned_sqlite()
+            yield conn
+            return
+
+        with self._write_lock:
+            if self._writer_conn is None:
+                self._writer_conn = self._open_tuned_sqlite()
+            try:
+                yield self._writer_conn
+            except Exception:
+                self._writer_conn.rollback()
+                raise
+
+    def close(self):
+        """بستن کانکشن‌های ماندگار پروفایل tuned"""
+        with self._write_lock:
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+        conn = getattr(self._readers, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._readers.conn = None
+
+    @contextmanager
+    def get_connection(self, write=True):
         """یک کانکشن به دیتابیس را در یک context manager فراهم می‌کند."""
+        if self.is_tuned_sqlite:
+            with self._tuned_sqlite_connection(write) as conn:
+                yield conn
+            return
+
         try:
             if self.is_postgres:
                 conn = psycopg2.connect(self.db_url)
@@ -27,7 +148,7 @@ class DatabaseManager:
 
     def _execute_query(self, query, params=None, fetch=None):
         """یک متد داخلی برای اجرای انواع کوئری‌ها."""
-        with self.get_connection() as conn:
+        with self.get_connection(write=fetch is None) as conn:
             # برای Postgres از RealDictCursor استفاده می‌کنیم تا خروجی دیکشنری باشد
             if self.is_postgres:
                 cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -54,23 +175,159 @@ class DatabaseManager:
 
     # متدهای عمومی برای استفاده در بقیه کد
     def fetchall(self, query, params=None):
-        return self._execute_query(query, params, fetch='all')
+        with DB_SECONDS.time('fetchall'):
+            return self._execute_query(query, params, fetch='all')
 
     def fetchone(self, query, params=None):
-        return self._execute_query(query, params, fetch='one')
+        with DB_SECONDS.time('fetchone'):
+            return self._execute_query(query, params, fetch='one')
 
     def execute(self, query, params=None):
         """برای کوئری‌های INSERT, UPDATE, DELETE استفاده می‌شود."""
-        return self._execute_query(query, params)
+        with DB_SECONDS.time('execute'):
+            return self._execute_query(query, params)
 
     def executemany(self, query, params_list):
         """Execute query with multiple parameter sets (batch operation)"""
-        with self.get_connection() as conn:
+        with DB_SECONDS.time('executemany'), self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.executemany(query, params_list)
             conn.commit()
             return cursor.rowcount
 
+    def execute_grouped(self, groups):
+        """اجرای چند گروه (query -> لیست params) در یک تراکنش و یک commit"""
+        with DB_SECONDS.time('execute_grouped'), self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for query, params_list in groups.items():
+                    if self.is_postgres:
+                        # executemany در psycopg2 برای هر ردیف یک رفت‌وبرگشت دارد
+                        execute_batch(cursor, query, params_list, page_size=500)
+                    else:
+                        cursor.executemany(query, params_list)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def bulk_upsert(self, table, columns, rows, conflict_columns, update_columns=None, coalesce_columns=None):
+        """
+        درج/به‌روزرسانی حجیم. در Postgres ردیف‌ها با COPY به یک جدول staging موقت
+        منتقل و با یک INSERT ... ON CONFLICT ادغام می‌شوند؛ در SQLite به صورت
+        INSERT چندردیفی در batchهای هم‌اندازه با سقف متغیرهای SQLite.
+        update_columns خالی یعنی DO NOTHING. ستون‌های coalesce_columns فقط با مقدار غیر NULL به‌روز می‌شوند.
+        """
+        if not rows:
+            return 0
+
+        # حذف تکراری‌ها بر اساس کلید conflict (آخرین مقدار برنده است)
+        key_indexes = [columns.index(c) for c in conflict_columns]
+        unique_rows = list({tuple(row[i] for i in key_indexes): row for row in rows}.values())
+
+        column_list = ", ".join(columns)
+        conflict_list = ", ".join(conflict_columns)
+        if update_columns:
+            coalesce_columns = set(coalesce_columns or ())
+            action = "DO UPDATE SET " + ", ".join(
+                f"{c} = COALESCE(EXCLUDED.{c}, {table}.{c})" if c in coalesce_columns else f"{c} = EXCLUDED.{c}"
+                for c in update_columns
+            )
+        else:
+            action = "DO NOTHING"
+
+        with DB_SECONDS.time('bulk_upsert'), self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if self.is_postgres:
+                    staging = f"staging_{table}"
+                    cursor.execute(
+                        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                        f"SELECT {column_list} FROM {table} WITH NO DATA"
+                    )
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(unique_rows)
+                    buffer.seek(0)
+                    cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+                    cursor.execute(
+                        f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} "
+                        f"ON CONFLICT ({conflict_list}) {action}"
+                    )
+                else:
+                    try:
+                        max_variables = conn.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+                    except AttributeError:
+                        max_variables = 999
+                    rows_per_statement = max(1, max_variables // len(columns))
+                    row_placeholders = "(" + ", ".join("?" * len(columns)) + ")"
+                    for i in range(0, len(unique_rows), rows_per_statement):
+                        chunk = unique_rows[i:i + rows_per_statement]
+                        cursor.execute(
+                            f"INSERT INTO {table} ({column_list}) VALUES "
+                            + ", ".join([row_placeholders] * len(chunk))
+                            + f" ON CONFLICT ({conflict_list}) {action}",
+                            [value for row in chunk for value in row]
+                        )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        return len(unique_rows)
+
+    def run_maintenance(self, statements):
+        """اجرای دستورات نگهداری (VACUUM/ANALYZE) که نباید داخل تراکنش اجرا شوند"""
+        if self.is_postgres:
+            conn = psycopg2.connect(self.db_url)
+            try:
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    for statement in statements:
+                        cursor.execute(statement)
+            finally:
+                conn.close()
+            return
+
+        with self.get_connection() as conn:
+            for statement in statements:
+                conn.execute(statement)
+
+    @contextmanager
+    def write_batch(self, max_size=None):
+        """
+        نوشتن‌های execute_deferred داخل این بلاک بافر می‌شوند و در پایان (یا با پر شدن بافر)
+        یکجا flush می‌شوند. محدوده آن task جاری است و روی handlerهای وب اثری ندارد.
+        """
+        buffer = WriteBuffer(self, max_size or Config.WRITE_BUFFER_MAX_SIZE)
+        token = _active_write_buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            _active_write_buffer.reset(token)
+            buffer.flush()
+
+    def execute_deferred(self, query, params=None):
+        """مثل execute، ولی اگر write_batch باز باشد نوشتن را به بافر می‌سپارد."""
+        buffer = _active_write_buffer.get()
+        if buffer is None:
+            return self.execute(query, params)
+        buffer.add(query, params or [])
+        return None
+
+    def executemany_deferred(self, query, params_list):
+        """چند نوشتن با یک کوئری؛ داخل write_batch به بافر و بیرون از آن در یک تراکنش"""
+        if not params_list:
+            return None
+        buffer = _active_write_buffer.get()
+        if buffer is None:
+            return self.execute_grouped({query: list(params_list)})
+        buffer.add_many(query, list(params_list))
+        return None
+
 # یک نمونه از کلاس می‌سازیم تا در همه جا از همین یک نمونه استفاده شود
 
 
@@ -108,7 +365,7 @@ class DatabaseManager:
                      state_data['target1_price'], state_data['target2_price'],
                      state_data['status'])
         # <<< این خط باید اینجا باشد
-        return self.execute(query, params)
+        return self.execute_deferred(query, params)
 
     def ensure_fibonacci_table(self):
         """Ensure fibonacci_state table exists"""
@@ -132,5 +389,72 @@ class DatabaseManager:
         except Exception as e:
             print(f"❌ Error creating fibonacci_state table: {e}")
 
+    def ensure_zone_states_table(self):
+        """Ensure zone_states table and its (token_address, zone_bucket) index exist"""
+        primary_key_type = "SERIAL PRIMARY KEY" if self.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        try:
+            self.execute(f'''
+                CREATE TABLE IF NOT EXISTS zone_states (
+                    id {primary_key_type},
+                    token_address TEXT NOT NULL,
+                    zone_price DOUBLE PRECISION NOT NULL,
+                    zone_bucket BIGINT,
+                    current_state TEXT NOT NULL DEFAULT 'IDLE',
+                    last_signal_type TEXT,
+                    last_signal_time TEXT,
+                    last_price DOUBLE PRECISION,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(token_address, zone_price)
+                );
+            ''')
+        except Exception as e:
+            print(f"❌ Error creating zone_states table: {e}")
+            return
+
+        try:
+            self.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_zone_states_token_bucket
+                ON zone_states (token_address, zone_bucket)
+            ''')
+            print("✅ zone_states table ensured")
+        except Exception as e:
+            # جدول قدیمی بدون ستون zone_bucket - باید scripts/run_migrations.py اجرا شود
+            print(f"⚠️ zone_states index missing, run scripts/run_migrations.py: {e}")
+
+    def ensure_service_state_table(self):
+        """جدول وضعیت سرویس‌ها (اسکنر مستقل وضعیت و متریک‌هایش را اینجا منتشر می‌کند)"""
+        try:
+            self.execute('''
+                CREATE TABLE IF NOT EXISTS service_state (
+                    service TEXT PRIMARY KEY,
+                    state TEXT,
+                    metrics TEXT,
+                    updated_at TEXT
+                )
+            ''')
+        except Exception as e:
+            print(f"❌ Error creating service_state table: {e}")
+
+    def save_service_state(self, service, state, metrics=None):
+        """ثبت آخرین وضعیت یک سرویس (state به صورت JSON)"""
+        self.bulk_upsert(
+            'service_state',
+            ['service', 'state', 'metrics', 'updated_at'],
+            [(service, json.dumps(state, default=str), metrics, datetime.now().isoformat())],
+            conflict_columns=['service'],
+            update_columns=['state', 'metrics', 'updated_at']
+        )
+
+    def get_service_state(self, service):
+        placeholder = "%s" if self.is_postgres else "?"
+        row = self.fetchone(f"SELECT * FROM service_state WHERE service = {placeholder}", (service,))
+        if not row:
+            return None
+        row = dict(row)
+        row['state'] = json.loads(row['state']) if row.get('state') else None
+        return row
+
 db_manager = DatabaseManager()
 db_manager.ensure_fibonacci_table()
+db_manager.ensure_zone_states_table()
+db_manager.ensure_service_state_table()
@@ -0,0 +1,319 @@
+# param_sweep.py
+"""
+جستجوی پارامترهای zone_config (و TradingConfig) روی کندل‌های ذخیره شده با replay موتور backtest.
+
+    python -m param_sweep --space sweep_space.json --timeframe minute --aggregate 5
+    python -m param_sweep --space sweep_space.json --mode random --samples 200 --output sweep_results.csv
+
+فایل space یک JSON از نام پارامتر به لیست مقادیر (grid یا انتخاب تصادفی) یا بازه
+{"min": ..., "max": ..., "log": false} (فقط random) است:
+
+    {"TIER1_APPROACH_THRESHOLD": [0.01, 0.02, 0.03], "MIN_ZONE_SCORE": {"min": 1.0, "max": 3.0}}
+
+پیکربندی‌هایی که پارامترهای zone یکسانی دارند یک بار zoneها را محاسبه می‌کنند (آستانه‌های
+approach/breakout و RESET_DISTANCE فقط روی replay اثر دارند) و timeline zoneها برای اجراهای بعدی روی دیسک کش می‌شود.
+مقادیری که موتورها هنگام import کپی کرده‌اند (مثل SIGNAL_PRIORITY و ZONE_BUCKET_WIDTH) قابل sweep نیستند.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import analysis_engine
+import backtest_engine
+import strategy_engine
+import zone_config
+from config import TradingConfig
+from candle_store import candle_store
+from strategy_engine import StrategyEngine
+from backtest_engine import (
+    DEFAULT_HORIZONS, MIN_CANDLES, zone_timeline, replay_zone_signals, apply_cooldowns, forward_returns
+)
+
+logger = logging.getLogger(__name__)
+
+# پارامترهایی که فقط ماشین حالت zoneها را تغییر می‌دهند و به محاسبه دوباره zoneها نیاز ندارند
+SIGNAL_PARAMS = {
+    'TIER1_APPROACH_THRESHOLD', 'TIER1_BREAKOUT_THRESHOLD',
+    'TIER2_APPROACH_THRESHOLD', 'TIER2_BREAKOUT_THRESHOLD', 'RESET_DISTANCE',
+}
+
+# مقادیر zone_config که strategy_engine/backtest_engine هنگام import با نام کپی کرده‌اند؛
+# _set_param به آن کپی‌ها نمی‌رسد و sweep آن‌ها نتیجه را تغییر نمی‌دهد
+FROZEN_PARAMS = {
+    name for name in vars(zone_config)
+    if name.isupper() and name not in SIGNAL_PARAMS
+    and any(hasattr(module, name) for module in (strategy_engine, backtest_engine))
+}
+
+
+def load_space(path):
+    with open(path) as f:
+        space = json.load(f)
+    unknown = [name for name in space if not hasattr(zone_config, name) and not hasattr(TradingConfig, name)]
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(unknown)}")
+    frozen = [name for name in space if name in FROZEN_PARAMS]
+    if frozen:
+        raise ValueError(f"Parameters not read at replay time, cannot be swept: {', '.join(frozen)}")
+    inert = [name for name in space if not hasattr(zone_config, name)]
+    if inert:
+        # TradingConfig فقط در مسیر قدیمی _check_confluence_signals خوانده می‌شود
+        logger.warning(f"⚠️ {', '.join(inert)} are not read by the replayed strategies")
+    return space
+
+
+def grid_configs(space):
+    for name, values in space.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid search needs a list of values for {name}")
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def _sample(values, rng):
+    if isinstance(values, list):
+        return values[rng.randrange(len(values))]
+    low, high = values['min'], values['max']
+    if values.get('log'):
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    return rng.uniform(low, high)
+
+
+def random_configs(space, samples, seed=None):
+    rng = random.Random(seed)
+    configs, seen = [], set()
+    # ترکیب‌های تکراری (فضای گسسته کوچک) حذف می‌شوند
+    for _ in range(samples * 10):
+        config = {name: _sample(values, rng) for name, values in space.items()}
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+        if len(configs) == samples:
+            break
+    return configs
+
+
+def zone_key(config):
+    """کلید گروه‌بندی: پارامترهایی که روی محاسبه zoneها اثر دارند"""
+    return json.dumps({name: value for name, value in config.items() if name not in SIGNAL_PARAMS}, sort_keys=True)
+
+
+# مقادیر zone_config قبل از هر تغییر؛ بخشی از کلید کش تا تغییر پیش‌فرض‌ها کش قدیمی را باطل کند
+ZONE_CONFIG_DEFAULTS = {name: value for name, value in vars(zone_config).items() if name.isupper()}
+
+_strategy_engine = None
+_defaults = {}
+_candles = {}
+
+
+def _init_worker():
+    global _strategy_engine
+    logging.getLogger().setLevel(logging.WARNING)
+    _strategy_engine = StrategyEngine()
+
+
+def apply_zone_params(params):
+    """
+    اعمال پارامترها در پروسه worker: zone_config (برای importهای داخل توابع)، globals ماژول
+    analysis_engine (که با import * کپی شده‌اند) و TradingConfig. پارامترهای قبلی به پیش‌فرض برمی‌گردند.
+    """
+    for name, value in _defaults.items():
+        _set_param(name, value)
+    for name, value in params.items():
+        if name not in _defaults:
+            _defaults[name] = getattr(zone_config, name) if hasattr(zone_config, name) else getattr(TradingConfig, name)
+        _set_param(name, value)
+
+
+def _set_param(name, value):
+    if isinstance(value, dict) and name == 'FIBONACCI_WEIGHTS':
+        # کلیدهای JSON رشته‌اند
+        value = {float(level): weight for level, weight in value.items()}
+    if hasattr(zone_config, name):
+        setattr(zone_config, name, value)
+        if hasattr(analysis_engine, name):
+            setattr(analysis_engine, name, value)
+    else:
+        setattr(TradingConfig, name, value)
+
+
+def _load_candles(pool_id, timeframe, aggregate, since, until):
+    # taskهای پشت سر هم یک worker معمولاً همان pool با گروه دیگری از پارامترها هستند
+    key = (pool_id, timeframe, aggregate, since, until)
+    if key not in _candles:
+        _candles.clear()
+        _candles[key] = candle_store.load(pool_id, timeframe, aggregate, since, until)
+    return _candles[key]
+
+
+def cached_timeline(df, pool_id, timeframe, aggregate, analysis_every, zone_params, cache_dir):
+    """timeline zoneها از کش دیسک یا محاسبه و ذخیره آن (کلید شامل پارامترها و آخرین کندل)"""
+    path = None
+    if cache_dir:
+        effective = {**ZONE_CONFIG_DEFAULTS, **json.loads(zone_params)}
+        key = json.dumps([pool_id, timeframe, str(aggregate), analysis_every, len(df),
+                          int(df['timestamp'].iloc[0]), int(df['timestamp'].iloc[-1]), effective],
+                         sort_keys=True, default=str)
+        path = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".pkl")
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+
+    apply_zone_params(json.loads(zone_params))
+    timeline = zone_timeline(_strategy_engine.analysis_engine, df, pool_id, timeframe, aggregate, analysis_every)
+    if path:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(timeline, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    return timeline
+
+
+def summarize(signals, horizons):
+    """شمارنده‌های قابل جمع بین poolها برای همه سیگنال‌ها و سیگنال‌های alerted"""
+    stats = {}
+    for prefix, frame in (('', signals), ('alerted_', signals[signals['alerted']] if len(signals) else signals)):
+        stats[f'{prefix}signals'] = len(frame)
+        for horizon in horizons:
+            returns = frame[f'return_{horizon}'].dropna() if len(frame) else pd.Series(dtype=float)
+            stats[f'{prefix}n_{horizon}'] = len(returns)
+            stats[f'{prefix}hits_{horizon}'] = int((returns > 0).sum())
+            stats[f'{prefix}sum_{horizon}'] = float(returns.sum())
+    return stats
+
+
+def sweep_pool(pool_id, timeframe, aggregate, since, until, analysis_every, horizons, zone_params, configs, cache_dir):
+    """
+    ارزیابی همه پیکربندی‌های یک گروه zone روی یک pool: timeline یک بار ساخته و برای هر
+    پیکربندی فقط ماشین حالت، cooldown و بازده آینده اجرا می‌شود. خروجی {config_id: شمارنده‌ها}
+    """
+    if _strategy_engine is None:
+        _init_worker()
+    df = _load_candles(pool_id, timeframe, aggregate, since, until)
+    if df is None or len(df) < MIN_CANDLES.get(timeframe, 7):
+        return {}
+    timeline = cached_timeline(df, pool_id, timeframe, aggregate, analysis_every, zone_params, cache_dir)
+
+    results = {}
+    for config_id, config in configs:
+        thresholds = {name: value for name, value in config.items() if name in SIGNAL_PARAMS}
+        signals = apply_cooldowns(_strategy_engine, replay_zone_signals(df, timeline, thresholds), df, pool_id)
+        results[config_id] = summarize(forward_returns(df, signals, horizons), horizons)
+    return results
+
+
+def rank_results(configs, totals, horizons, metric, min_signals):
+    rows = []
+    for config_id, config in enumerate(configs):
+        stats = totals.get(config_id, {})
+        row = {'config_id': config_id, **config}
+        for prefix in ('', 'alerted_'):
+            row[f'{prefix}signals'] = stats.get(f'{prefix}signals', 0)
+            for horizon in horizons:
+                count = stats.get(f'{prefix}n_{horizon}', 0)
+                row[f'{prefix}hit_rate_{horizon}'] = stats[f'{prefix}hits_{horizon}'] / count if count else np.nan
+                row[f'{prefix}avg_return_{horizon}'] = stats[f'{prefix}sum_{horizon}'] / count if count else np.nan
+        rows.append(row)
+
+    results = pd.DataFrame(rows)
+    if metric not in results.columns:
+        raise ValueError(f"Unknown metric {metric}")
+    # پیکربندی‌هایی با سیگنال کمتر از min_signals انتهای جدول قرار می‌گیرند
+    count_column = 'alerted_signals' if metric.startswith('alerted_') else 'signals'
+    results['eligible'] = results[count_column] >= min_signals
+    results = results.sort_values(['eligible', metric], ascending=[False, False], na_position='last')
+    results.insert(0, 'rank', range(1, len(results) + 1))
+    return results.reset_index(drop=True)
+
+
+def run_sweep(configs, pools, timeframe, aggregate, since=None, until=None, analysis_every=12,
+              horizons=DEFAULT_HORIZONS, workers=None, cache_dir=None):
+    """{config_id: شمارنده‌های جمع شده همه poolها}؛ هر task یک (pool، گروه پارامترهای zone) است"""
+    groups = {}
+    for config_id, config in enumerate(configs):
+        groups.setdefault(zone_key(config), []).append((config_id, config))
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    logger.info(f"🧪 {len(configs)} configurations in {len(groups)} zone groups over {len(pools)} pools")
+
+    tasks = [(pool_id, timeframe, aggregate, since, until, analysis_every, tuple(horizons), key, group, cache_dir)
+             for pool_id in pools for key, group in groups.items()]
+    totals = {}
+
+    def merge(results):
+        for config_id, stats in results.items():
+            total = totals.setdefault(config_id, {})
+            for name, value in stats.items():
+                total[name] = total.get(name, 0) + value
+
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            merge(sweep_pool(*task))
+    else:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+            futures = {executor.submit(sweep_pool, *task): task[0] for task in tasks}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    merge(future.result())
+                except Exception as e:
+                    logger.error(f"❌ Sweep failed for {futures[future]}: {e}")
+                if done % 100 == 0:
+                    logger.info(f"⏳ {done}/{len(tasks)} sweep tasks done")
+    logger.info(f"✅ Sweep finished in {time.perf_counter() - started:.1f}s")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep zone_config/TradingConfig values on stored candles")
+    parser.add_argument('--space', required=True, help="JSON file with the search space")
+    parser.add_argument('--mode', choices=('grid', 'random'), default='grid')
+    parser.add_argument('--samples', type=int, default=100, help="configurations for random search")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--timeframe', default='minute')
+    parser.add_argument('--aggregate', default='5')
+    parser.add_argument('--pools', nargs='*', help="pool ids (default: all stored pools)")
+    parser.add_argument('--since', type=int)
+    parser.add_argument('--until', type=int)
+    parser.add_argument('--analysis-every', type=int, default=12)
+    parser.add_argument('--horizons', default=",".join(map(str, DEFAULT_HORIZONS)))
+    parser.add_argument('--metric', default=None, help="ranking column (default: alerted_avg_return_<middle horizon>)")
+    parser.add_argument('--min-signals', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cache-dir', default='.sweep_cache', help="zone timeline cache ('' disables)")
+    parser.add_argument('--output', default='sweep_results.csv')
+    args = parser.parse_args(argv)
+
+    space = load_space(args.space)
+    configs = grid_configs(space) if args.mode == 'grid' else random_configs(space, args.samples, args.seed)
+    horizons = tuple(int(h) for h in args.horizons.split(','))
+    metric = args.metric or f"alerted_avg_return_{horizons[len(horizons) // 2]}"
+    pools = args.pools or [pool_id for pool_id, _ in candle_store.pools(args.timeframe, args.aggregate, MIN_CANDLES.get(args.timeframe, 7))]
+
+    totals = run_sweep(configs, pools, args.timeframe, args.aggregate, args.since, args.until,
+                       args.analysis_every, horizons, args.workers, args.cache_dir or None)
+    results = rank_results(configs, totals, horizons, metric, args.min_signals)
+    results.to_csv(args.output, index=False)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(results.head(20).to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+    logger.info(f"📊 Ranked results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
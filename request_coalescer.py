@@ -0,0 +1,45 @@
+# request_coalescer.py
+import asyncio
+from scan_metrics import COALESCED_REQUESTS
+from shared_cache import candle_bucket
+
+
+def candle_key(token_address, timeframe, aggregate, now=None):
+    """کلید (توکن، تایم‌فریم، aggregate، کندل جاری)؛ با بسته شدن کندل درخواست‌ها دوباره اجرا می‌شوند"""
+    return (token_address, timeframe, str(aggregate), candle_bucket(timeframe, aggregate, now))
+
+
+class RequestCoalescer:
+    """
+    درخواست‌های همزمان با کلید یکسان یک بار اجرا می‌شوند: اولین درخواست کار را شروع می‌کند و بقیه منتظر
+    همان task می‌مانند و همان نتیجه (یا همان خطا) را می‌گیرند. بعد از پایان، کلید آزاد می‌شود و درخواست‌های
+    بعدی از کش‌های معمول (pool، تحلیل، چارت) استفاده می‌کنند.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # key -> task در حال اجرا
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def _done(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # اگر همه منتظرها لغو شده باشند، خطا بدون هشدار "never retrieved" کنار گذاشته می‌شود
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key, factory):
+        """نتیجه factory() برای این key؛ اگر همین key در حال اجراست منتظر همان می‌ماند"""
+        task = self._inflight.get(key)
+        if task is None:
+            COALESCED_REQUESTS.inc(f"{self.name}_leader")
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+        else:
+            COALESCED_REQUESTS.inc(f"{self.name}_joined")
+        # لغو شدن یک درخواست کننده کار مشترک بقیه را لغو نمی‌کند
+        return await asyncio.shield(task)
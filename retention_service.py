@@ -0,0 +1,209 @@
+# retention_service.py
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from config import Config
+from database_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """
+    پاکسازی دوره‌ای جداول بی‌انتها (alert_history, zone_states, fibonacci_state
+    و توکن‌های rugged) به صورت batch، خلاصه‌سازی هشدارهای قدیمی و VACUUM/ANALYZE.
+    """
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval or Config.RETENTION_INTERVAL
+        self.batch_size = batch_size or Config.RETENTION_BATCH_SIZE
+        self.running = False
+        self.last_report = None
+        self.last_vacuum_time = 0
+        self.placeholder = "%s" if db_manager.is_postgres else "?"
+        # ستون شناسه فیزیکی ردیف برای حذف batch روی جداولی که id ندارند
+        self.row_id = "ctid" if db_manager.is_postgres else "rowid"
+        self.ensure_summary_table()
+
+    def ensure_summary_table(self):
+        """جدول خلاصه روزانه هشدارهای آرشیو شده"""
+        try:
+            db_manager.execute('''
+                CREATE TABLE IF NOT EXISTS alert_summary (
+                    token_address TEXT NOT NULL,
+                    signal_type TEXT,
+                    alert_day TEXT NOT NULL,
+                    alert_count INTEGER NOT NULL,
+                    min_price DOUBLE PRECISION,
+                    max_price DOUBLE PRECISION,
+                    avg_price DOUBLE PRECISION,
+                    first_alert TEXT,
+                    last_alert TEXT,
+                    UNIQUE(token_address, signal_type, alert_day)
+                )
+            ''')
+        except Exception as e:
+            logger.error(f"❌ Error creating alert_summary table: {e}")
+
+    # --- cutoffs ---
+
+    def _app_cutoff(self, days):
+        """cutoff برای timestampهایی که برنامه با datetime.now().isoformat() می‌نویسد"""
+        cutoff = datetime.now() - timedelta(days=days)
+        return cutoff if db_manager.is_postgres else cutoff.isoformat()
+
+    def _db_cutoff_expr(self):
+        """عبارت SQL برای ستون‌هایی که پیش‌فرض CURRENT_TIMESTAMP دیتابیس را دارند"""
+        if db_manager.is_postgres:
+            return f"CURRENT_TIMESTAMP - make_interval(days => {self.placeholder})"
+        return f"datetime('now', {self.placeholder})"
+
+    def _db_cutoff_param(self, days):
+        return int(days) if db_manager.is_postgres else f"-{int(days)} days"
+
+    # --- batch helpers ---
+
+    def _delete_in_batches(self, table, where, params):
+        """حذف ردیف‌ها در batchهای کوچک تا قفل نوشتن طولانی نشود"""
+        p = self.placeholder
+        query = f"""
+            DELETE FROM {table} WHERE {self.row_id} IN (
+                SELECT {self.row_id} FROM {table} WHERE {where} LIMIT {p}
+            )
+        """
+        removed = 0
+        while True:
+            deleted = db_manager.execute(query, tuple(params) + (self.batch_size,))
+            removed += max(deleted or 0, 0)
+            if not deleted or deleted < self.batch_size:
+                return removed
+
+    def archive_alerts(self):
+        """هشدارهای قدیمی‌تر از horizon را در alert_summary جمع و سپس حذف می‌کند"""
+        p = self.placeholder
+        cutoff = self._app_cutoff(Config.ALERT_RETENTION_DAYS)
+        if db_manager.is_postgres:
+            day_expr, least, greatest = "CAST(CAST(timestamp AS DATE) AS TEXT)", "LEAST", "GREATEST"
+        else:
+            day_expr, least, greatest = "substr(timestamp, 1, 10)", "MIN", "MAX"
+        rollup_query = f"""
+            INSERT INTO alert_summary
+                (token_address, signal_type, alert_day, alert_count, min_price, max_price, avg_price, first_alert, last_alert)
+            SELECT token_address, signal_type, {day_expr}, COUNT(*),
+                   MIN(price_at_alert), MAX(price_at_alert), AVG(price_at_alert),
+                   CAST(MIN(timestamp) AS TEXT), CAST(MAX(timestamp) AS TEXT)
+            FROM alert_history
+            WHERE id <= {p} AND timestamp < {p}
+            GROUP BY token_address, signal_type, {day_expr}
+            ON CONFLICT (token_address, signal_type, alert_day) DO UPDATE SET
+                avg_price = (alert_summary.avg_price * alert_summary.alert_count
+                             + excluded.avg_price * excluded.alert_count)
+                            / (alert_summary.alert_count + excluded.alert_count),
+                alert_count = alert_summary.alert_count + excluded.alert_count,
+                min_price = {least}(alert_summary.min_price, excluded.min_price),
+                max_price = {greatest}(alert_summary.max_price, excluded.max_price),
+                last_alert = excluded.last_alert
+        """
+        boundary_query = f"""
+            SELECT MAX(id) AS max_id FROM (
+                SELECT id FROM alert_history WHERE timestamp < {p} ORDER BY id LIMIT {p}
+            ) batch
+        """
+        delete_query = f"DELETE FROM alert_history WHERE id <= {p} AND timestamp < {p}"
+
+        archived = 0
+        while True:
+            row = db_manager.fetchone(boundary_query, (cutoff, self.batch_size))
+            max_id = row['max_id'] if row else None
+            if max_id is None:
+                return archived
+            # خلاصه‌سازی و حذف هر batch در یک تراکنش تا هیچ هشداری دو بار شمرده نشود
+            with db_manager.get_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(rollup_query, (max_id, cutoff))
+                    cursor.execute(delete_query, (max_id, cutoff))
+                    deleted = cursor.rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+            archived += deleted
+            if deleted < self.batch_size:
+                return archived
+
+    def prune_zone_states(self):
+        return self._delete_in_batches(
+            "zone_states", f"updated_at < {self._db_cutoff_expr()}",
+            (self._db_cutoff_param(Config.ZONE_STATE_RETENTION_DAYS),)
+        )
+
+    def prune_fibonacci_states(self):
+        return self._delete_in_batches(
+            "fibonacci_state",
+            f"status IN ('INVALIDATED', 'COMPLETED') AND updated_at < {self._db_cutoff_expr()}",
+            (self._db_cutoff_param(Config.FIBO_RETENTION_DAYS),)
+        )
+
+    def prune_rugged_tokens(self):
+        """توکن‌های rugged قدیمی و همه stateهای وابسته به آن‌ها را حذف می‌کند"""
+        p = self.placeholder
+        cutoff = self._app_cutoff(Config.RUGGED_RETENTION_DAYS)
+        rugged = f"SELECT address FROM watchlist_tokens WHERE status = 'rugged' AND last_active < {p}"
+        self._delete_in_batches("zone_states", f"token_address IN ({rugged})", (cutoff,))
+        self._delete_in_batches("fibonacci_state", f"token_address IN ({rugged})", (cutoff,))
+        return self._delete_in_batches("watchlist_tokens", f"status = 'rugged' AND last_active < {p}", (cutoff,))
+
+    def vacuum_and_analyze(self):
+        """VACUUM/ANALYZE خارج از تراکنش"""
+        tables = ["alert_history", "alert_summary", "zone_states", "fibonacci_state", "watchlist_tokens"]
+        if db_manager.is_postgres:
+            statements = [f"VACUUM (ANALYZE) {table}" for table in tables]
+        else:
+            statements = ["ANALYZE", "VACUUM"]
+        db_manager.run_maintenance(statements)
+
+    def run_once(self):
+        """یک دور کامل retention؛ گزارش تعداد ردیف‌های حذف شده و زمان صرف شده"""
+        start = time.perf_counter()
+        report = {}
+        for name, job in (
+            ("alert_history", self.archive_alerts),
+            ("zone_states", self.prune_zone_states),
+            ("fibonacci_state", self.prune_fibonacci_states),
+            ("rugged_tokens", self.prune_rugged_tokens),
+        ):
+            try:
+                report[name] = job()
+            except Exception as e:
+                report[name] = None
+                logger.error(f"❌ Retention job '{name}' failed: {e}")
+
+        report['vacuum'] = False
+        if time.time() - self.last_vacuum_time >= Config.VACUUM_INTERVAL_HOURS * 3600:
+            try:
+                self.vacuum_and_analyze()
+                self.last_vacuum_time = time.time()
+                report['vacuum'] = True
+            except Exception as e:
+                logger.error(f"❌ VACUUM/ANALYZE failed: {e}")
+
+        report['duration_seconds'] = round(time.perf_counter() - start, 3)
+        report['finished_at'] = datetime.now().isoformat()
+        self.last_report = report
+        logger.info(f"🧹 Retention run: {report}")
+        return report
+
+    async def run_forever(self):
+        """اجرای دوره‌ای در thread جداگانه تا event loop بلاک نشود"""
+        self.running = True
+        logger.info(f"🧹 Retention service started (Interval: {self.interval}s).")
+        while self.running:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"❌ Retention run failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,67 @@
+# scan_context.py
+from collections import Counter
+from candle_store import with_indicators
+from scan_metrics import CANDLE_REQUESTS
+
+
+class ScanContext:
+    """
+    داده‌های دریافت شده برای یک توکن در یک اسکن. هر تایم‌فریم حداکثر یک بار (با FETCH_LIMIT
+    کندل) دریافت می‌شود و درخواست‌های با limit کمتر از انتهای همان کندل‌ها، با اندیکاتورهای
+    محاسبه شده روی همان پنجره (مثل دریافت مستقیم)، پاسخ داده می‌شوند.
+    """
+
+    # بیشترین limit مصرف کنندگان (perform_full_analysis و probe عمر)؛ یک درخواست GeckoTerminal تا 1000 کندل
+    FETCH_LIMIT = 500
+
+    def __init__(self, token, analysis_engine):
+        self.token = token
+        self.analysis_engine = analysis_engine
+        # (timeframe, aggregate) -> (limit دریافت شده، DataFrame)
+        self._frames = {}
+        # (timeframe, aggregate, limit) -> DataFrame با اندیکاتورها
+        self._views = {}
+        self.fetch_counts = Counter()
+        # دریافت‌هایی که از shared_cache سرویس نشدند و به API رفتند
+        self.network_fetches = Counter()
+        self.health_result = None
+        self.health_verdict = None
+        self.age_hours = None
+        # کندل‌های لحظه‌ای (candle_stream) جایگزین دریافت شده‌اند؛ کش تحلیل نباید استفاده شود
+        self.live = False
+
+    def seed(self, timeframe, aggregate, df):
+        """کندل‌های یک تایم‌فریم از منبع دیگر (بافر stream) به جای دریافت از API"""
+        self._frames[(timeframe, str(aggregate))] = (max(len(df), self.FETCH_LIMIT), df)
+        self.live = True
+
+    async def candles(self, timeframe, aggregate, limit=200):
+        key = (timeframe, str(aggregate))
+        view_key = key + (limit,)
+        if view_key in self._views:
+            CANDLE_REQUESTS.inc('reused')
+            return self._views[view_key]
+
+        fetched = self._frames.get(key)
+        if fetched is None or fetched[0] < limit:
+            fetch_limit = max(limit, self.FETCH_LIMIT)
+            df = await self.analysis_engine.get_historical_data(
+                self.token['pool_id'], timeframe, aggregate, limit=fetch_limit,
+                on_network=lambda: self.network_fetches.update([key])
+            )
+            fetched = self._frames[key] = (fetch_limit, df)
+            self.fetch_counts[key] += 1
+            CANDLE_REQUESTS.inc('fetched')
+        else:
+            CANDLE_REQUESTS.inc('reused')
+
+        df = fetched[1]
+        if df is not None and len(df) > limit:
+            # EMAها باید فقط از همان limit کندل محاسبه شوند تا نتیجه با دریافت مستقیم یکی باشد
+            df = with_indicators(df.tail(limit).drop(columns=['ema_50', 'ema_200'], errors='ignore').reset_index(drop=True))
+        self._views[view_key] = df
+        return df
+
+    def repeated_fetches(self):
+        """تایم‌فریم‌هایی که بیش از یک بار دریافت شده‌اند (فقط وقتی limit بیشتر از FETCH_LIMIT خواسته شود)"""
+        return {f"{timeframe}/{aggregate}": count for (timeframe, aggregate), count in self.fetch_counts.items() if count > 1}
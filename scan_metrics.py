@@ -0,0 +1,229 @@
+# scan_metrics.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# مرزهای histogram (ثانیه) از کوئری‌های میلی‌ثانیه‌ای تا چرخه‌های چنددقیقه‌ای
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(label_name, label_value, extra=None):
+    pairs = []
+    if label_name is not None:
+        pairs.append((label_name, label_value))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    """شمارنده تجمعی با حداکثر یک label"""
+
+    def __init__(self, name, documentation, label_name=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label=None, amount=1):
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    def value(self, label=None):
+        return self._values.get(label, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{self.name}{_label_text(self.label_name, label)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """مقدار لحظه‌ای با حداکثر یک label"""
+
+    def set(self, value, label=None):
+        with self._lock:
+            self._values[label] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """histogram با bucketهای ثابت و حداکثر یک label"""
+
+    def __init__(self, name, documentation, label_name=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label -> [bucket counts, sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label=None):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, label=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, label)
+
+    def snapshot(self, label=None):
+        """(تعداد، مجموع) یک سری"""
+        series = self._series.get(label)
+        return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label, (counts, total, count) in sorted(self._series.items(), key=lambda item: str(item[0])):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = _label_text(self.label_name, label, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.label_name, label)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_label_text(self.label_name, label)} {count}")
+        return lines
+
+
+# --- متریک‌های اسکنر ---
+STAGE_SECONDS = Histogram(
+    "dexchart_scan_stage_seconds",
+    "Time spent in each scanner stage (health_fetch, timeframe_selection, analysis, signal_detection, chart_render, telegram_send).",
+    "stage",
+)
+DB_SECONDS = Histogram(
+    "dexchart_db_operation_seconds",
+    "Time spent in DatabaseManager operations.",
+    "operation",
+)
+CYCLE_SECONDS = Histogram(
+    "dexchart_scan_cycle_seconds",
+    "Duration of a full scan cycle.",
+)
+TOKENS_TOTAL = Counter(
+    "dexchart_scan_tokens_total",
+    "Tokens processed by the scanner, by outcome (scanned, skipped, signalled).",
+    "outcome",
+)
+SKIPS_TOTAL = Counter(
+    "dexchart_scan_skips_total",
+    "Tokens skipped without full analysis, by reason.",
+    "reason",
+)
+CYCLES_TOTAL = Counter(
+    "dexchart_scan_cycles_total",
+    "Completed scan cycles.",
+)
+LAST_CYCLE_TOKENS = Gauge(
+    "dexchart_scan_last_cycle_tokens",
+    "Tokens due in the most recent scan cycle.",
+)
+CANDLE_REQUESTS = Counter(
+    "dexchart_scan_candle_requests_total",
+    "Candle requests made through a scan context, by source (fetched, reused).",
+    "source",
+)
+
+
+# --- متریک‌های صف ارسال هشدار ---
+DELIVERY_SECONDS = Histogram(
+    "dexchart_alert_delivery_seconds",
+    "Time from enqueueing an alert to its delivery to Telegram.",
+)
+DELIVERIES_TOTAL = Counter(
+    "dexchart_alert_deliveries_total",
+    "Alert delivery attempts, by outcome (delivered, retried, failed).",
+    "outcome",
+)
+DELIVERY_QUEUE_DEPTH = Gauge(
+    "dexchart_alert_queue_depth",
+    "Alerts waiting in the delivery queue.",
+)
+
+
+# --- متریک‌های شروع مجدد (start = warm با snapshot، cold بدون آن) ---
+TIME_TO_FIRST_CYCLE = Gauge(
+    "dexchart_scanner_time_to_first_cycle_seconds",
+    "Seconds from scanner start to the end of its first scan cycle.",
+    "start",
+)
+TIME_TO_FIRST_SIGNAL = Gauge(
+    "dexchart_scanner_time_to_first_signal_seconds",
+    "Seconds from scanner start to its first queued signal.",
+    "start",
+)
+
+
+# --- متریک‌های حالت stream (candle_stream) ---
+STREAM_UPDATES = Counter(
+    "dexchart_stream_updates_total",
+    "Updates received from the real-time candle source, by kind (trade, candle, late, untracked).",
+    "kind",
+)
+STREAM_EVALUATIONS = Counter(
+    "dexchart_stream_evaluations_total",
+    "Signal checks run by the streaming scanner, by trigger (candle_close, zone_tick).",
+    "trigger",
+)
+STREAM_SIGNAL_SECONDS = Histogram(
+    "dexchart_stream_signal_seconds",
+    "Time from receiving the triggering update to queueing the signal, by trigger.",
+    "trigger",
+)
+
+
+# --- متریک‌های درخواست‌های وب (request_coalescer) ---
+COALESCED_REQUESTS = Counter(
+    "dexchart_coalesced_requests_total",
+    "Chart and AI requests by coalescer and role (leader runs the work, joined waits for it), e.g. chart_joined.",
+    "request",
+)
+
+REGISTRY = [
+    STAGE_SECONDS, DB_SECONDS, CYCLE_SECONDS, TOKENS_TOTAL, SKIPS_TOTAL, CYCLES_TOTAL, LAST_CYCLE_TOKENS, CANDLE_REQUESTS,
+    DELIVERY_SECONDS, DELIVERIES_TOTAL, DELIVERY_QUEUE_DEPTH, TIME_TO_FIRST_CYCLE, TIME_TO_FIRST_SIGNAL,
+    STREAM_UPDATES, STREAM_EVALUATIONS, STREAM_SIGNAL_SECONDS, COALESCED_REQUESTS,
+]
+
+
+def render_metrics():
+    """همه متریک‌ها در فرمت متنی Prometheus (نسخه 0.0.4)"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+# scan_scheduler.py
+import heapq
+import math
+import time
+from config import Config
+
+
+def nearest_zone_distance(analysis_result):
+    """فاصله نسبی قیمت فعلی تا نزدیک‌ترین zone از Tier 1 یا Tier 2 (یا None)"""
+    if not analysis_result:
+        return None
+    current_price = analysis_result['raw_data']['current_price']
+    zones = analysis_result['technical_levels']['zones']
+    distances = []
+    for zone in zones.get('tier1_critical', []) + zones.get('tier2_major', []):
+        zone_price = zone.get('level_price', zone.get('zone_bottom', 0))
+        if zone_price and zone_price > 0:
+            distances.append(abs(current_price - zone_price) / zone_price)
+    return min(distances) if distances else None
+
+
+def recent_volatility(df, window=24):
+    """انحراف معیار بازده کندل‌های اخیر"""
+    if df is None or df.empty or 'close' not in df.columns or len(df) < 3:
+        return None
+    returns = df['close'].tail(window + 1).pct_change().dropna()
+    if returns.empty:
+        return None
+    value = float(returns.std())
+    return None if math.isnan(value) else value
+
+
+def _clamp(value):
+    return max(0.0, min(1.0, value))
+
+
+class ScanScheduler:
+    """
+    زمان‌بندی اسکن بر اساس اولویت: هر توکن یک زمان سررسید دارد که از فاصله تا zone،
+    نوسان اخیر، حجم، سن و سیگنال‌های اخیر محاسبه می‌شود (heap از سررسیدها).
+    """
+
+    # فاصله‌ای که بیرون از آن نزدیکی به zone فوریتی ایجاد نمی‌کند
+    ZONE_PROXIMITY_RANGE = 0.10
+    # نوسان ساعتی که فوریت کامل می‌دهد (5%)
+    VOLATILITY_FULL = 0.05
+    # حجم 24 ساعته (USD) که فوریت کامل می‌دهد
+    VOLUME_FULL = 10_000_000
+    # توکن‌های جوان‌تر از این (روز) مسیر GEM دارند
+    GEM_AGE_DAYS = 5
+
+    def __init__(self, min_interval=None, max_interval=None):
+        self.min_interval = min_interval or Config.SCHEDULER_MIN_INTERVAL
+        self.max_interval = max_interval or Config.SCHEDULER_MAX_INTERVAL
+        self._heap = []
+        # address -> next_due؛ ورودی‌های heap که با این مقدار نمی‌خوانند کهنه‌اند
+        self._due = {}
+        self._intervals = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def compute_interval(self, zone_distance=None, volatility=None, volume_24h=None,
+                         age_days=None, signalled=False, unhealthy=False):
+        """فاصله اسکن بعدی (ثانیه)؛ بیشترین فوریت بین عوامل تعیین‌کننده است"""
+        if unhealthy:
+            return self.max_interval
+
+        urgency = 0.0
+        if signalled:
+            urgency = 1.0
+        if zone_distance is not None:
+            urgency = max(urgency, _clamp(1 - zone_distance / self.ZONE_PROXIMITY_RANGE))
+        if age_days is not None and age_days < self.GEM_AGE_DAYS:
+            # GEMهای جوان: زیر یک روز فوریت کامل، سپس کاهش خطی
+            urgency = max(urgency, _clamp(1 - max(age_days - 1, 0) / (self.GEM_AGE_DAYS - 1)))
+
+        activity = 0.0
+        if volatility is not None:
+            activity += 0.6 * _clamp(volatility / self.VOLATILITY_FULL)
+        if volume_24h:
+            activity += 0.4 * _clamp(math.log10(max(volume_24h, 1)) / math.log10(self.VOLUME_FULL))
+        urgency = max(urgency, activity)
+
+        return round(self.max_interval - (self.max_interval - self.min_interval) * urgency)
+
+    def sync(self, addresses, now=None):
+        """توکن‌های جدید فوراً سررسید می‌شوند و توکن‌هایی که دیگر در لیست نیستند حذف می‌شوند"""
+        now = time.time() if now is None else now
+        addresses = set(addresses)
+        for address in list(self._due):
+            if address not in addresses:
+                del self._due[address]
+                self._intervals.pop(address, None)
+        for address in addresses:
+            if address not in self._due:
+                self._push(address, now)
+
+    def _push(self, address, due_time):
+        self._due[address] = due_time
+        heapq.heappush(self._heap, (due_time, address))
+
+    def pop_due(self, now=None, limit=None):
+        """آدرس توکن‌های سررسید شده به ترتیب قدیمی‌ترین سررسید"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(due) < limit):
+            due_time, address = heapq.heappop(self._heap)
+            if self._due.get(address) != due_time:
+                continue  # ورودی کهنه
+            # تا record یا reschedule دوباره زمان‌بندی نشده؛ اگر هرگز ثبت نشود sync بعدی آن را برمی‌گرداند
+            del self._due[address]
+            due.append(address)
+        return due
+
+    def record(self, address, now=None, **features):
+        """نتیجه اسکن یک توکن را ثبت و سررسید بعدی آن را تعیین می‌کند"""
+        now = time.time() if now is None else now
+        interval = self.compute_interval(**features)
+        self._intervals[address] = interval
+        self._push(address, now + interval)
+        return interval
+
+    def reschedule(self, address, delay, now=None):
+        """سررسید مجدد توکنی که pop شده ولی اسکن نشد (مثلاً lease آن دست worker دیگری است)"""
+        now = time.time() if now is None else now
+        self._push(address, now + delay)
+
+    def next_due_in(self, now=None):
+        """ثانیه تا نزدیک‌ترین سررسید (None اگر چیزی زمان‌بندی نشده)"""
+        now = time.time() if now is None else now
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - now)
+
+    def stats(self):
+        intervals = list(self._intervals.values())
+        return {
+            'tracked': len(self._due),
+            'fast_lane': sum(1 for i in intervals if i <= self.min_interval * 2),
+            'avg_interval': round(sum(intervals) / len(intervals), 1) if intervals else None,
+            'next_due_in': self.next_due_in(),
+        }
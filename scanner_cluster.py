@@ -0,0 +1,122 @@
+# scanner_cluster.py
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "dexchart:scanner"
+
+
+def _hash(value):
+    return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """consistent hashing با virtual node؛ با اضافه/حذف یک worker فقط سهم همان worker جابه‌جا می‌شود"""
+
+    def __init__(self, nodes=(), virtual_nodes=64):
+        self.virtual_nodes = virtual_nodes
+        self.nodes = tuple(sorted(set(nodes)))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(virtual_nodes))
+        self._keys = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key):
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[index]
+
+
+class ScannerCluster:
+    """
+    هماهنگی چند worker اسکنر از طریق Redis: heartbeat در یک sorted set، تقسیم توکن‌ها
+    با consistent hashing بین workerهای زنده، lease برای هر توکن در حال اسکن و claim
+    سراسری هشدارها. client قابل تزریق است (مثلاً fakeredis برای اجرا بدون Redis واقعی).
+    """
+
+    def __init__(self, worker_id=None, redis_client=None, heartbeat_ttl=None, virtual_nodes=64):
+        self.worker_id = worker_id or Config.SCANNER_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.heartbeat_ttl = heartbeat_ttl or Config.SCANNER_HEARTBEAT_TTL
+        self.virtual_nodes = virtual_nodes
+        self.redis = redis_client
+        self.ring = HashRing([self.worker_id], virtual_nodes)
+        self.running = False
+        self._heartbeat_task = None
+        self.workers_key = f"{KEY_PREFIX}:workers"
+
+    async def start(self):
+        if self.redis is None:
+            import redis.asyncio as redis_asyncio
+            self.redis = redis_asyncio.from_url(Config.REDIS_URL, decode_responses=True)
+        self.running = True
+        await self.heartbeat()
+        await self.refresh()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        logger.info(f"🛰️ Scanner worker '{self.worker_id}' joined cluster ({len(self.ring.nodes)} live workers).")
+
+    async def stop(self):
+        self.running = False
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+        try:
+            await self.redis.zrem(self.workers_key, self.worker_id)
+        except Exception as e:
+            logger.error(f"❌ Error leaving scanner cluster: {e}")
+
+    async def heartbeat(self):
+        await self.redis.zadd(self.workers_key, {self.worker_id: time.time()})
+
+    async def _heartbeat_loop(self):
+        while self.running:
+            await asyncio.sleep(self.heartbeat_ttl / 3)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"❌ Scanner heartbeat failed: {e}")
+
+    async def live_workers(self):
+        """workerهایی که heartbeat آن‌ها در بازه TTL است؛ workerهای مرده حذف می‌شوند"""
+        cutoff = time.time() - self.heartbeat_ttl
+        await self.redis.zremrangebyscore(self.workers_key, "-inf", cutoff)
+        workers = await self.redis.zrangebyscore(self.workers_key, cutoff, "+inf")
+        return [w.decode() if isinstance(w, bytes) else w for w in workers]
+
+    async def refresh(self):
+        """بازسازی ring از workerهای زنده؛ سهم workerهای مرده خودکار بین بقیه پخش می‌شود"""
+        workers = await self.live_workers()
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        if tuple(sorted(workers)) != self.ring.nodes:
+            logger.info(f"🛰️ Scanner cluster membership changed: {sorted(workers)}")
+            self.ring = HashRing(workers, self.virtual_nodes)
+        return self.ring.nodes
+
+    def owns(self, address):
+        return self.ring.node_for(address) == self.worker_id
+
+    async def acquire_lease(self, address, ttl):
+        """lease اسکن یک توکن؛ در زمان جابه‌جایی سهم‌ها از اسکن همزمان جلوگیری می‌کند"""
+        return bool(await self.redis.set(f"{KEY_PREFIX}:lease:{address}", self.worker_id, nx=True, ex=int(ttl)))
+
+    async def release_lease(self, address):
+        key = f"{KEY_PREFIX}:lease:{address}"
+        owner = await self.redis.get(key)
+        if owner is not None and (owner.decode() if isinstance(owner, bytes) else owner) == self.worker_id:
+            await self.redis.delete(key)
+
+    async def try_lock(self, name, ttl):
+        """قفل سراسری برای کارهایی که فقط یک worker باید انجام دهد"""
+        return bool(await self.redis.set(f"{KEY_PREFIX}:lock:{name}", self.worker_id, nx=True, ex=int(ttl)))
+
+    async def claim_alert(self, signal, ttl=None):
+        """فقط یک worker می‌تواند هشدار یک توکن/نوع سیگنال را در بازه ttl ارسال کند"""
+        key = f"{KEY_PREFIX}:alert:{signal['token_address']}:{signal.get('signal_type', '')}"
+        ttl = ttl or Config.SCANNER_ALERT_CLAIM_TTL
+        return bool(await self.redis.set(key, self.worker_id, nx=True, ex=int(ttl)))
@@ -0,0 +1,154 @@
+# scanner_snapshot.py
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DXSNAP1\n"
+_HEADER_LEN = struct.Struct(">I")
+
+
+def write_snapshot(path, sections):
+    """
+    نوشتن snapshot: یک header با offset هر بخش و سپس بخش‌ها به صورت pickle فشرده با zlib.
+    فایل ابتدا در یک فایل موقت نوشته و سپس جایگزین می‌شود تا snapshot نیمه‌کاره باقی نماند.
+    """
+    blobs = {name: zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+             for name, value in sections.items()}
+    index, offset = {}, 0
+    for name, blob in blobs.items():
+        index[name] = (offset, len(blob))
+        offset += len(blob)
+    header = pickle.dumps({'created_at': time.time(), 'sections': index}, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # فایل موقت مخصوص این پروسه تا نوشتن‌های همزمان روی یک volume با هم تداخل نکنند
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for blob in blobs.values():
+            f.write(blob)
+    os.replace(tmp_path, path)
+    return len(MAGIC) + _HEADER_LEN.size + len(header) + offset
+
+
+class Snapshot:
+    """snapshot خوانده شده از دیسک؛ فقط header در ابتدا خوانده می‌شود و هر بخش در اولین دسترسی"""
+
+    def __init__(self, path, created_at, sections, data_offset):
+        self.path = path
+        self.created_at = created_at
+        self._sections = sections
+        self._data_offset = data_offset
+        self._loaded = {}
+
+    @classmethod
+    def open(cls, path):
+        """snapshot موجود یا None (فایل نیست یا خراب است)"""
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError("bad magic")
+                (header_len,) = _HEADER_LEN.unpack(f.read(_HEADER_LEN.size))
+                header = pickle.loads(f.read(header_len))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Ignoring unreadable scanner snapshot {path}: {e}")
+            return None
+        return cls(path, header['created_at'], header['sections'], len(MAGIC) + _HEADER_LEN.size + header_len)
+
+    @property
+    def age(self):
+        return time.time() - self.created_at
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def section(self, name, default=None):
+        if name not in self._sections:
+            return default
+        if name not in self._loaded:
+            offset, length = self._sections[name]
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._data_offset + offset)
+                    self._loaded[name] = pickle.loads(zlib.decompress(f.read(length)))
+            except Exception as e:
+                logger.warning(f"⚠️ Snapshot section '{name}' unreadable: {e}")
+                self._loaded[name] = default
+        return self._loaded[name]
+
+
+class ScannerSnapshotter:
+    """
+    ذخیره و بازیابی وضعیت گرم اسکنر بین ری‌استارت‌ها: کش محلی (کندل‌ها، تحلیل‌ها، چارت‌ها)،
+    صف اولویت scheduler، ایندکس سطوح zone trigger و موقعیت چرخه اسکن نیمه‌تمام.
+    """
+
+    def __init__(self, path=None, interval=None, max_age=None):
+        self.path = path or Config.SNAPSHOT_PATH
+        self.interval = interval or Config.SNAPSHOT_INTERVAL
+        self.max_age = max_age or Config.SNAPSHOT_MAX_AGE
+        self.last_saved = 0
+        self.last_size = None
+
+    def collect(self, scanner, shared_cache):
+        """کپی سطحی وضعیت در thread اصلی؛ pickle و فشرده‌سازی بعداً در thread جدا انجام می‌شود"""
+        return {
+            'shared_cache': list(shared_cache._local.items()),
+            'scheduler': {'due': dict(scanner.scheduler._due), 'intervals': dict(scanner.scheduler._intervals)},
+            'zone_trigger': dict(scanner.zone_trigger._entries),
+            'scan_position': list(scanner.pending_addresses),
+        }
+
+    def save(self, sections):
+        started = time.perf_counter()
+        self.last_size = write_snapshot(self.path, sections)
+        self.last_saved = time.time()
+        logger.info(f"💾 Scanner snapshot saved ({self.last_size / 1024:.0f} KB in {time.perf_counter() - started:.2f}s)")
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return now - self.last_saved >= self.interval
+
+    def open(self):
+        """snapshot قابل استفاده یا None اگر وجود ندارد یا قدیمی‌تر از max_age است"""
+        snapshot = Snapshot.open(self.path)
+        if snapshot is not None and snapshot.age > self.max_age:
+            logger.info(f"🗑️ Scanner snapshot is {snapshot.age:.0f}s old - starting cold")
+            return None
+        return snapshot
+
+
+def restore_state(scanner, snapshot):
+    """بازیابی scheduler، zone trigger و موقعیت اسکن (بخش‌های کوچک)؛ تعداد توکن‌های بازیابی شده"""
+    scheduler_state = snapshot.section('scheduler') or {}
+    for address, due_time in scheduler_state.get('due', {}).items():
+        scanner.scheduler._push(address, due_time)
+    scanner.scheduler._intervals.update(scheduler_state.get('intervals', {}))
+    scanner.zone_trigger._entries.update(snapshot.section('zone_trigger') or {})
+
+    # توکن‌های باقی‌مانده از چرخه نیمه‌تمام قبل از همه سررسیدهای دیگر اسکن می‌شوند
+    position = snapshot.section('scan_position') or []
+    first_due = min(scanner.scheduler._due.values(), default=time.time())
+    for i, address in enumerate(position):
+        scanner.scheduler._push(address, first_due - len(position) + i)
+    return len(scheduler_state.get('due', {}))
+
+
+def restore_shared_cache(shared_cache, snapshot):
+    """بازیابی ورودی‌های هنوز معتبر کش محلی؛ ورودی‌های جدیدتر موجود بازنویسی نمی‌شوند"""
+    now = time.time()
+    restored = 0
+    for key, (expires_at, data) in snapshot.section('shared_cache') or []:
+        if expires_at > now and key not in shared_cache._local:
+            shared_cache._local_set(key, data, expires_at - now)
+            restored += 1
+    return restored
@@ -0,0 +1,82 @@
+# scanner_worker.py
+"""
+پروسه مستقل اسکنر: اسکن، صف ارسال هشدار و retention را جدا از سرور وب اجرا می‌کند.
+
+    python -m scanner_worker
+
+سرور وب در این حالت باید با SCANNER_MODE=standalone اجرا شود تا اسکنر دوم راه نیندازد.
+وضعیت و متریک‌ها در جدول service_state منتشر می‌شوند و وب آن‌ها را از همانجا می‌خواند.
+"""
+import asyncio
+import logging
+import signal
+from config import Config
+from database_manager import db_manager
+from background_scanner import BackgroundScanner
+from retention_service import RetentionService
+from scan_metrics import render_metrics
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "scanner"
+
+
+def current_state(scanner, retention_service):
+    return dict(scanner.status(), retention=retention_service.last_report)
+
+
+async def publish_state(scanner, retention_service, interval=None):
+    """انتشار دوره‌ای وضعیت و متریک‌های اسکنر در service_state"""
+    interval = interval or Config.SERVICE_STATE_INTERVAL
+    while True:
+        try:
+            await asyncio.to_thread(
+                db_manager.save_service_state, SERVICE_NAME,
+                current_state(scanner, retention_service), render_metrics()
+            )
+        except Exception as e:
+            logger.error(f"❌ Error publishing scanner state: {e}")
+        await asyncio.sleep(interval)
+
+
+async def main():
+    scanner = BackgroundScanner(bot_token=Config.BOT_TOKEN, chat_id=Config.CHAT_ID)
+    retention_service = RetentionService()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    logger.info("🚀 Standalone scanner worker starting...")
+    scanner_task = asyncio.create_task(scanner.start_scanning())
+    retention_task = asyncio.create_task(retention_service.run_forever())
+    state_task = asyncio.create_task(publish_state(scanner, retention_service))
+
+    await asyncio.wait([scanner_task, asyncio.create_task(stop_event.wait())], return_when=asyncio.FIRST_COMPLETED)
+
+    logger.info("🛑 Stopping scanner worker...")
+    scanner.stop()
+    retention_service.running = False
+    try:
+        # منتظر پایان توکن جاری اسکنر (صف ارسال، snapshot و cluster در finally داخل start_scanning بسته می‌شوند)
+        await asyncio.wait_for(scanner_task, timeout=30)
+    except asyncio.TimeoutError:
+        # wait_for task را لغو کرده و تا پایان پاکسازی آن صبر کرده است
+        logger.warning("⚠️ Scanner did not stop within 30s - cancelled")
+    except Exception as e:
+        logger.error(f"❌ Scanner task ended with error: {e}")
+    retention_task.cancel()
+    state_task.cancel()
+    try:
+        db_manager.save_service_state(SERVICE_NAME, current_state(scanner, retention_service), render_metrics())
+    except Exception as e:
+        logger.error(f"❌ Error publishing final scanner state: {e}")
+    db_manager.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+بنچمارک درج حجیم: executemany با upsert تک‌ردیفی (مسیر قبلی) در برابر DatabaseManager.bulk_upsert
+(COPY + merge در Postgres، INSERT چندردیفی در SQLite) برای 50، 5,000 و 500,000 ردیف.
+
+    python scripts/bench_bulk_ingest.py                      # SQLite موقت
+    DATABASE_URL=postgresql://... python scripts/bench_bulk_ingest.py
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv("DATABASE_URL", "").startswith(("postgresql://", "postgres://")):
+    os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "bench_bulk_ingest.db")
+
+from database_manager import db_manager
+
+TABLE = "bench_trending_tokens"
+COLUMNS = ['address', 'symbol', 'pool_id', 'volume_24h', 'price_usd', 'updated_at']
+
+
+def reset_table():
+    db_manager.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    db_manager.execute(f'''
+        CREATE TABLE {TABLE} (
+            address TEXT PRIMARY KEY,
+            symbol TEXT,
+            pool_id TEXT,
+            volume_24h REAL,
+            price_usd REAL,
+            updated_at TEXT
+        )
+    ''')
+
+
+def make_rows(count, rng):
+    now = datetime.now().isoformat()
+    return [
+        (f"Addr{i:040d}", f"SYM{i % 1000}", f"solana_pool{i}", rng.uniform(0, 1e7), rng.uniform(0, 10), now)
+        for i in range(count)
+    ]
+
+
+def executemany_upsert(rows):
+    p = "%s" if db_manager.is_postgres else "?"
+    query = f"""
+        INSERT INTO {TABLE} ({", ".join(COLUMNS)})
+        VALUES ({", ".join([p] * len(COLUMNS))})
+        ON CONFLICT (address) DO UPDATE SET
+            symbol = EXCLUDED.symbol,
+            pool_id = EXCLUDED.pool_id,
+            volume_24h = EXCLUDED.volume_24h,
+            price_usd = EXCLUDED.price_usd,
+            updated_at = EXCLUDED.updated_at
+    """
+    db_manager.executemany(query, rows)
+
+
+def bulk(rows):
+    db_manager.bulk_upsert(TABLE, COLUMNS, rows, conflict_columns=['address'], update_columns=COLUMNS[1:])
+
+
+def measure(func, rows):
+    reset_table()
+    start = time.perf_counter()
+    func(rows)
+    # دور دوم: همه ردیف‌ها conflict دارند (مسیر update)
+    func(rows)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="50,5000,500000")
+    args = parser.parse_args()
+
+    backend = "postgres" if db_manager.is_postgres else f"sqlite ({db_manager.sqlite_profile})"
+    print(f"Backend: {backend}")
+    rng = random.Random(3)
+    for size in (int(x) for x in args.sizes.split(",")):
+        rows = make_rows(size, rng)
+        legacy = measure(executemany_upsert, rows)
+        fast = measure(bulk, rows)
+        print(f"{size:>8,} rows  executemany {legacy:8.3f}s  bulk_upsert {fast:8.3f}s  "
+              f"({legacy / fast:.1f}x, {2 * size / fast:,.0f} rows/s)")
+    db_manager.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+N کاربر همزمان روی چارت یک توکن و تایم‌فریم (مثل بعد از سیگنال در گروه) با و بدون RequestCoalescer.
+جستجوی pool، دریافت کندل، رندر چارت و فراخوانی Gemini شمرده می‌شوند؛ شبکه و تلگرام شبیه‌سازی شده‌اند.
+
+    python scripts/bench_chart_coalescing.py [--users 40] [--ai 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# دیتابیس موقت و توکن ساختگی - باید قبل از import کردن config تنظیم شوند
+os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "bench_chart_coalescing.db")
+os.environ["BOT_TOKEN"] = "123456:BENCH"
+
+import httpx
+import numpy as np
+
+import webhook_bot
+from analysis_engine import AnalysisEngine
+from request_coalescer import RequestCoalescer
+from shared_cache import shared_cache
+
+TOKEN = "BenchToken1111111111111111111111111111111"
+NETWORK_DELAY = 0.15
+calls = Counter()
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+async def fake_get(self, url, params=None, **kwargs):
+    await asyncio.sleep(NETWORK_DELAY)
+    if "/search/pools" in url:
+        calls['pool_search'] += 1
+        return FakeResponse({'data': [{'id': 'solana_BenchPool', 'attributes': {'name': 'BENCH / SOL', 'volume_usd': {'h24': '1000000'}},
+                                       'relationships': {'base_token': {'data': {'id': f'solana_{TOKEN}'}}}}]})
+    calls['ohlcv'] += 1
+    limit = int(params.get('limit', 100))
+    rng = np.random.default_rng(3)
+    close = np.exp(np.cumsum(rng.normal(0, 0.02, limit))) * 0.01
+    end = int(time.time()) // 3600 * 3600
+    ohlcv = [[end - (limit - 1 - i) * 3600, c, c * 1.02, c * 0.98, c, float(rng.uniform(1e3, 1e5))] for i, c in enumerate(close)]
+    return FakeResponse({'data': {'attributes': {'ohlcv_list': ohlcv[::-1]}}})
+
+
+class FakeBot:
+    async def send_photo(self, **kwargs):
+        calls['photo_sent'] += 1
+
+    async def send_message(self, *args, **kwargs):
+        calls['message_sent'] += 1
+
+
+async def fake_gemini(chart_bytes):
+    calls['gemini'] += 1
+    await asyncio.sleep(1.0)
+    return "AI analysis"
+
+
+async def tap_storm(users, ai_users):
+    calls.clear()
+    shared_cache._local.clear()
+    started = time.perf_counter()
+    requests = [webhook_bot.async_generate_chart(1, i, TOKEN, "hour", "1") for i in range(users)]
+    requests += [webhook_bot.async_ai_analysis(1, i, TOKEN, "hour", "1") for i in range(ai_users)]
+    results = await asyncio.gather(*requests)
+    failed = [result for result in results if "success" not in result and result != "AI analysis completed"]
+    return dict(calls), time.perf_counter() - started, failed
+
+
+async def main(users, ai_users):
+    httpx.AsyncClient.get = fake_get
+    webhook_bot.bot = FakeBot()
+    webhook_bot.ai_analyzer.analyze_chart_with_gemini = fake_gemini
+    create_chart = AnalysisEngine.create_chart
+
+    async def counted_create_chart(self, analysis_result):
+        calls['render'] += 1
+        return await create_chart(self, analysis_result)
+    AnalysisEngine.create_chart = counted_create_chart
+
+    coalesced_run = RequestCoalescer.run
+
+    async def direct_run(self, key, factory):
+        return await factory()
+    RequestCoalescer.run = direct_run
+    baseline = await tap_storm(users, ai_users)
+    RequestCoalescer.run = coalesced_run
+    coalesced = await tap_storm(users, ai_users)
+
+    print(f"\n{users} chart taps + {ai_users} AI taps on the same token/timeframe at once\n")
+    keys = ['pool_search', 'ohlcv', 'render', 'gemini', 'photo_sent']
+    print(f"{'':<14}" + "".join(f"{key:>13}" for key in keys) + f"{'wall s':>9}")
+    for label, (counts, wall, failed) in (("uncoalesced", baseline), ("coalesced", coalesced)):
+        print(f"{label:<14}" + "".join(f"{counts.get(key, 0):>13}" for key in keys) + f"{wall:>9.2f}")
+        if failed:
+            print(f"  ❌ {len(failed)} requests failed: {failed[:3]}")
+            sys.exit(1)
+    if coalesced[0].get('render', 0) > 1:
+        print("❌ Chart rendered more than once with coalescing")
+        sys.exit(1)
+    print("✅ One pool search, analysis and render shared by every tap")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--ai", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.ai))
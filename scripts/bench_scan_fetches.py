@@ -0,0 +1,120 @@
+"""
+شمارش درخواست‌های OHLCV هر توکن در یک اسکن (با و بدون ScanContext) روی GeckoTerminal شبیه‌سازی شده.
+برای توکن جدید (مسیر Gem)، توکن چند روزه (مسیر SMART) و توکن بدون زمان ساخت (probe عمر)
+نشان می‌دهد که با context هر تایم‌فریم حداکثر یک بار در هر اسکن دریافت می‌شود؛ در غیر این صورت exit code 1.
+
+    python scripts/bench_scan_fetches.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# دیتابیس موقت - باید قبل از import کردن config تنظیم شود
+os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "bench_scan_fetches.db")
+
+import httpx
+import numpy as np
+
+from background_scanner import BackgroundScanner
+from run_migrations import run_all_migrations
+from scan_context import ScanContext
+from shared_cache import shared_cache
+
+TIMEFRAME_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400}
+NOW = datetime.now()
+
+TOKENS = [
+    {'address': 'GemToken', 'symbol': 'GEM', 'pool_id': 'solana_GemPool', 'volume_24h': 2_000_000,
+     'pool_created_at': NOW - timedelta(hours=10)},
+    {'address': 'SwingToken', 'symbol': 'SWING', 'pool_id': 'solana_SwingPool', 'volume_24h': 2_000_000,
+     'pool_created_at': NOW - timedelta(days=12)},
+    {'address': 'UnknownAgeToken', 'symbol': 'UNK', 'pool_id': 'solana_UnknownPool', 'volume_24h': 2_000_000,
+     'pool_created_at': None, 'age_days': 45},
+]
+AGE_DAYS = {token['pool_id']: token.get('age_days') or (NOW - token['pool_created_at']).total_seconds() / 86400
+            for token in TOKENS}
+
+requests = Counter()
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+async def fake_get(self, url, params=None, **kwargs):
+    """OHLCV مصنوعی به اندازه عمر pool؛ هر درخواست با (pool، تایم‌فریم) شمرده می‌شود"""
+    parts = urlparse(url).path.split('/')
+    pool_id, timeframe = f"solana_{parts[-3]}", parts[-1]
+    aggregate = int(params.get('aggregate', 1))
+    requests[(pool_id, f"{timeframe}/{aggregate}")] += 1
+
+    step = TIMEFRAME_SECONDS[timeframe] * aggregate
+    available = int(AGE_DAYS[pool_id] * 86400 // step)
+    count = min(int(params.get('limit', 100)), available)
+    rng = np.random.default_rng(zlib.crc32(f"{pool_id}/{timeframe}/{aggregate}".encode()))
+    close = np.exp(np.cumsum(rng.normal(0, 0.02, count))) * 0.01
+    end = int(NOW.timestamp()) // step * step
+    ohlcv = [[end - (count - 1 - i) * step, c, c * 1.01, c * 0.99, c, float(rng.uniform(1e3, 1e5))]
+             for i, c in enumerate(close)]
+    return FakeResponse({'data': {'attributes': {'ohlcv_list': ohlcv[::-1]}}})
+
+
+async def direct_candles(self, timeframe, aggregate, limit=200):
+    """رفتار قبل از ScanContext: هر مصرف کننده با limit خودش درخواست می‌دهد"""
+    self.fetch_counts[(timeframe, str(aggregate))] += 1
+    return await self.analysis_engine.get_historical_data(self.token['pool_id'], timeframe, aggregate, limit=limit)
+
+
+async def scan_all(scanner):
+    requests.clear()
+    for token in TOKENS:
+        shared_cache._local.clear()
+        await scanner._scan_token(dict(token), {})
+    return dict(requests)
+
+
+def report(label, counts):
+    print(f"\n{label}")
+    for token in TOKENS:
+        rows = {tf: n for (pool_id, tf), n in counts.items() if pool_id == token['pool_id']}
+        print(f"  {token['symbol']:<6} total={sum(rows.values()):<3} " + "  ".join(f"{tf}:{n}" for tf, n in sorted(rows.items())))
+
+
+async def main():
+    httpx.AsyncClient.get = fake_get
+    scanner = BackgroundScanner("123456:BENCH", "0")
+    run_all_migrations()
+    scanner.started_at = time.monotonic()
+
+    original = ScanContext.candles
+    ScanContext.candles = direct_candles
+    baseline = await scan_all(scanner)
+    ScanContext.candles = original
+    with_context = await scan_all(scanner)
+
+    report("Without scan context (one request per consumer and limit):", baseline)
+    report("With scan context:", with_context)
+    repeated = {key: n for key, n in with_context.items() if n > 1}
+    print(f"\nRequests: {sum(baseline.values())} -> {sum(with_context.values())}")
+    if repeated:
+        print(f"❌ Timeframes fetched more than once: {repeated}")
+        sys.exit(1)
+    print("✅ Every timeframe fetched at most once per token per scan")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+بنچمارک زمان دیتابیس یک چرخه اسکن روی SQLite:
+پروفایل "default" (کانکشن جدید برای هر کوئری، بدون pragma) در برابر پروفایل "tuned".
+
+    python scripts/bench_sqlite_profile.py --tokens 200 --cycles 3
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = os.path.join(_tmp_dir, "bench_default.db")
+
+from database_manager import DatabaseManager
+from zone_config import zone_bucket
+
+
+def prepare(db, tokens):
+    db.ensure_fibonacci_table()
+    db.ensure_zone_states_table()
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS watchlist_tokens (
+            address TEXT PRIMARY KEY, symbol TEXT, pool_id TEXT, first_seen TEXT, last_active TEXT,
+            status TEXT DEFAULT 'active', last_message_id INTEGER, health_score REAL, last_health_check TEXT
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS alert_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, token_address TEXT, signal_type TEXT,
+            timestamp TEXT, price_at_alert REAL, level_price REAL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_alert_history_cooldown "
+               "ON alert_history (token_address, signal_type, timestamp, price_at_alert)")
+    now = datetime.now().isoformat()
+    db.executemany(
+        "INSERT OR IGNORE INTO watchlist_tokens (address, symbol, pool_id, first_seen, last_active) VALUES (?, ?, ?, ?, ?)",
+        [(address, address[:6], f"solana_{address}", now, now) for address in tokens]
+    )
+
+
+def simulate_cycle(db, tokens, rng, batched):
+    """همان الگوی خواندن/نوشتن scan_token برای هر توکن"""
+    now = datetime.now().isoformat()
+    batch = db.write_batch() if batched else nullcontext()
+    with batch:
+        db.fetchall("SELECT address, symbol, pool_id FROM watchlist_tokens WHERE status = 'active' "
+                    "ORDER BY last_active DESC LIMIT 150")
+        for address in tokens:
+            price = rng.uniform(0.001, 1)
+            db.execute_deferred(
+                "UPDATE watchlist_tokens SET health_score = ?, last_health_check = ? WHERE address = ?",
+                (90.0, now, address)
+            )
+            db.fetchone("SELECT * FROM fibonacci_state WHERE token_address = ? AND timeframe = ?",
+                        (address, "hour_1"))
+            db.execute_deferred(
+                "INSERT OR REPLACE INTO fibonacci_state (token_address, timeframe, high_point, low_point, "
+                "target1_price, target2_price, status) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (address, "hour_1", price * 2, price / 2, price * 2.4, price * 3, 'ACTIVE')
+            )
+            for zone_price in (price * 0.9, price * 1.1, price * 1.3):
+                bucket = zone_bucket(zone_price)
+                db.fetchone(
+                    "SELECT zone_bucket, current_state FROM zone_states WHERE token_address = ? "
+                    "AND zone_bucket IN (?, ?, ?)", (address, bucket - 1, bucket, bucket + 1)
+                )
+                db.execute_deferred(
+                    "INSERT OR REPLACE INTO zone_states (token_address, zone_price, zone_bucket, current_state, "
+                    "last_signal_type, last_signal_time, last_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (address, zone_price, bucket, 'APPROACHING_UP', 'approaching_resistance', now, price)
+                )
+            db.fetchone(
+                "SELECT price_at_alert, timestamp FROM alert_history WHERE token_address = ? AND signal_type = ? "
+                "ORDER BY timestamp DESC LIMIT 1", (address, "resistance_breakout")
+            )
+            db.execute_deferred(
+                "INSERT INTO alert_history (token_address, signal_type, timestamp, price_at_alert, level_price) "
+                "VALUES (?, ?, ?, ?, ?)", (address, "resistance_breakout", now, price, price * 0.95)
+            )
+            db.fetchone("SELECT last_message_id FROM watchlist_tokens WHERE address = ?", (address,))
+            db.execute_deferred("UPDATE watchlist_tokens SET last_message_id = ? WHERE address = ?",
+                                (rng.randint(1, 10**6), address))
+
+
+def run(profile, tokens, cycles, batched):
+    db_path = os.path.join(_tmp_dir, f"bench_{profile}_{'batched' if batched else 'direct'}.db")
+    db = DatabaseManager(db_url=db_path, sqlite_profile=profile)
+    prepare(db, tokens)
+    rng = random.Random(1)
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        simulate_cycle(db, tokens, rng, batched)
+        timings.append(time.perf_counter() - start)
+    db.close()
+    best = min(timings)
+    mode = "batched" if batched else "direct"
+    print(f"{profile:<8} {mode:<8} best cycle {best:.3f}s  ({best / len(tokens) * 1000:.2f} ms/token)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--cycles", type=int, default=3)
+    args = parser.parse_args()
+    tokens = [f"Token{i:040d}" for i in range(args.tokens)]
+
+    results = {}
+    for batched in (False, True):
+        for profile in ("default", "tuned"):
+            results[(profile, batched)] = run(profile, tokens, args.cycles, batched)
+
+    for batched in (False, True):
+        speedup = results[("default", batched)] / results[("tuned", batched)]
+        print(f"🚀 tuned vs default ({'batched' if batched else 'direct'} writes): {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
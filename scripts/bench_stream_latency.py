@@ -0,0 +1,174 @@
+"""
+مقایسه تاخیر سیگنال حالت stream با poll روی یک جریان معاملات مصنوعی یکسان (بدون شبکه).
+هر دو حالت از StreamingScanner و مسیر کامل اسکن BackgroundScanner استفاده می‌کنند و فقط زمان بررسی فرق دارد:
+stream روی بسته شدن کندل و تیک نزدیک zone (با SimulatedCandleSource)، poll هر --interval ثانیه زمان رویداد.
+هر حالت در پروسه و دیتابیس جدا اجرا می‌شود. چون شبیه‌سازی سریع‌تر از زمان واقعی است، cooldownها
+(زمان واقعی) هر نوع سیگنال هر pool را یک بار مجاز می‌کنند؛ سیگنال‌های دو حالت با (pool، نوع) جفت می‌شوند.
+
+    python scripts/bench_stream_latency.py [--pools 6] [--hours 36] [--interval 300]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# دیتابیس موقت هر پروسه - باید قبل از import کردن config تنظیم شود
+if "--mode" in sys.argv:
+    os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "bench_stream_latency.db")
+
+import numpy as np
+
+TRADE_SPACING = 20  # ثانیه بین معاملات مصنوعی
+POOL_AGE_DAYS = 12  # تایم‌فریم 1H
+HOUR = 3600
+
+
+def synthetic_market(pools, hours, seed=7):
+    """تاریخچه کندل‌های 1H تا شروع شبیه‌سازی و معاملات بعد از آن برای هر pool (random walk)"""
+    rng = np.random.default_rng(seed)
+    sim_start = int(time.time()) // HOUR * HOUR - hours * HOUR
+    history, trades = {}, []
+    for index in range(pools):
+        pool_id = f"solana_BenchPool{index}"
+        history_candles = POOL_AGE_DAYS * 24
+        price = 0.01
+        rows = []
+        for i in range(history_candles):
+            prices = price * np.exp(np.cumsum(rng.normal(0, 0.006, HOUR // TRADE_SPACING)))
+            rows.append([sim_start - (history_candles - i) * HOUR, price, float(prices.max()), float(prices.min()),
+                         float(prices[-1]), float(rng.uniform(1e4, 1e5))])
+            price = float(prices[-1])
+        history[pool_id] = rows
+        prices = price * np.exp(np.cumsum(rng.normal(0, 0.006, hours * HOUR // TRADE_SPACING)))
+        volumes = rng.uniform(10, 300, len(prices))
+        trades += [(pool_id, sim_start + i * TRADE_SPACING + 1, float(p), float(v)) for i, (p, v) in enumerate(zip(prices, volumes))]
+    trades.sort(key=lambda trade: trade[1])
+    return sim_start, history, trades
+
+
+async def run_mode(mode, pools, hours, interval):
+    import httpx
+    from background_scanner import BackgroundScanner
+    from candle_stream import SimulatedCandleSource, StreamingScanner, Trade
+    from run_migrations import run_all_migrations
+
+    sim_start, history, raw_trades = synthetic_market(pools, hours)
+    trades = [Trade(*trade) for trade in raw_trades]
+
+    async def fake_get(self, url, params=None, **kwargs):
+        """تاریخچه تا شروع شبیه‌سازی (seed بافرها و health check)"""
+        parts = urlparse(url).path.split('/')
+        rows = history[f"solana_{parts[-3]}"][-int(params.get('limit', 100)):]
+
+        class Response:
+            status_code = 200
+
+            def json(self):
+                return {'data': {'attributes': {'ohlcv_list': rows[::-1]}}}
+        return Response()
+
+    httpx.AsyncClient.get = fake_get
+    scanner = BackgroundScanner("123456:BENCH", "0")
+    run_all_migrations()
+    scanner.started_at = time.monotonic()
+
+    source = SimulatedCandleSource(trades)
+    stream = StreamingScanner(scanner, source)
+    clock = {'now': sim_start}
+    fired = []
+    enqueue = scanner.delivery_queue.enqueue
+
+    def record(signal, chat_id):
+        fired.append({'pool': signal.get('pool_id') or signal.get('token_address'), 'symbol': signal.get('symbol'),
+                      'type': signal.get('signal_type'), 'at': clock['now']})
+        return enqueue(signal, chat_id)
+    scanner.delivery_queue.enqueue = record
+
+    created_at = datetime.now() - timedelta(days=POOL_AGE_DAYS) - timedelta(seconds=time.time() - sim_start)
+    tokens = [{'address': f"BenchToken{i}", 'symbol': f"B{i}", 'pool_id': pool_id, 'volume_24h': 2_000_000,
+               'pool_created_at': created_at} for i, pool_id in enumerate(history)]
+    # هر sync حداکثر SEEDS_PER_SYNC pool جدید اضافه می‌کند (مثل چرخه‌های متوالی اسکنر)
+    while len(stream.buffers) < len(tokens):
+        await stream.sync(tokens)
+
+    wall_started = time.perf_counter()
+    if mode == 'stream':
+        original = source.updates
+
+        async def timed_updates():
+            async for update in original():
+                clock['now'] = update.timestamp
+                yield update
+        source.updates = timed_updates
+        await stream.run()
+    else:
+        next_poll = sim_start + interval
+        for update in trades:
+            while update.timestamp >= next_poll:
+                clock['now'] = next_poll
+                for pool_id in stream.buffers:
+                    await stream.evaluate(pool_id, 'poll', next_poll)
+                next_poll += interval
+            stream.buffers[update.pool_id].apply(update)
+
+    return {
+        'evaluations': stream.evaluations,
+        'full_analyses': scanner.zone_trigger.stats()['triggered'],
+        'wall_seconds': round(time.perf_counter() - wall_started, 1),
+        'signals': fired,
+    }
+
+
+def child(args):
+    result = asyncio.run(run_mode(args.mode, args.pools, args.hours, args.interval))
+    print("RESULT " + json.dumps(result))
+
+
+def parent(args):
+    results = {}
+    for mode in ('poll', 'stream'):
+        command = [sys.executable, os.path.abspath(__file__), "--mode", mode,
+                   "--pools", str(args.pools), "--hours", str(args.hours), "--interval", str(args.interval)]
+        output = subprocess.run(command, capture_output=True, text=True, cwd=tempfile.gettempdir())
+        lines = [line for line in output.stdout.splitlines() if line.startswith("RESULT ")]
+        if not lines:
+            print(output.stdout[-2000:], output.stderr[-4000:])
+            sys.exit(f"{mode} run failed")
+        results[mode] = json.loads(lines[-1][len("RESULT "):])
+
+    print(f"\n{args.pools} pools, {args.hours}h of trades every {TRADE_SPACING}s, poll interval {args.interval}s\n")
+    print(f"{'mode':<8}{'evaluations':>12}{'full analyses':>15}{'signals':>9}{'wall s':>9}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['evaluations']:>12}{result['full_analyses']:>15}{len(result['signals']):>9}{result['wall_seconds']:>9}")
+
+    first = {mode: {} for mode in results}
+    for mode, result in results.items():
+        for signal in result['signals']:
+            first[mode].setdefault((signal['symbol'], signal['type']), signal['at'])
+    matched = sorted(set(first['poll']) & set(first['stream']))
+    leads = np.array([first['poll'][key] - first['stream'][key] for key in matched], dtype=float)
+    print(f"\nMatched signals: {len(matched)} (poll only: {len(set(first['poll']) - set(first['stream']))}, "
+          f"stream only: {len(set(first['stream']) - set(first['poll']))})")
+    for key in matched:
+        print(f"  {key[0]:<5}{key[1]:<26} stream fired {first['poll'][key] - first['stream'][key]:>7.0f}s before poll")
+    if len(leads):
+        print(f"Stream lead over poll (event time): median {np.median(leads):.0f}s, mean {leads.mean():.0f}s, "
+              f"p90 {np.percentile(leads, 90):.0f}s (poll phase alone averages {args.interval / 2:.0f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("poll", "stream"))
+    parser.add_argument("--pools", type=int, default=6)
+    parser.add_argument("--hours", type=int, default=36)
+    parser.add_argument("--interval", type=int, default=300)
+    args = parser.parse_args()
+    child(args) if args.mode else parent(args)
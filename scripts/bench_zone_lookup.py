@@ -0,0 +1,91 @@
+"""
+بنچمارک lookup جدول zone_states با یک میلیون ردیف:
+مقایسه predicate قدیمی (ABS(zone_price - ?) / zone_price) با lookup ایندکس‌دار zone_bucket.
+
+    python scripts/bench_zone_lookup.py --rows 1000000 --tokens 200 --lookups 2000
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# دیتابیس موقت - باید قبل از import کردن config تنظیم شود
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = os.path.join(_tmp_dir, "bench_zone_lookup.db")
+
+from database_manager import db_manager
+from strategy_engine import StrategyEngine
+from zone_config import zone_bucket
+
+LEGACY_QUERY = """
+    SELECT current_state, last_signal_time, last_price
+    FROM zone_states
+    WHERE token_address = ?
+    AND ABS(zone_price - ?) / zone_price < 0.001
+"""
+
+
+def populate(rows, tokens):
+    rng = random.Random(42)
+    addresses = [f"Token{i:05d}" for i in range(tokens)]
+    per_token = rows // tokens
+    samples = []
+    with db_manager.get_connection() as conn:
+        cursor = conn.cursor()
+        for address in addresses:
+            base = rng.uniform(1e-6, 10)
+            prices = set()
+            batch = []
+            while len(batch) < per_token:
+                price = base * math.exp(rng.uniform(-8, 8))
+                bucket = zone_bucket(price)
+                if bucket in prices:
+                    continue
+                prices.add(bucket)
+                batch.append((address, price, bucket, 'IDLE', None, None, price))
+            cursor.executemany(
+                "INSERT INTO zone_states (token_address, zone_price, zone_bucket, current_state, "
+                "last_signal_type, last_signal_time, last_price) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            samples.extend((address, row[1]) for row in rng.sample(batch, min(10, len(batch))))
+        conn.commit()
+        total = cursor.execute("SELECT COUNT(*) FROM zone_states").fetchone()[0]
+    return total, samples
+
+
+def time_lookups(label, func, samples):
+    start = time.perf_counter()
+    for address, price in samples:
+        func(address, price * 1.0003)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(samples)} lookups: total {elapsed:.3f}s, "
+          f"mean {elapsed / len(samples) * 1000:.3f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    engine = StrategyEngine()
+    print(f"⏳ Populating {args.rows:,} zone rows...")
+    total, samples = populate(args.rows, args.tokens)
+    samples = random.Random(7).sample(samples, min(args.lookups, len(samples)))
+    print(f"✅ zone_states rows: {total:,}")
+
+    legacy = time_lookups("legacy", lambda a, p: db_manager.fetchone(LEGACY_QUERY, (a, p)), samples)
+    indexed = time_lookups("indexed", engine.get_zone_state, samples)
+    print(f"🚀 Speedup: {legacy / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
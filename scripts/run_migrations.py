@@ -4,54 +4,262 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config import Config
+from zone_config import zone_bucket
 import logging
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# helperها commit نمی‌کنند و خطا را بالا می‌اندازند؛ هر migration در یک تراکنش اجرا می‌شود (run_all_migrations)
+
 def add_column_if_not_exists(conn, cursor, table_name, column_name, column_type):
+    # در Postgres کوئری خطادار کل تراکنش را خراب می‌کند؛ بررسی داخل savepoint انجام می‌شود
+    cursor.execute("SAVEPOINT column_check")
     try:
         cursor.execute(f"SELECT {column_name} FROM {table_name} LIMIT 0")
+        exists = True
+    except (sqlite3.OperationalError, psycopg2.errors.UndefinedColumn):
+        cursor.execute("ROLLBACK TO SAVEPOINT column_check")
+        exists = False
+    cursor.execute("RELEASE SAVEPOINT column_check")
+    if exists:
         logging.info(f"✅ ستون '{column_name}' از قبل وجود دارد.")
         return
-    except (sqlite3.OperationalError, psycopg2.errors.UndefinedColumn):
-        pass
 
-    try:
-        alter_query = f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"
-        cursor.execute(alter_query)
-        conn.commit()
-        logging.info(f"✅ ستون '{column_name}' اضافه شد.")
-    except Exception as e:
-        logging.error(f"❌ خطا: {e}")
-        conn.rollback()
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+    logging.info(f"✅ ستون '{column_name}' اضافه شد.")
+
+def backfill_zone_buckets(conn, cursor, is_postgres, batch_size=10000):
+    """پر کردن zone_bucket برای ردیف‌های قدیمی و حذف ردیف‌های تکراری در یک bucket"""
+    placeholder = "%s" if is_postgres else "?"
+    cursor.execute("SELECT token_address, zone_price, zone_bucket, last_signal_time FROM zone_states")
+    rows = cursor.fetchall()
+
+    # از هر (token, bucket) فقط جدیدترین ردیف نگه داشته می‌شود
+    keepers = {}
+    duplicates = []
+    updates = []
+    for token_address, zone_price, bucket, last_signal_time in rows:
+        if not zone_price or zone_price <= 0:
+            duplicates.append((token_address, zone_price))
+            continue
+        new_bucket = bucket if bucket is not None else zone_bucket(zone_price)
+        key = (token_address, new_bucket)
+        current = keepers.get(key)
+        if current is None or (last_signal_time or '') > (current[2] or ''):
+            if current is not None:
+                duplicates.append((current[0], current[1]))
+            keepers[key] = (token_address, zone_price, last_signal_time, bucket, new_bucket)
+        else:
+            duplicates.append((token_address, zone_price))
+
+    for token_address, zone_price, _, bucket, new_bucket in keepers.values():
+        if bucket is None:
+            updates.append((new_bucket, token_address, zone_price))
+
+    delete_query = f"DELETE FROM zone_states WHERE token_address = {placeholder} AND zone_price = {placeholder}"
+    update_query = f"UPDATE zone_states SET zone_bucket = {placeholder} WHERE token_address = {placeholder} AND zone_price = {placeholder}"
+    for i in range(0, len(duplicates), batch_size):
+        cursor.executemany(delete_query, duplicates[i:i + batch_size])
+    for i in range(0, len(updates), batch_size):
+        cursor.executemany(update_query, updates[i:i + batch_size])
+    logging.info(f"✅ zone_bucket: {len(updates)} ردیف پر شد، {len(duplicates)} ردیف تکراری حذف شد.")
+
+def create_index_if_not_exists(conn, cursor, index_name, table_name, columns, unique=False, include=None):
+    unique_sql = "UNIQUE " if unique else ""
+    include_sql = f" INCLUDE ({include})" if include else ""
+    cursor.execute(f"CREATE {unique_sql}INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns}){include_sql}")
+    logging.info(f"✅ ایندکس '{index_name}' آماده است.")
+
+def convert_column_to_timestamp(conn, cursor, is_postgres, table_name, column_name):
+    """تبدیل یک ستون ISO TEXT به TIMESTAMP واقعی (فقط Postgres)"""
+    if not is_postgres:
+        # SQLite نوع timestamp بومی ندارد؛ رشته‌های ISO-8601 به ترتیب زمانی sort می‌شوند
+        # و ایندکس‌ها همان‌ها را سرویس می‌دهند
+        logging.info(f"ℹ️ SQLite: ستون '{table_name}.{column_name}' به صورت ISO TEXT باقی می‌ماند.")
+        return
+
+    cursor.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        (table_name, column_name)
+    )
+    row = cursor.fetchone()
+    if not row:
+        logging.warning(f"⚠️ ستون '{table_name}.{column_name}' پیدا نشد.")
+        return
+    if row[0].startswith('timestamp'):
+        logging.info(f"✅ ستون '{table_name}.{column_name}' از قبل TIMESTAMP است.")
+        return
+
+    cursor.execute(
+        f"ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE TIMESTAMP "
+        f"USING NULLIF({column_name}, '')::timestamp"
+    )
+    logging.info(f"✅ ستون '{table_name}.{column_name}' به TIMESTAMP تبدیل شد.")
+
+def create_covering_indexes(conn, cursor, is_postgres):
+    """ایندکس‌های کلیدهای پرتکرار؛ ایندکس cooldown قیمت را هم پوشش می‌دهد تا به جدول نیازی نباشد"""
+    if is_postgres:
+        create_index_if_not_exists(conn, cursor, "idx_alert_history_cooldown", "alert_history",
+                                   "token_address, signal_type, timestamp DESC", include="price_at_alert")
+    else:
+        create_index_if_not_exists(conn, cursor, "idx_alert_history_cooldown", "alert_history",
+                                   "token_address, signal_type, timestamp, price_at_alert")
+    create_index_if_not_exists(conn, cursor, "idx_alert_history_timestamp", "alert_history", "timestamp")
+    create_index_if_not_exists(conn, cursor, "idx_watchlist_status_active", "watchlist_tokens", "status, last_active")
+    create_index_if_not_exists(conn, cursor, "idx_trending_volume", "trending_tokens", "volume_24h")
+    create_index_if_not_exists(conn, cursor, "idx_user_subscriptions_active", "user_subscriptions", "is_active, end_date")
+
+# کوئری‌های داغ برای ثبت query plan قبل و بعد از migration
+HOT_QUERIES = [
+    ("has_recent_alert",
+     "SELECT price_at_alert, timestamp FROM alert_history WHERE token_address = {p} AND signal_type = {p} "
+     "ORDER BY timestamp DESC LIMIT 1", ("So11111111111111111111111111111111111111112", "resistance_breakout")),
+    ("recent_signals", "SELECT * FROM alert_history ORDER BY timestamp DESC LIMIT 5", ()),
+    ("get_watchlist_tokens",
+     "SELECT address, symbol, pool_id FROM watchlist_tokens WHERE status = 'active' "
+     "ORDER BY activity_score DESC, last_active DESC LIMIT {p}", (150,)),
+    ("get_trending_tokens", "SELECT address FROM trending_tokens ORDER BY volume_24h DESC LIMIT {p}", (50,)),
+    ("get_zone_state",
+     "SELECT current_state FROM zone_states WHERE token_address = {p} AND zone_bucket IN ({p}, {p}, {p})",
+     ("So11111111111111111111111111111111111111112", 0, 1, 2)),
+]
+
+def log_query_plans(conn, cursor, is_postgres, label):
+    """ثبت EXPLAIN کوئری‌های داغ در لاگ"""
+    placeholder = "%s" if is_postgres else "?"
+    prefix = "EXPLAIN " if is_postgres else "EXPLAIN QUERY PLAN "
+    plans = {}
+    for name, query, params in HOT_QUERIES:
+        try:
+            cursor.execute(prefix + query.format(p=placeholder), params)
+            rows = cursor.fetchall()
+            # در SQLite ستون آخر متن plan است، در Postgres تنها ستون
+            plans[name] = " | ".join(str(row[-1]) for row in rows)
+        except Exception as e:
+            conn.rollback()
+            plans[name] = f"unavailable ({e})"
+        logging.info(f"📋 [{label}] {name}: {plans[name]}")
+    return plans
+
+def ensure_schema_migrations_table(conn, cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+def get_applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+# --- Migrations (هر نسخه فقط یک بار اجرا می‌شود) ---
+
+def migration_001_level_price(conn, cursor, is_postgres):
+    add_column_if_not_exists(conn, cursor, "alert_history", "level_price", "REAL")
+
+def migration_002_last_message_id(conn, cursor, is_postgres):
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "last_message_id", "INTEGER DEFAULT NULL")
+
+def migration_003_signal_type(conn, cursor, is_postgres):
+    add_column_if_not_exists(conn, cursor, "alert_history", "signal_type", "TEXT")
+
+def migration_004_zone_bucket(conn, cursor, is_postgres):
+    add_column_if_not_exists(conn, cursor, "zone_states", "zone_bucket", "BIGINT")
+    backfill_zone_buckets(conn, cursor, is_postgres)
+    create_index_if_not_exists(conn, cursor, "idx_zone_states_token_bucket",
+                               "zone_states", "token_address, zone_bucket", unique=True)
+
+def migration_005_typed_timestamps(conn, cursor, is_postgres):
+    convert_column_to_timestamp(conn, cursor, is_postgres, "alert_history", "timestamp")
+    convert_column_to_timestamp(conn, cursor, is_postgres, "watchlist_tokens", "first_seen")
+    convert_column_to_timestamp(conn, cursor, is_postgres, "watchlist_tokens", "last_active")
+
+def migration_006_covering_indexes(conn, cursor, is_postgres):
+    create_covering_indexes(conn, cursor, is_postgres)
+
+def migration_007_health_verdicts(conn, cursor, is_postgres):
+    timestamp_type = "TIMESTAMP" if is_postgres else "TEXT"
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "health_score", "REAL")
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "last_health_check", timestamp_type)
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "next_health_check", timestamp_type)
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "health_failures", "INTEGER DEFAULT 0")
+    create_index_if_not_exists(conn, cursor, "idx_watchlist_health_recheck", "watchlist_tokens", "status, next_health_check")
+
+def migration_008_activity_score(conn, cursor, is_postgres):
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "activity_score", "REAL DEFAULT 0")
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "last_price", "REAL")
+    create_index_if_not_exists(conn, cursor, "idx_watchlist_activity", "watchlist_tokens", "status, activity_score")
+
+def migration_009_pool_created_at(conn, cursor, is_postgres):
+    timestamp_type = "TIMESTAMP" if is_postgres else "TEXT"
+    add_column_if_not_exists(conn, cursor, "watchlist_tokens", "pool_created_at", timestamp_type)
+
+MIGRATIONS = [
+    (1, "alert_history.level_price", migration_001_level_price),
+    (2, "watchlist_tokens.last_message_id", migration_002_last_message_id),
+    (3, "alert_history.signal_type", migration_003_signal_type),
+    (4, "zone_states.zone_bucket", migration_004_zone_bucket),
+    (5, "typed alert/watchlist timestamps", migration_005_typed_timestamps),
+    (6, "covering indexes for hot queries", migration_006_covering_indexes),
+    (7, "watchlist_tokens health verdict columns", migration_007_health_verdicts),
+    (8, "watchlist_tokens activity score", migration_008_activity_score),
+    (9, "watchlist_tokens.pool_created_at", migration_009_pool_created_at),
+]
 
 def run_all_migrations():
+    """اجرای migrationهای اعمال نشده به ترتیب؛ با اولین خطا متوقف می‌شود و خطا را بالا می‌اندازد"""
     is_postgres = Config.DATABASE_URL.startswith(('postgresql://', 'postgres://'))
-    
+    placeholder = "%s" if is_postgres else "?"
+
+    if is_postgres:
+        conn = psycopg2.connect(Config.DATABASE_URL)
+    else:
+        # تراکنش‌ها صریحاً با BEGIN باز می‌شوند (ماژول sqlite3 قبل از DDL تراکنش باز نمی‌کند)
+        conn = sqlite3.connect(Config.DATABASE_URL, isolation_level=None)
+
     try:
-        if is_postgres:
-            conn = psycopg2.connect(Config.DATABASE_URL)
-        else:
-            conn = sqlite3.connect(Config.DATABASE_URL)
-            
         cursor = conn.cursor()
         logging.info("🚀 شروع migration...")
 
-        # Migration 1: افزودن level_price
-        add_column_if_not_exists(conn, cursor, "alert_history", "level_price", "REAL")
-        
-        # Migration 2: افزودن last_message_id  
-        add_column_if_not_exists(conn, cursor, "watchlist_tokens", "last_message_id", "INTEGER DEFAULT NULL")
-        
-        # Migration 3: افزودن signal_type
-        add_column_if_not_exists(conn, cursor, "alert_history", "signal_type", "TEXT")
+        ensure_schema_migrations_table(conn, cursor)
+        applied = get_applied_versions(cursor)
+        pending = [m for m in MIGRATIONS if m[0] not in applied]
+        if not pending:
+            logging.info("✅ دیتابیس به‌روز است، migration جدیدی وجود ندارد.")
+            return
 
-        cursor.close()
-        conn.close()
-        logging.info("✅ تمام migration ها کامل شد.")
+        plans_before = log_query_plans(conn, cursor, is_postgres, "before")
+        for version, name, migration in pending:
+            logging.info(f"➡️ Migration {version}: {name}")
+            # تغییرات migration و ثبت نسخه آن با هم commit یا rollback می‌شوند
+            if not is_postgres:
+                cursor.execute("BEGIN")
+            try:
+                migration(conn, cursor, is_postgres)
+                cursor.execute(
+                    f"INSERT INTO schema_migrations (version, name) VALUES ({placeholder}, {placeholder})",
+                    (version, name)
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"❌ Migration {version} شکست خورد: {e}")
+                raise
 
-    except Exception as e:
-        logging.critical(f"❌ خطای اتصال: {e}")
+        plans_after = log_query_plans(conn, cursor, is_postgres, "after")
+        for name in plans_after:
+            if plans_before.get(name) != plans_after[name]:
+                logging.info(f"📈 Plan changed for {name}")
+        logging.info("✅ تمام migration ها کامل شد.")
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    run_all_migrations()
+    try:
+        run_all_migrations()
+    except Exception as e:
+        logging.critical(f"❌ migration متوقف شد: {e}")
+        sys.exit(1)
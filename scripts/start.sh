@@ -0,0 +1,35 @@
+#!/usr/bin/env bash
+# نقطه شروع container. PROCESS_TYPE (یا آرگومان اول):
+#   all      وب و scanner_worker به صورت دو پروسه در همین container (پیش‌فرض)
+#   web      فقط وب؛ اسکنر در سرویس جدا با PROCESS_TYPE=scanner اجرا می‌شود
+#   scanner  فقط scanner_worker (با SCANNER_SHARDING چند replica ممکن است)
+set -u
+role="${1:-${PROCESS_TYPE:-all}}"
+export SCANNER_MODE=standalone
+
+web() {
+    exec uvicorn webhook_bot:app --host 0.0.0.0 --port "${PORT:-8000}" --workers "${WEB_CONCURRENCY:-1}"
+}
+
+case "$role" in
+    web)
+        web ;;
+    scanner)
+        exec python -m scanner_worker ;;
+    all)
+        python -m scanner_worker &
+        scanner=$!
+        web &
+        server=$!
+        # SIGTERM به هر دو پروسه می‌رسد تا scanner_worker صف هشدارها و snapshot را ذخیره کند
+        trap 'kill -TERM "$scanner" "$server" 2>/dev/null' TERM INT
+        # اگر یکی از پروسه‌ها از کار بیفتد دیگری هم متوقف و container ری‌استارت می‌شود
+        wait -n
+        status=$?
+        kill -TERM "$scanner" "$server" 2>/dev/null
+        wait
+        exit "$status" ;;
+    *)
+        echo "Unknown PROCESS_TYPE: $role (expected all, web or scanner)" >&2
+        exit 1 ;;
+esac
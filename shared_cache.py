@@ -0,0 +1,191 @@
+# shared_cache.py
+import logging
+import time
+from collections import OrderedDict
+import msgpack
+import numpy as np
+import pandas as pd
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "dexchart:cache"
+
+# کدهای ext در msgpack
+_EXT_NDARRAY = 1
+_EXT_DATAFRAME = 2
+
+TIMEFRAME_SECONDS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def candle_ttl(timeframe, aggregate, max_ttl=None, now=None):
+    """ثانیه تا بسته شدن کندل جاری (با سقف max_ttl، چون کندل جاری هنوز در حال تغییر است)"""
+    now = time.time() if now is None else now
+    period = TIMEFRAME_SECONDS.get(timeframe, 3600) * max(int(aggregate or 1), 1)
+    ttl = period - (now % period)
+    if max_ttl is not None:
+        ttl = min(ttl, max_ttl)
+    return max(int(ttl), 1)
+
+
+def candle_bucket(timeframe, aggregate, now=None):
+    """شماره کندل جاری؛ برای کلیدهایی که باید با بسته شدن کندل عوض شوند"""
+    now = time.time() if now is None else now
+    period = TIMEFRAME_SECONDS.get(timeframe, 3600) * max(int(aggregate or 1), 1)
+    return int(now // period)
+
+
+# --- codec: msgpack با ext برای آرایه‌های NumPy و DataFrame ---
+
+def _pack_ndarray(array):
+    array = np.ascontiguousarray(array)
+    return msgpack.packb([array.dtype.str, list(array.shape), array.tobytes()], use_bin_type=True)
+
+
+def _unpack_ndarray(data):
+    dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+    return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape).copy()
+
+
+def _default(obj):
+    if isinstance(obj, pd.DataFrame):
+        columns = []
+        for name in obj.columns:
+            values = obj[name].to_numpy()
+            if values.dtype == object:
+                columns.append([name, False, values.tolist()])
+            else:
+                columns.append([name, True, _pack_ndarray(values)])
+        payload = msgpack.packb([columns, _pack_ndarray(obj.index.to_numpy())],
+                                default=_default, use_bin_type=True)
+        return msgpack.ExtType(_EXT_DATAFRAME, payload)
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.tolist()
+        return msgpack.ExtType(_EXT_NDARRAY, _pack_ndarray(obj))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError(f"Cannot cache value of type {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == _EXT_NDARRAY:
+        return _unpack_ndarray(data)
+    if code == _EXT_DATAFRAME:
+        columns, index = msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+        frame = pd.DataFrame({
+            name: (_unpack_ndarray(values) if is_array else values) for name, is_array, values in columns
+        }, index=_unpack_ndarray(index))
+        return frame
+    return msgpack.ExtType(code, data)
+
+
+def encode(value):
+    return msgpack.packb(value, default=_default, use_bin_type=True)
+
+
+def decode(data):
+    # کلیدهای عددی (مثل سطوح فیبوناچی 0.618) مجازند
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+class SharedCache:
+    """
+    کش دو سطحی: LRU درون پروسه جلوی یک لایه Redis مشترک (CACHE_BACKEND=redis).
+    مقادیر به صورت باینری فشرده (msgpack + NumPy) ذخیره می‌شوند، پس هر hit یک نسخه مستقل
+    برمی‌گرداند و تغییر آن روی کش اثری ندارد.
+    """
+
+    # بعد از خطای Redis تا این مدت فقط از کش محلی استفاده می‌شود
+    REDIS_RETRY_AFTER = 30
+
+    def __init__(self, backend=None, local_size=None, redis_client=None):
+        self.backend = (backend or Config.CACHE_BACKEND).lower()
+        self.local_size = local_size or Config.CACHE_LOCAL_SIZE
+        self.redis = redis_client
+        self._local = OrderedDict()
+        self._redis_disabled_until = 0
+        self.hits = {'local': 0, 'redis': 0}
+        self.misses = 0
+
+    def _redis_client(self):
+        if self.backend != 'redis' or time.time() < self._redis_disabled_until:
+            return None
+        if self.redis is None:
+            import redis.asyncio as redis_asyncio
+            self.redis = redis_asyncio.from_url(Config.REDIS_URL)
+        return self.redis
+
+    def _redis_failed(self, error):
+        logger.warning(f"⚠️ Shared cache Redis tier unavailable, using local only for {self.REDIS_RETRY_AFTER}s: {error}")
+        self._redis_disabled_until = time.time() + self.REDIS_RETRY_AFTER
+
+    def _local_get(self, key):
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return data
+
+    def _local_set(self, key, data, ttl):
+        self._local[key] = (time.time() + ttl, data)
+        self._local.move_to_end(key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    async def get(self, key):
+        data = self._local_get(key)
+        if data is not None:
+            self.hits['local'] += 1
+            return decode(data)
+
+        client = self._redis_client()
+        if client is not None:
+            try:
+                full_key = f"{KEY_PREFIX}:{key}"
+                data = await client.get(full_key)
+                if data is not None:
+                    ttl = await client.ttl(full_key)
+                    if ttl and ttl > 0:
+                        self._local_set(key, data, ttl)
+                    self.hits['redis'] += 1
+                    return decode(data)
+            except Exception as e:
+                self._redis_failed(e)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value, ttl):
+        ttl = max(int(ttl), 1)
+        try:
+            data = encode(value)
+        except Exception as e:
+            logger.warning(f"⚠️ Value for '{key}' is not cacheable: {e}")
+            return
+        self._local_set(key, data, ttl)
+        client = self._redis_client()
+        if client is not None:
+            try:
+                await client.set(f"{KEY_PREFIX}:{key}", data, ex=ttl)
+            except Exception as e:
+                self._redis_failed(e)
+
+    def stats(self):
+        return {
+            'backend': self.backend,
+            'local_entries': len(self._local),
+            'hits': dict(self.hits),
+            'misses': self.misses,
+        }
+
+
+shared_cache = SharedCache()
@@ -1,23 +1,179 @@
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import logging
+import time
 from datetime import datetime, timedelta
 from database_manager import db_manager
 from analysis_engine import AnalysisEngine
+from cooldown_ledger import cooldown_ledger
 # --- بخش جدید: ایمپورت کردن تنظیمات ---
 from config import TradingConfig 
 from zone_config import (
     TIER1_APPROACH_THRESHOLD, TIER1_BREAKOUT_THRESHOLD,
     TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD,
-    ZONE_STATES, SIGNAL_PRIORITY
+    ZONE_STATES, SIGNAL_PRIORITY, ZONE_BUCKET_WIDTH, RESET_DISTANCE, zone_bucket
 )
 
+
+def evaluate_zone_transitions(distances, approach, breakout, states, reset_distance=RESET_DISTANCE):
+    """
+    ماشین حالت zoneها برای همه zoneها با یک عملیات آرایه‌ای.
+    distances فاصله نسبی قیمت از هر zone است؛ خروجی (stateهای جدید، نوع سیگنال یا '' برای هر zone).
+    """
+    distances = np.asarray(distances, dtype=float)
+    approach = np.asarray(approach, dtype=float)
+    breakout = np.asarray(breakout, dtype=float)
+    states = np.asarray(states, dtype=object)
+    abs_distances = np.abs(distances)
+
+    broken_up = (distances > breakout) & (distances < reset_distance)
+    broken_down = ~broken_up & (distances < -breakout) & (distances > -reset_distance)
+    near = ~broken_up & ~broken_down & (abs_distances < approach)
+    far = ~broken_up & ~broken_down & ~near & (abs_distances > reset_distance)
+    testing = states == 'TESTING'
+
+    conditions = [
+        broken_up & (states != 'BROKEN_UP'),
+        broken_down & (states != 'BROKEN_DOWN'),
+        near & (distances > 0) & (states != 'APPROACHING_DOWN') & ~testing,
+        near & (distances < 0) & (states != 'APPROACHING_UP') & ~testing,
+        far & (states != 'IDLE'),
+    ]
+    new_states = np.select(
+        conditions, ['BROKEN_UP', 'BROKEN_DOWN', 'APPROACHING_DOWN', 'APPROACHING_UP', 'IDLE'], default=states
+    )
+    signal_types = np.select(
+        conditions[:4], ['resistance_breakout', 'support_breakdown', 'approaching_support', 'approaching_resistance'],
+        default=''
+    )
+    return new_states, signal_types
+
+
+def signal_priorities(tiers, signal_types):
+    """اولویت هر سیگنال zone از SIGNAL_PRIORITY (‎-1 برای zoneهای بدون سیگنال)"""
+    return np.array([
+        SIGNAL_PRIORITY.get(f"{tier}_{'BREAKOUT' if 'break' in signal_type else 'APPROACHING'}", 0)
+        if signal_type else -1
+        for tier, signal_type in zip(tiers, signal_types)
+    ])
+
+
+def timeframe_for_age(age_hours):
+    """تایم‌فریم تحلیل (timeframe, aggregate) بر اساس عمر توکن به ساعت"""
+    age_days = age_hours / 24
+    if age_days < 1:
+        return ("minute", "5")  # توکن خیلی جدید
+    if age_days < 3:
+        return ("minute", "15")
+    if age_days < 30:
+        return ("hour", "1")
+    if age_days < 90:
+        return ("hour", "4")
+    return ("hour", "12")  # بیش از 90 روز
+
+
+def pool_age_hours(pool_created_at, now=None):
+    """عمر pool به ساعت از زمان ساخت ثبت شده (datetime محلی) یا None"""
+    if pool_created_at is None:
+        return None
+    now = now or datetime.now()
+    return max((now - pool_created_at).total_seconds(), 0) / 3600
+
+
+def cooldown_rule(signal_type):
+    """(حداقل تغییر قیمت نسبی، حداقل فاصله زمانی به ساعت) برای هشدار مجدد از یک نوع سیگنال"""
+    if signal_type.startswith('GEM_'):
+        return 0.10, 0.5  # 10% و حداقل 30 دقیقه برای توکن‌های جدید
+    if 'support' in signal_type.lower():
+        return 0.08, 1.0  # 8% برای سیگنال‌های حمایت
+    return 0.09, 2.0  # 9% برای بقیه
+
+
+def gem_signal_frame(df):
+    """
+    شرایط Gem Hunter برای همه کندل‌ها به صورت برداری؛ ستون signal_type نوع سیگنال در هر کندل
+    (با همان ترتیب اولویت detect_gem_momentum_signal) یا '' است.
+    """
+    close, volume = df['close'], df['volume']
+    frame = pd.DataFrame(index=df.index)
+
+    # --- استراتژی ۱: حجم انفجاری (۴ برابر میانگین ۹ کندل قبل) ---
+    avg_volume = volume.shift(1).rolling(9).mean()
+    frame['volume_ratio'] = volume / avg_volume
+    spike = (avg_volume > 0) & (volume > avg_volume * 4)
+
+    # --- استراتژی ۲: شکست پس از تثبیت در ۱۲ کندل اخیر با تایید حجم ---
+    high_12 = df['high'].rolling(12).max()
+    frame['range_pct'] = ((high_12 - df['low'].rolling(12).min()) / close).where(close > 0, 0)
+    avg_volume_range = volume.rolling(12).mean()
+    frame['breakout_volume_ratio'] = volume / avg_volume_range
+    breakout = (frame['range_pct'] < 0.20) & (close > high_12) & (avg_volume_range > 0) & (volume >= avg_volume_range * 2)
+
+    # --- استراتژی ۳: رشد بیش از ۲۰٪ در ۵ کندل ---
+    previous = close.shift(5)
+    frame['growth'] = (close - previous) / previous
+    momentum = (previous > 0) & (frame['growth'] > 0.20)
+
+    # فیلتر روند (قیمت بالای EMA-50) و حداقل ۲۰ کندل
+    eligible = (close >= df['ema_50']) & (np.arange(len(df)) >= 19) if 'ema_50' in df.columns else False
+    frame['signal_type'] = np.select(
+        [eligible & spike, eligible & breakout, eligible & momentum],
+        ['GEM_VOLUME_SPIKE', 'GEM_BREAKOUT', 'GEM_MOMENTUM'], default=''
+    )
+    return frame
+
+
+def pullback_retest_levels(df):
+    """
+    سطح مقاومت pullback/retest تایید شده در هر کندل (NaN اگر الگو نیست)، به صورت برداری
+    با همان پنجره‌های detect_pullback_retest_signal: مقاومت از کندل‌های 30 تا 6 قبل، شکست آن
+    بعد از سقف، پولبک کف 5 کندل اخیر به ±3% سطح و بسته شدن بالای آن.
+    """
+    levels = np.full(len(df), np.nan)
+    if len(df) < 30:
+        return levels
+    highs = sliding_window_view(df['high'].to_numpy(dtype=float), 30)
+    lows = sliding_window_view(df['low'].to_numpy(dtype=float), 30)
+    close = df['close'].to_numpy(dtype=float)[29:]
+
+    resistance = highs[:, :25].max(axis=1)
+    resistance_idx = highs[:, :25].argmax(axis=1)
+    after = np.where(np.arange(30)[None, :] > resistance_idx[:, None], highs, -np.inf).max(axis=1)
+    last_low = lows[:, 25:].min(axis=1)
+
+    confirmed = (
+        (after > resistance)
+        & (last_low <= resistance * 1.03) & (last_low > resistance * 0.97)
+        & (close > resistance)
+    )
+    levels[29:] = np.where(confirmed, resistance, np.nan)
+    return levels
+
+
 class StrategyEngine:
     def __init__(self):
         self.analysis_engine = AnalysisEngine()
         # استفاده از لاگر به جای پرینت
         self.logger = logging.getLogger(__name__)
  
+    def _find_zone_row(self, token_address, zone_price):
+        """پیدا کردن ردیف zone با lookup ایندکس‌دار روی bucket خودش و دو bucket مجاور"""
+        bucket = zone_bucket(zone_price)
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        query = f"""
+            SELECT zone_bucket, current_state, last_signal_time, last_price
+            FROM zone_states
+            WHERE token_address = {placeholder}
+            AND zone_bucket IN ({placeholder}, {placeholder}, {placeholder})
+            AND ABS(zone_price - {placeholder}) / zone_price < {placeholder}
+            ORDER BY ABS(zone_price - {placeholder})
+            LIMIT 1
+        """
+        params = (token_address, bucket - 1, bucket, bucket + 1,
+                  zone_price, ZONE_BUCKET_WIDTH, zone_price)
+        return db_manager.fetchone(query, params)
+
     def get_zone_state(self, token_address, zone_price):
         """دریافت وضعیت فعلی یک zone"""
         # تبدیل numpy types به Python native
@@ -25,14 +181,7 @@ class StrategyEngine:
             zone_price = zone_price.item()
         zone_price = float(zone_price)
         
-        placeholder = "%s" if db_manager.is_postgres else "?"
-        query = f"""
-            SELECT current_state, last_signal_time, last_price 
-            FROM zone_states 
-            WHERE token_address = {placeholder} 
-            AND ABS(zone_price - {placeholder}) / zone_price < 0.001
-        """
-        result = db_manager.fetchone(query, (token_address, zone_price))
+        result = self._find_zone_row(token_address, zone_price)
         return result if result else {'current_state': 'IDLE', 'last_price': 0}
     
     def update_zone_state(self, token_address, zone_price, new_state, signal_type, current_price):
@@ -47,16 +196,26 @@ class StrategyEngine:
         zone_price = float(zone_price)
         current_price = float(current_price)
         
+        # اگر zone از قبل در bucket مجاور ثبت شده، همان شناسه را نگه می‌داریم
+        existing = self._find_zone_row(token_address, zone_price)
+        bucket = existing['zone_bucket'] if existing else zone_bucket(zone_price)
+        
+        params = (token_address, zone_price, bucket, new_state, signal_type, 
+                 datetime.now().isoformat(), current_price)
+        db_manager.execute_deferred(self._zone_state_upsert_query(), params)
+
+    def _zone_state_upsert_query(self):
+        """Upsert یک ردیف zone_states روی (token_address, zone_bucket)"""
         placeholder = "%s" if db_manager.is_postgres else "?"  # این خط مهمه!
         
-        # Upsert query
         if db_manager.is_postgres:
             query = f"""
                 INSERT INTO zone_states 
-                (token_address, zone_price, current_state, last_signal_type, last_signal_time, last_price)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
-                ON CONFLICT (token_address, zone_price) 
+                (token_address, zone_price, zone_bucket, current_state, last_signal_type, last_signal_time, last_price)
+                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                ON CONFLICT (token_address, zone_bucket) 
                 DO UPDATE SET 
+                    zone_price = EXCLUDED.zone_price,
                     current_state = EXCLUDED.current_state,
                     last_signal_type = EXCLUDED.last_signal_type,
                     last_signal_time = EXCLUDED.last_signal_time,
@@ -66,181 +225,181 @@ class StrategyEngine:
         else:
             query = f"""
                 INSERT OR REPLACE INTO zone_states 
-                (token_address, zone_price, current_state, last_signal_type, last_signal_time, last_price)
-                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
+                (token_address, zone_price, zone_bucket, current_state, last_signal_type, last_signal_time, last_price)
+                VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})
             """
-        
-        params = (token_address, zone_price, new_state, signal_type, 
-                 datetime.now().isoformat(), current_price)
-        db_manager.execute(query, params)
+        return query
 
-    async def select_optimal_timeframe(self, pool_id):
+    async def probe_token_age(self, pool_id, context=None):
         """
-        انتخاب تایم‌فریم بهینه بر اساس عمر واقعی توکن
+        تخمین عمر توکن (ساعت) از کندل‌ها، فقط برای poolهایی که زمان ساخت آن‌ها ثبت نشده.
+        برای توکن‌های قدیمی‌تر از پنجره کندل‌ها کران پایین است که برای انتخاب تایم‌فریم کافی است.
         """
-        try:
-            # اول سعی می‌کنیم با داده 1 ساعته عمر رو تخمین بزنیم
-            df_1h = await self.analysis_engine.get_historical_data(
-                pool_id, "hour", "1", limit=500
-            )
-            
-            if df_1h is None or df_1h.empty:
+        df_1h = await self.analysis_engine.get_historical_data(pool_id, "hour", "1", limit=500, context=context)
+        if df_1h is None or df_1h.empty:
+            return None
+        first_timestamp = df_1h['timestamp'].iloc[0]
+
+        # اگر 500 کندل 1 ساعته داریم = حداقل 20 روز عمر؛ تاریخچه روزانه عمق بیشتری دارد
+        if len(df_1h) >= 500:
+            df_daily = await self.analysis_engine.get_historical_data(pool_id, "day", "1", limit=100, context=context)
+            if df_daily is not None and not df_daily.empty:
+                first_timestamp = min(first_timestamp, df_daily['timestamp'].iloc[0])
+        return max(time.time() - float(first_timestamp), 0) / 3600
+
+    async def select_optimal_timeframe(self, pool_id, pool_created_at=None, context=None):
+        """
+        انتخاب تایم‌فریم بهینه بر اساس عمر توکن: ((timeframe, aggregate), عمر به ساعت).
+        با زمان ساخت ثبت شده بدون درخواست شبکه؛ در غیر این صورت عمر با probe کندل‌ها تخمین زده می‌شود.
+        """
+        age_hours = pool_age_hours(pool_created_at)
+        if age_hours is None:
+            try:
+                age_hours = await self.probe_token_age(pool_id, context)
+            except Exception as e:
+                self.logger.error(f"Error in select_optimal_timeframe: {e}")
+                return ("hour", "4"), None
+            if age_hours is None:
                 return None, None
-            
-            # اگر 500 کندل 1 ساعته داریم = حداقل 20 روز عمر
-            if len(df_1h) >= 500:
-                # توکن قدیمی - چک کنیم چقدر قدیمیه
-                df_daily = await self.analysis_engine.get_historical_data(
-                    pool_id, "day", "1", limit=100
-                )
-                
-                if df_daily is not None and len(df_daily) >= 90:
-                    # بیش از 90 روز = 12H chart
-                    timeframe_data = ("hour", "12")
-                    self.logger.info(f"📉 Old token (90+ days) → Using 12H chart")
-                elif df_daily is not None and len(df_daily) >= 30:
-                    # 30-90 روز = 4H chart  
-                    timeframe_data = ("hour", "4")
-                    self.logger.info(f"📊 Medium age token (30-90 days) → Using 4H chart")
-                else:
-                    # 20-30 روز = 1H chart
-                    timeframe_data = ("hour", "1")
-                    self.logger.info(f"📈 Recent token (20-30 days) → Using 1H chart")
-            else:
-                # کمتر از 500 کندل 1 ساعته
-                hours_available = len(df_1h)
-                days_available = hours_available / 24
-                
-                if days_available < 1:  # کمتر از 1 روز
-                    timeframe_data = ("minute", "5")
-                    self.logger.info(f"🆕 Very new token ({hours_available}h) → Using 5M chart")
-                elif days_available < 3:  # 1-3 روز
-                    timeframe_data = ("minute", "15")
-                    self.logger.info(f"📱 New token ({days_available:.1f} days) → Using 15M chart")
-                else:  # 3-20 روز
-                    timeframe_data = ("hour", "1")
-                    self.logger.info(f"📈 Recent token ({days_available:.1f} days) → Using 1H chart")
-            
-            return timeframe_data, df_1h
-            
-        except Exception as e:
-            self.logger.error(f"Error in select_optimal_timeframe: {e}")
-            return ("hour", "4"), None
+
+        timeframe_data = timeframe_for_age(age_hours)
+        if context is not None:
+            context.age_hours = age_hours
+        self.logger.debug(f"🕰️ Token age {age_hours / 24:.1f} days → {timeframe_data[1]}{timeframe_data[0][0].upper()} chart")
+        return timeframe_data, age_hours
+
+    def load_zone_states(self, token_zone_prices):
+        """
+        state ذخیره شده همه zoneهای چند توکن با یک کوئری.
+        ورودی {token_address: [zone_price, ...]}؛ خروجی برای هر zone ردیف منطبق
+        (bucket خودش یا مجاور و فاصله کمتر از ZONE_BUCKET_WIDTH، نزدیک‌ترین) یا None.
+        """
+        token_zone_prices = {t: [float(p) for p in prices] for t, prices in token_zone_prices.items() if prices}
+        if not token_zone_prices:
+            return {}
+        buckets = sorted({b + offset for prices in token_zone_prices.values()
+                          for b in map(zone_bucket, prices) for offset in (-1, 0, 1)})
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        query = f"""
+            SELECT token_address, zone_price, zone_bucket, current_state, last_signal_type, last_signal_time, last_price
+            FROM zone_states
+            WHERE token_address IN ({", ".join([placeholder] * len(token_zone_prices))})
+            AND zone_bucket IN ({", ".join([placeholder] * len(buckets))})
+        """
+        rows_by_token = {}
+        for row in db_manager.fetchall(query, tuple(token_zone_prices) + tuple(buckets)):
+            rows_by_token.setdefault(row['token_address'], []).append(row)
+
+        matched = {}
+        for token_address, prices in token_zone_prices.items():
+            rows = rows_by_token.get(token_address, [])
+            if not rows:
+                matched[token_address] = [None] * len(prices)
+                continue
+            zone_prices = np.array(prices)
+            zone_buckets = np.array([zone_bucket(p) for p in prices])
+            row_prices = np.array([row['zone_price'] for row in rows], dtype=float)
+            row_buckets = np.array([row['zone_bucket'] for row in rows])
+            gap = np.abs(zone_prices[:, None] - row_prices[None, :])
+            ok = (np.abs(zone_buckets[:, None] - row_buckets[None, :]) <= 1) & (gap / row_prices[None, :] < ZONE_BUCKET_WIDTH)
+            gap = np.where(ok, gap, np.inf)
+            nearest = gap.argmin(axis=1)
+            matched[token_address] = [
+                rows[j] if np.isfinite(gap[i, j]) else None for i, j in enumerate(nearest)
+            ]
+        return matched
 
     async def detect_breakout_signal(self, analysis_result, token_address):
         """Smart signal detection with state management"""
         if not analysis_result:
             return None
-            
-        metadata = analysis_result['metadata']
-        symbol = metadata['symbol']
-        pool_id = metadata['pool_id']
-        current_price = analysis_result['raw_data']['current_price']
-        
-        # دریافت zones بر اساس tier
-        zones = analysis_result['technical_levels']['zones']
-        tier1_zones = zones.get('tier1_critical', [])
-        tier2_zones = zones.get('tier2_major', [])
-        
-        # فقط Tier 1 و 2 رو بررسی کن
-        all_important_zones = []
-        
-        for zone in tier1_zones:
-            zone['tier'] = 'TIER1'
-            all_important_zones.append(zone)
-            
-        for zone in tier2_zones:
-            zone['tier'] = 'TIER2'
-            all_important_zones.append(zone)
-        
-        # بررسی هر zone
-        for zone in all_important_zones:
-            signal = await self._check_zone_signal(
-                zone, current_price, token_address, pool_id, symbol, analysis_result
-            )
-            if signal:
-                return signal  # اولین سیگنال معتبر رو برگردون
-        
-        return None
+        signals = await self.detect_breakout_signals([(analysis_result, token_address)])
+        return signals.get(token_address)
 
-    async def _check_zone_signal(self, zone, current_price, token_address, pool_id, symbol, analysis_result):
-        """Check if a zone should generate a signal based on state"""
-        from zone_config import (
-            TIER1_APPROACH_THRESHOLD, TIER1_BREAKOUT_THRESHOLD,
-            TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD
-        )
-        
-        # تعیین zone price
-        zone_price = zone.get('level_price', zone.get('zone_bottom', 0))
-        if zone_price <= 0:
-            return None
-            
-        # تعیین thresholds بر اساس tier
-        if zone['tier'] == 'TIER1':
-            approach_threshold = TIER1_APPROACH_THRESHOLD
-            breakout_threshold = TIER1_BREAKOUT_THRESHOLD
-        else:
-            approach_threshold = TIER2_APPROACH_THRESHOLD
-            breakout_threshold = TIER2_BREAKOUT_THRESHOLD
-        
-        # محاسبه فاصله
-        distance = (current_price - zone_price) / zone_price
-        abs_distance = abs(distance)
-        
-        # دریافت state قبلی
-        state_info = self.get_zone_state(token_address, zone_price)
-        current_state = state_info.get('current_state', 'IDLE')
-        last_price = state_info.get('last_price', 0)
-        
-        new_state = current_state
-        signal_type = None
-        
-        # تشخیص وضعیت جدید
-        if distance > breakout_threshold and distance < 0.05:
-            # قیمت بالای zone (شکست رو به بالا)
-            if current_state != 'BROKEN_UP':
-                new_state = 'BROKEN_UP'
-                signal_type = 'resistance_breakout'
-                
-        elif distance < -breakout_threshold and distance > -0.05:
-            # قیمت پایین zone (شکست رو به پایین)
-            if current_state != 'BROKEN_DOWN':
-                new_state = 'BROKEN_DOWN'
-                signal_type = 'support_breakdown'
-                
-        elif abs_distance < approach_threshold:
-            # نزدیک به zone
-            if distance > 0 and current_state not in ['APPROACHING_DOWN', 'TESTING']:
-                new_state = 'APPROACHING_DOWN'
-                signal_type = 'approaching_support'
-            elif distance < 0 and current_state not in ['APPROACHING_UP', 'TESTING']:
-                new_state = 'APPROACHING_UP'
-                signal_type = 'approaching_resistance'
-                
-        elif abs_distance > 0.05:
-            # دور از zone - reset state
-            if current_state != 'IDLE':
-                new_state = 'IDLE'
-        
-        # اگر state تغییر کرد و باید سیگنال بده
-        if new_state != current_state and signal_type:
-            self.update_zone_state(token_address, zone_price, new_state, signal_type, current_price)
-            
-            return {
-                'signal_type': signal_type,
-                'token_address': token_address,
-                'pool_id': pool_id,
-                'symbol': symbol,
-                'current_price': current_price,
-                'zone_price': zone_price,
-                'zone_tier': zone['tier'],
-                'zone_score': zone.get('final_score', zone.get('score', 0)),
-                'distance_percent': abs_distance * 100,
-                'analysis_result': analysis_result,
-                'timestamp': datetime.now().isoformat()
-            }
-        
-        return None
+    async def detect_breakout_signals(self, items):
+        """
+        ارزیابی گروهی zoneهای Tier 1/2 برای یک یا چند توکن: stateها با یک کوئری خوانده،
+        انتقال همه zoneها با یک عملیات آرایه‌ای محاسبه، سیگنال برنده هر توکن بر اساس
+        SIGNAL_PRIORITY انتخاب و stateهای تغییر کرده با یک نوشتن ذخیره می‌شوند.
+        items: [(analysis_result, token_address)] → {token_address: signal یا None}
+        """
+        contexts = []
+        for analysis_result, token_address in items:
+            if not analysis_result:
+                continue
+            zones = analysis_result['technical_levels']['zones']
+            important_zones = []
+            for tier, key in (('TIER1', 'tier1_critical'), ('TIER2', 'tier2_major')):
+                for zone in zones.get(key, []):
+                    zone['tier'] = tier
+                    zone_price = zone.get('level_price', zone.get('zone_bottom', 0))
+                    if zone_price > 0:
+                        important_zones.append((zone, float(zone_price)))
+            contexts.append((analysis_result, token_address, important_zones))
+
+        signals = {token_address: None for _, token_address, _ in contexts}
+        stored = self.load_zone_states({
+            token_address: [price for _, price in zone_list] for _, token_address, zone_list in contexts
+        })
+
+        # آرایه‌های همه zoneهای همه توکن‌ها
+        owners, zone_refs, distances, approach, breakout, states = [], [], [], [], [], []
+        for index, (analysis_result, token_address, zone_list) in enumerate(contexts):
+            current_price = analysis_result['raw_data']['current_price']
+            for (zone, zone_price), row in zip(zone_list, stored.get(token_address, [])):
+                tier1 = zone['tier'] == 'TIER1'
+                owners.append(index)
+                zone_refs.append((zone, zone_price, row))
+                distances.append((current_price - zone_price) / zone_price)
+                approach.append(TIER1_APPROACH_THRESHOLD if tier1 else TIER2_APPROACH_THRESHOLD)
+                breakout.append(TIER1_BREAKOUT_THRESHOLD if tier1 else TIER2_BREAKOUT_THRESHOLD)
+                states.append(row['current_state'] if row else 'IDLE')
+        if not owners:
+            return signals
+
+        new_states, signal_types = evaluate_zone_transitions(distances, approach, breakout, states)
+        priorities = signal_priorities([zone['tier'] for zone, _, _ in zone_refs], signal_types)
+        owners = np.array(owners)
+
+        now = datetime.now().isoformat()
+        writes = []
+        for index, (analysis_result, token_address, _) in enumerate(contexts):
+            positions = np.flatnonzero(owners == index)
+            if not len(positions):
+                continue
+            metadata = analysis_result['metadata']
+            current_price = float(analysis_result['raw_data']['current_price'])
+
+            # اولین zone با بالاترین اولویت برنده است (Tier 1 قبل از Tier 2 در اولویت برابر)
+            winner = positions[priorities[positions].argmax()]
+            if priorities[winner] >= 0:
+                zone, zone_price, row = zone_refs[winner]
+                signal_type = str(signal_types[winner])
+                writes.append((token_address, zone_price, row['zone_bucket'] if row else zone_bucket(zone_price),
+                               new_states[winner], signal_type, now, current_price))
+                signals[token_address] = {
+                    'signal_type': signal_type,
+                    'token_address': token_address,
+                    'pool_id': metadata['pool_id'],
+                    'symbol': metadata['symbol'],
+                    'current_price': current_price,
+                    'zone_price': zone_price,
+                    'zone_tier': zone['tier'],
+                    'zone_score': zone.get('final_score', zone.get('score', 0)),
+                    'distance_percent': abs(distances[winner]) * 100,
+                    'analysis_result': analysis_result,
+                    'timestamp': now
+                }
+
+            # بازگشت به IDLE بعد از دور شدن از zone (بدون سیگنال)
+            for position in positions:
+                zone, zone_price, row = zone_refs[position]
+                if row and new_states[position] == 'IDLE' and states[position] != 'IDLE':
+                    writes.append((token_address, row['zone_price'], row['zone_bucket'], 'IDLE',
+                                   row['last_signal_type'], row['last_signal_time'], current_price))
+
+        db_manager.executemany_deferred(self._zone_state_upsert_query(), writes)
+        return signals
 
     def _check_confluence_signals(self, current_price, supply_zones, demand_zones,
                                 fibonacci_data, token_address, pool_id, symbol):
@@ -350,7 +509,8 @@ class StrategyEngine:
         query = f'''INSERT INTO alert_history (token_address, signal_type, timestamp, price_at_alert, level_price)
                     VALUES ({placeholder}, {placeholder}, {placeholder}, {placeholder}, {placeholder})'''
         try:
-            db_manager.execute(query, params)
+            db_manager.execute_deferred(query, params)
+            await cooldown_ledger.record(signal['token_address'], signal['signal_type'], current_price)
             self.logger.info(f"💾 Alert for {signal['symbol']} at level {level_price:.6f} saved.")
         except Exception as e:
             self.logger.error(f"Error in save_alert for {signal['symbol']}: {e}")
@@ -395,51 +555,18 @@ class StrategyEngine:
         if not self._is_signal_confident(signal):
             return True  # True یعنی "یک هشدار اخیر وجود دارد" که باعث جلوگیری از ارسال می‌شود
 
-        # --- فیلتر شماره ۲: بررسی کول‌داون زمانی و قیمتی (منطق قبلی) ---
-        from datetime import datetime, timedelta
+        # --- فیلتر شماره ۲: بررسی کول‌داون زمانی و قیمتی (از ledger درون حافظه) ---
         signal_type = signal.get('signal_type', '')
         current_price = signal.get('current_price', 0)
 
-        # تعیین درصد تغییر مورد نیاز برای سیگنال جدید
-        if signal_type.startswith('GEM_'):
-            price_change_threshold = 0.10  # 10% برای توکن‌های جدید
-            min_cooldown_hours = 0.5  # حداقل 30 دقیقه
-        elif 'support' in signal_type.lower():
-            price_change_threshold = 0.08  # 8% برای سیگنال‌های حمایت
-            min_cooldown_hours = 1.0
-        else:
-            price_change_threshold = 0.09  # 9% برای بقیه
-            min_cooldown_hours = 2.0
-
-        # دریافت آخرین سیگنال مشابه از دیتابیس
-        placeholder = "%s" if db_manager.is_postgres else "?"
-        query = f"""
-            SELECT price_at_alert, timestamp
-            FROM alert_history
-            WHERE token_address = {placeholder}
-            AND signal_type = {placeholder}
-            ORDER BY timestamp DESC
-            LIMIT 1
-        """
-        params = (signal['token_address'], signal_type)
+        # تعیین درصد تغییر و زمان مورد نیاز برای سیگنال جدید
+        price_change_threshold, min_cooldown_hours = cooldown_rule(signal_type)
 
         try:
-            result = db_manager.fetchone(query, params)
-            self.logger.info(f"🔍 Cooldown check for {signal.get('symbol')}: Result={result}")
-
-            if result:
-                if isinstance(result, dict):
-                    last_price = float(result.get('price_at_alert', 0))
-                    last_timestamp_str = result.get('timestamp', '')
-                else:
-                    last_price = float(result[0]) if result and result[0] else 0
-                    last_timestamp_str = result[1] if result and len(result) > 1 else ''
-
-                if not last_timestamp_str:
-                    return False
-
-                last_timestamp = datetime.fromisoformat(last_timestamp_str)
-                time_passed = (datetime.now() - last_timestamp).total_seconds() / 3600
+            last_alert = await cooldown_ledger.last_alert(signal['token_address'], signal_type)
+            if last_alert:
+                last_price, last_alert_at = last_alert
+                time_passed = (time.time() - last_alert_at) / 3600
 
                 self.logger.info(f"📊 Last: ${last_price:.10f}, Now: ${current_price:.10f}, Time: {time_passed:.1f}h")
 
@@ -462,7 +589,7 @@ class StrategyEngine:
             return False
 
 
-    async def detect_gem_momentum_signal(self, df_gem, token_info, timeframe="minute", aggregate="5"):
+    async def detect_gem_momentum_signal(self, df_gem, token_info, timeframe="minute", aggregate="5", context=None):
         """
         استراتژی اختصاصی و بازنویسی شده برای شکار توکن‌های جدید (Gem Hunter)
         با اعتبارسنجی چندلایه.
@@ -484,53 +611,29 @@ class StrategyEngine:
             return None
 
         analysis_result = await self.analysis_engine.perform_full_analysis(
-            token_info['pool_id'], token_info['address'], timeframe, aggregate, token_info['symbol']
+            token_info['pool_id'], token_info['address'], timeframe, aggregate, token_info['symbol'], context=context
         )
         if not analysis_result:
             return None
 
-        # --- استراتژی ۱: حجم انفجاری (Volume Spike) ---
-        if len(df_gem) >= 10:
-            current_volume = df_gem['volume'].iloc[-1]
-            avg_volume = df_gem['volume'].iloc[-10:-1].mean()
-            if avg_volume > 0 and current_volume > avg_volume * 4:  # حجم ۴ برابر میانگین
-                self.logger.info(f"🚀 {token_info['symbol']}: Volume spike detected! Ratio: {current_volume/avg_volume:.1f}x")
-                return self._create_gem_signal('GEM_VOLUME_SPIKE', token_info, current_price, {
-                    "Volume Ratio": f"{current_volume/avg_volume:.1f}x"
-                }, analysis_result)
-
-        # --- استراتژی ۲: شکست پس از تثبیت (Consolidation Breakout) ---
-        if len(df_gem) >= 12:
-            last_12_candles = df_gem.iloc[-12:]
-            high_1h = last_12_candles['high'].max()
-            low_1h = last_12_candles['low'].min()
-            range_pct = (high_1h - low_1h) / current_price if current_price > 0 else 0
-
-            # شرط ۱: آیا قیمت در یک محدوده تنگ (کمتر از ۲۰٪) تثبیت شده؟
-            if range_pct < 0.20:
-                # شرط ۲: آیا قیمت واقعاً بالاتر از سقف محدوده شکسته است؟ (با یک حاشیه اطمینان ۳٪)
-                if current_price > high_1h:
-                    # شرط ۳ (تایید حجم): آیا حجم فعلی حداقل ۲ برابر میانگین است؟
-                    avg_volume_range = last_12_candles['volume'].mean()
-                    current_volume = df_gem['volume'].iloc[-1]
-                    if avg_volume_range > 0 and current_volume >= avg_volume_range * 2:
-                        self.logger.info(f"💎 {token_info['symbol']}: High-quality Consolidation Breakout detected!")
-                        return self._create_gem_signal('GEM_BREAKOUT', token_info, current_price, {
-                            "Consolidation Range": f"{range_pct:.1%}",
-                            "Volume Ratio": f"{current_volume/avg_volume_range:.1f}x"
-                        }, analysis_result)
-                    else:
-                        self.logger.info(f"⚠️ {token_info['symbol']}: Breakout detected but volume is too low.")
-
-        # --- استراتژی ۳: رشد سریع قیمت (Momentum) ---
-        if len(df_gem) >= 6:
-            price_30m_ago = df_gem['close'].iloc[-6]
-            price_growth = (current_price - price_30m_ago) / price_30m_ago if price_30m_ago > 0 else 0
-            if price_growth > 0.20:  # رشد بیش از ۲۰٪ در ۳۰ دقیقه
-                self.logger.info(f"🚀 {token_info['symbol']}: Rapid growth detected! {price_growth:.1%} in 30min")
-                return self._create_gem_signal('GEM_MOMENTUM', token_info, current_price, {
-                    "30min Growth": f"{price_growth:.1%}"
-                }, analysis_result)
+        # شرایط هر سه استراتژی (حجم انفجاری، شکست پس از تثبیت، رشد سریع) روی آخرین کندل
+        last = gem_signal_frame(df_gem).iloc[-1]
+        if last['signal_type'] == 'GEM_VOLUME_SPIKE':
+            self.logger.info(f"🚀 {token_info['symbol']}: Volume spike detected! Ratio: {last['volume_ratio']:.1f}x")
+            return self._create_gem_signal('GEM_VOLUME_SPIKE', token_info, current_price, {
+                "Volume Ratio": f"{last['volume_ratio']:.1f}x"
+            }, analysis_result)
+        if last['signal_type'] == 'GEM_BREAKOUT':
+            self.logger.info(f"💎 {token_info['symbol']}: High-quality Consolidation Breakout detected!")
+            return self._create_gem_signal('GEM_BREAKOUT', token_info, current_price, {
+                "Consolidation Range": f"{last['range_pct']:.1%}",
+                "Volume Ratio": f"{last['breakout_volume_ratio']:.1f}x"
+            }, analysis_result)
+        if last['signal_type'] == 'GEM_MOMENTUM':
+            self.logger.info(f"🚀 {token_info['symbol']}: Rapid growth detected! {last['growth']:.1%} in 30min")
+            return self._create_gem_signal('GEM_MOMENTUM', token_info, current_price, {
+                "30min Growth": f"{last['growth']:.1%}"
+            }, analysis_result)
 
         self.logger.info(f"❌ {token_info['symbol']}: No valid GEM signal conditions met.")
         return None
@@ -549,33 +652,10 @@ class StrategyEngine:
         df = analysis_result['raw_data']['dataframe']
         current_price = analysis_result['raw_data']['current_price']
         
-        if len(df) < 30:
-            return None
-        
-        # شناسایی سطح مقاومت شکسته شده اخیر
-        recent_data = df.iloc[-30:-5]
-        if recent_data.empty:
-            return None
-            
-        resistance_level = recent_data['high'].max()
-        resistance_idx = recent_data['high'].idxmax()
-        
-        # بررسی شکست سطح
-        data_after_resistance = df.iloc[resistance_idx + 1:]
-        if data_after_resistance.empty or data_after_resistance['high'].max() <= resistance_level:
-            return None
-        
-        # بررسی pullback و retest
-        last_5_candles = df.iloc[-5:]
-        
-        # آیا قیمت به سطح مقاومت پولبک زده؟
-        pullback_occurred = (last_5_candles['low'].min() <= resistance_level * 1.03) and \
-                           (last_5_candles['low'].min() > resistance_level * 0.97)
-        
-        # آیا قیمت در حال حاضر بالاتر از سطح است؟
-        successful_retest = current_price > resistance_level
+        # شکست مقاومت اخیر، پولبک به سطح شکسته شده و تایید حمایت در همان سطح (روی آخرین کندل)
+        resistance_level = pullback_retest_levels(df)[-1] if len(df) >= 30 else np.nan
         
-        if pullback_occurred and successful_retest:
+        if not np.isnan(resistance_level):
             confidence_score = 8  # امتیاز پایه بالا برای این الگو
             
             return {
@@ -1,9 +1,27 @@
+import asyncio
+import threading
+import time
+from config import Config
 from database_manager import db_manager
 from datetime import datetime, timedelta
 
 class SubscriptionManager:
-    def __init__(self):
-        pass
+    def __init__(self, cache_ttl=None):
+        # user_id -> (end_date, زمان کش شدن)؛ فقط اشتراک‌های فعال کش می‌شوند تا فعال‌سازی در
+        # workerهای دیگر (که invalidate محلی آن‌ها را نمی‌بیند) بلافاصله دیده شود
+        self.cache_ttl = Config.SUBSCRIPTION_CACHE_TTL if cache_ttl is None else cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self.running = False
+        self.last_sweep_count = None
+    
+    def invalidate(self, user_id: int = None):
+        """حذف ورودی کش یک کاربر (یا کل کش)"""
+        with self._cache_lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
     
     def activate_subscription(self, user_id: int, subscription_type: str, days: int, activated_by: int):
         """فعال کردن اشتراک کاربر"""
@@ -30,10 +48,11 @@ class SubscriptionManager:
             """
         
         db_manager.execute(query, (user_id, subscription_type, end_date, activated_by))
+        self.invalidate(user_id)
         return True
     
-    def check_subscription(self, user_id: int) -> bool:
-        """بررسی وضعیت اشتراک کاربر"""
+    def _load_end_date(self, user_id: int):
+        """end_date اشتراک فعال کاربر از دیتابیس، یا None"""
         placeholder = "%s" if db_manager.is_postgres else "?"
         
         query = f"""
@@ -44,24 +63,62 @@ class SubscriptionManager:
         result = db_manager.fetchone(query, (user_id,))
         
         if not result:
-            return False
+            return None
         
         end_date_value = result['end_date']
         if isinstance(end_date_value, str):
-            end_date = datetime.fromisoformat(end_date_value)
-        else:
-            end_date = end_date_value
-        if datetime.now() > end_date:
-            # اشتراک منقضی شده
-            self.deactivate_subscription(user_id)
-            return False
+            return datetime.fromisoformat(end_date_value)
+        return end_date_value
+    
+    def check_subscription(self, user_id: int) -> bool:
+        """بررسی وضعیت اشتراک کاربر (اشتراک فعال از کش تا پایان TTL یا end_date، هرکدام زودتر)"""
+        now = time.monotonic()
+        with self._cache_lock:
+            cached = self._cache.get(user_id)
         
-        return True
+        if cached and now - cached[1] < self.cache_ttl and datetime.now() <= cached[0]:
+            return True
+        
+        end_date = self._load_end_date(user_id)
+        # انقضا همین‌جا در حافظه بررسی می‌شود؛ غیرفعال‌سازی در دیتابیس کار sweeper است
+        active = end_date is not None and datetime.now() <= end_date
+        with self._cache_lock:
+            if active:
+                self._cache[user_id] = (end_date, now)
+            else:
+                self._cache.pop(user_id, None)
+        return active
     
     def deactivate_subscription(self, user_id: int):
         """غیرفعال کردن اشتراک"""
         placeholder = "%s" if db_manager.is_postgres else "?"
         query = f"UPDATE user_subscriptions SET is_active = FALSE WHERE user_id = {placeholder}"
         db_manager.execute(query, (user_id,))
+        self.invalidate(user_id)
+    
+    def sweep_expired(self) -> int:
+        """غیرفعال کردن همه اشتراک‌های منقضی شده با یک کوئری"""
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        query = f"""
+            UPDATE user_subscriptions SET is_active = FALSE
+            WHERE is_active = TRUE AND end_date < {placeholder}
+        """
+        count = db_manager.execute(query, (datetime.now(),)) or 0
+        if count > 0:
+            self.invalidate()
+            print(f"🧹 Deactivated {count} expired subscriptions")
+        self.last_sweep_count = count
+        return count
+    
+    async def run_sweeper(self, interval=None):
+        """اجرای دوره‌ای sweep_expired در thread جداگانه"""
+        interval = interval or Config.SUBSCRIPTION_SWEEP_INTERVAL
+        self.running = True
+        while self.running:
+            try:
+                await asyncio.to_thread(self.sweep_expired)
+            except Exception as e:
+                print(f"❌ Subscription sweep failed: {e}")
+            await asyncio.sleep(interval)
 
 subscription_manager = SubscriptionManager()
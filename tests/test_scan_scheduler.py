@@ -0,0 +1,23 @@
+from scan_scheduler import ScanScheduler
+
+
+def test_unrecorded_pop_is_resynced():
+    scheduler = ScanScheduler(min_interval=60, max_interval=1800)
+    scheduler.sync({'a', 'b'}, now=0)
+    assert sorted(scheduler.pop_due(now=0)) == ['a', 'b']
+    scheduler.record('a', now=0)
+
+    # 'b' اسکن نشد (lease، لغو یا خطا) و باید با sync بعدی دوباره سررسید شود
+    scheduler.sync({'a', 'b'}, now=1)
+    assert scheduler.pop_due(now=1) == ['b']
+
+
+def test_reschedule_after_skip():
+    scheduler = ScanScheduler(min_interval=60, max_interval=1800)
+    scheduler.sync({'a'}, now=0)
+    assert scheduler.pop_due(now=0) == ['a']
+    scheduler.reschedule('a', 300, now=0)
+
+    scheduler.sync({'a'}, now=1)
+    assert scheduler.pop_due(now=1) == []
+    assert scheduler.pop_due(now=300) == ['a']
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+from scanner_cluster import HashRing, ScannerCluster
+
+
+class StubRedis:
+    """زیرمجموعه async از دستورهای Redis که ScannerCluster استفاده می‌کند (بدون سرور)"""
+
+    def __init__(self):
+        self.sorted_sets = {}
+        self.values = {}  # key -> (value, expires_at)
+
+    async def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member, None)
+
+    async def zremrangebyscore(self, key, low, high):
+        members = self.sorted_sets.get(key, {})
+        for member, score in list(members.items()):
+            if float(low) <= score <= float(high):
+                del members[member]
+
+    async def zrangebyscore(self, key, low, high):
+        members = self.sorted_sets.get(key, {})
+        return sorted((m for m, score in members.items() if float(low) <= score <= float(high)), key=members.get)
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and await self.get(key) is not None:
+            return None
+        self.values[key] = (value, time.time() + ex if ex else None)
+        return True
+
+    async def get(self, key):
+        value, expires_at = self.values.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.time():
+            del self.values[key]
+            return None
+        return value
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_ring_moves_only_dead_worker_share():
+    addresses = [f"token{i}" for i in range(2000)]
+    before = HashRing(['w1', 'w2', 'w3'])
+    after = HashRing(['w1', 'w2'])
+
+    moved = [a for a in addresses if before.node_for(a) != after.node_for(a)]
+    assert moved
+    # فقط توکن‌های w3 جابه‌جا می‌شوند
+    assert all(before.node_for(a) == 'w3' for a in moved)
+    assert len(moved) == sum(before.node_for(a) == 'w3' for a in addresses)
+
+
+def test_expired_heartbeat_leaves_ring():
+    async def scenario():
+        redis = StubRedis()
+        w1 = ScannerCluster('w1', redis_client=redis, heartbeat_ttl=30)
+        w2 = ScannerCluster('w2', redis_client=redis, heartbeat_ttl=30)
+        await w1.heartbeat()
+        await w2.heartbeat()
+        assert await w1.refresh() == ('w1', 'w2')
+
+        # آخرین heartbeat w2 قدیمی‌تر از TTL است
+        await redis.zadd(w1.workers_key, {'w2': time.time() - 31})
+        assert await w1.live_workers() == ['w1']
+        assert await w1.refresh() == ('w1',)
+        assert all(w1.owns(f"token{i}") for i in range(100))
+    asyncio.run(scenario())
+
+
+def test_lease_ownership():
+    async def scenario():
+        redis = StubRedis()
+        w1 = ScannerCluster('w1', redis_client=redis)
+        w2 = ScannerCluster('w2', redis_client=redis)
+        assert await w1.acquire_lease('token', 60)
+        assert not await w2.acquire_lease('token', 60)
+
+        # فقط صاحب lease می‌تواند آن را آزاد کند
+        await w2.release_lease('token')
+        assert not await w2.acquire_lease('token', 60)
+        await w1.release_lease('token')
+        assert await w2.acquire_lease('token', 60)
+    asyncio.run(scenario())
+
+
+def test_single_alert_claim():
+    async def scenario():
+        redis = StubRedis()
+        workers = [ScannerCluster(f"w{i}", redis_client=redis) for i in range(5)]
+        signal = {'token_address': 'token', 'signal_type': 'resistance_breakout'}
+        claims = await asyncio.gather(*(worker.claim_alert(signal, ttl=60) for worker in workers))
+        assert claims.count(True) == 1
+        # نوع سیگنال دیگر claim جداگانه دارد
+        assert await workers[0].claim_alert(dict(signal, signal_type='support_breakdown'), ttl=60)
+    asyncio.run(scenario())
@@ -0,0 +1,42 @@
+import pytest
+
+from database_manager import WriteBuffer
+
+
+class FlakyDB:
+    """execute_grouped که fail_times بار اول خطا می‌دهد"""
+
+    def __init__(self, fail_times):
+        self.fail_times = fail_times
+        self.committed = []
+
+    def execute_grouped(self, groups):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("database is locked")
+        self.committed.extend((query, params) for query, params_list in groups.items() for params in params_list)
+
+
+def test_flush_retries_once():
+    db = FlakyDB(fail_times=1)
+    buffer = WriteBuffer(db, max_size=100)
+    buffer.add("INSERT INTO t VALUES (?)", (1,))
+
+    assert buffer.flush() == 1
+    assert db.committed == [("INSERT INTO t VALUES (?)", (1,))]
+    assert buffer.size == 0
+
+
+def test_failed_flush_keeps_writes():
+    db = FlakyDB(fail_times=2)
+    buffer = WriteBuffer(db, max_size=100)
+    buffer.add("INSERT INTO t VALUES (?)", (1,))
+
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert buffer.size == 1 and buffer.total_writes == 0
+
+    # نوشتن‌های قبلی با flush بعدی ثبت می‌شوند
+    buffer.add("INSERT INTO t VALUES (?)", (2,))
+    assert buffer.flush() == 2
+    assert [params for _, params in db.committed] == [(1,), (2,)]
@@ -16,6 +16,8 @@ class TokenCache:
         """
         # هوشمندانه نوع کلید اصلی را بر اساس نوع دیتابیس انتخاب می‌کند
         primary_key_type = "SERIAL PRIMARY KEY" if db_manager.is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+        # SQLite نوع timestamp بومی ندارد و رشته ISO ذخیره می‌کند
+        timestamp_type = "TIMESTAMP" if db_manager.is_postgres else "TEXT"
 
         # 1. جدول توکن‌های ترند
         db_manager.execute('''
@@ -35,7 +37,7 @@ class TokenCache:
                 id {primary_key_type},
                 token_address TEXT,
                 alert_type TEXT,
-                timestamp TEXT,
+                timestamp {timestamp_type},
                 price_at_alert REAL,
                 level_price REAL
             )
@@ -54,15 +56,22 @@ class TokenCache:
         ''')
 
         # 5. جدول لیست پیگیری (Watchlist)
-        db_manager.execute('''
+        db_manager.execute(f'''
             CREATE TABLE IF NOT EXISTS watchlist_tokens (
                 address TEXT PRIMARY KEY,
                 symbol TEXT,
                 pool_id TEXT,
-                first_seen TEXT,
-                last_active TEXT,
+                first_seen {timestamp_type},
+                last_active {timestamp_type},
                 status TEXT DEFAULT 'active',
-                last_message_id INTEGER DEFAULT NULL
+                last_message_id INTEGER DEFAULT NULL,
+                health_score REAL,
+                last_health_check {timestamp_type},
+                next_health_check {timestamp_type},
+                health_failures INTEGER DEFAULT 0,
+                activity_score REAL DEFAULT 0,
+                last_price REAL,
+                pool_created_at {timestamp_type}
             )
         ''')
 
@@ -98,6 +107,29 @@ class TokenCache:
             print(f"Error fetching trending tokens: {e}")
         return []
 
+    async def fetch_token_prices(self, addresses, batch_size=30):
+        """قیمت لحظه‌ای چند توکن با endpoint سبک simple/token_price (حداکثر 30 آدرس در هر درخواست)"""
+        prices = {}
+        addresses = list(dict.fromkeys(addresses))
+        try:
+            async with httpx.AsyncClient(timeout=10) as client:
+                for i in range(0, len(addresses), batch_size):
+                    batch = addresses[i:i + batch_size]
+                    url = f"https://api.geckoterminal.com/api/v2/simple/networks/solana/token_price/{','.join(batch)}"
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        print(f"Token price request failed: {response.status_code}")
+                        continue
+                    token_prices = response.json().get('data', {}).get('attributes', {}).get('token_prices', {})
+                    for address, price in token_prices.items():
+                        if price is not None:
+                            prices[address] = float(price)
+        except Exception as e:
+            print(f"Error fetching token prices: {e}")
+        # GeckoTerminal ممکن است آدرس‌ها را lowercase برگرداند
+        lowered = {address.lower(): address for address in addresses}
+        return {lowered.get(address.lower(), address): price for address, price in prices.items()}
+
     def process_trending_data(self, data):
         """Process and save trending data to database with robust volume handling."""
         tokens = []
@@ -132,7 +164,8 @@ class TokenCache:
                     'symbol': token_attrs.get('symbol', 'Unknown'),
                     'pool_id': pool.get('id', ''),
                     'volume_24h': volume_24h, # استفاده از متغیر جدید و مطمئن
-                    'price_usd': float(base_token_price)
+                    'price_usd': float(base_token_price),
+                    'pool_created_at': self._parse_pool_created_at(attributes.get('pool_created_at'))
                 }
                 tokens.append(token_data)
             except (ValueError, TypeError, KeyError) as e:
@@ -162,79 +195,55 @@ class TokenCache:
             ) for token in tokens
         ]
 
-        if db_manager.is_postgres:
-            # سینتکس PostgreSQL برای عملیات "upsert" (update or insert)
-            # از %s به عنوان placeholder استفاده می‌کند
-            query = """
-                INSERT INTO trending_tokens (address, symbol, pool_id, volume_24h, price_usd, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (address) DO UPDATE SET
-                    symbol = EXCLUDED.symbol,
-                    pool_id = EXCLUDED.pool_id,
-                    volume_24h = EXCLUDED.volume_24h,
-                    price_usd = EXCLUDED.price_usd,
-                    updated_at = EXCLUDED.updated_at;
-            """
-        else:
-            # سینتکس SQLite برای همین عملیات
-            # از ? به عنوان placeholder استفاده می‌کند
-            query = """
-                INSERT OR REPLACE INTO trending_tokens (address, symbol, pool_id, volume_24h, price_usd, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?);
-            """
-
-        # ما نیاز به یک متد executemany در db_manager داریم.
-        # فرض می‌کنیم آن را اضافه کرده‌ایم یا خواهیم کرد.
-        # فعلا برای سادگی، در یک تراکنش اجرا می‌کنیم.
+        # در Postgres با COPY و در SQLite با INSERT چندردیفی در یک تراکنش
         try:
-            with db_manager.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.executemany(query, data_to_save)
-                conn.commit()
+            db_manager.bulk_upsert(
+                'trending_tokens',
+                ['address', 'symbol', 'pool_id', 'volume_24h', 'price_usd', 'updated_at'],
+                data_to_save,
+                conflict_columns=['address'],
+                update_columns=['symbol', 'pool_id', 'volume_24h', 'price_usd', 'updated_at']
+            )
             print(f"Saved/Updated {len(tokens)} trending tokens to database")
             self.add_to_watchlist(tokens)
         except Exception as e:
             print(f"Error in save_tokens: {e}")
  
     def add_to_watchlist(self, tokens):
-        """Add tokens to watchlist if not already exists"""
+        """Add tokens to watchlist, or refresh last_active for tokens already in it (status is left to WatchlistManager)"""
         if not tokens:
             return
 
         current_time = datetime.now().isoformat()
         data_to_save = [
             (token['address'], token['symbol'], token['pool_id'], 
-             current_time, current_time) for token in tokens
+             current_time, current_time, 'active',
+             token['pool_created_at'].isoformat() if token.get('pool_created_at') else None) for token in tokens
         ]
 
-        if db_manager.is_postgres:
-            query = """
-                INSERT INTO watchlist_tokens (address, symbol, pool_id, first_seen, last_active, status)
-                VALUES (%s, %s, %s, %s, %s, 'active')
-                ON CONFLICT (address) DO NOTHING
-            """
-        else:
-            query = """
-                INSERT OR IGNORE INTO watchlist_tokens 
-                (address, symbol, pool_id, first_seen, last_active, status)
-                VALUES (?, ?, ?, ?, ?, 'active')
-            """
-
         try:
-            db_manager.executemany(query, data_to_save)
-            print(f"Added {len(tokens)} tokens to watchlist")
+            db_manager.bulk_upsert(
+                'watchlist_tokens',
+                ['address', 'symbol', 'pool_id', 'first_seen', 'last_active', 'status', 'pool_created_at'],
+                data_to_save,
+                conflict_columns=['address'],
+                update_columns=['symbol', 'pool_id', 'last_active', 'pool_created_at'],
+                # زمان ساخت pool ذخیره شده (از API یا probe کندل‌ها) با None پاک نمی‌شود
+                coalesce_columns=['pool_created_at']
+            )
+            print(f"Added/refreshed {len(tokens)} tokens in watchlist")
         except Exception as e:
             print(f"Error in add_to_watchlist: {e}")
 
     def get_watchlist_tokens(self, limit=150):
-        """Get tokens from watchlist, prioritizing recently active ones"""
+        """Get the hot set of the watchlist, highest activity score first"""
         placeholder = '%s' if db_manager.is_postgres else '?'
     
         query = f'''
-            SELECT address, symbol, pool_id, first_seen, last_active, status
+            SELECT address, symbol, pool_id, first_seen, last_active, status, activity_score, pool_created_at
             FROM watchlist_tokens 
             WHERE status = 'active'
-            ORDER BY last_active DESC 
+            ORDER BY activity_score DESC, last_active DESC 
             LIMIT {placeholder}
         '''
     
@@ -248,11 +257,90 @@ class TokenCache:
                 'pool_id': row['pool_id'],
                 'first_seen': row['first_seen'],
                 'last_active': row['last_active'],
-                'status': row['status']
+                'status': row['status'],
+                'activity_score': row['activity_score'],
+                'pool_created_at': self._parse_timestamp(row['pool_created_at'])
             })
     
         return tokens
 
+    def _db_timestamp(self, value):
+        """datetime برای ستون TIMESTAMP در Postgres و رشته ISO در SQLite"""
+        return value if db_manager.is_postgres else value.isoformat()
+
+    def _parse_timestamp(self, value):
+        if value is None or isinstance(value, datetime):
+            return value
+        return datetime.fromisoformat(value)
+
+    def _parse_pool_created_at(self, value):
+        """زمان ساخت pool از GeckoTerminal (ISO با منطقه زمانی) به datetime محلی بدون tz مثل بقیه ستون‌ها"""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).astimezone().replace(tzinfo=None)
+        except (ValueError, AttributeError):
+            return None
+
+    def save_pool_created_at(self, address, created_at):
+        """ثبت زمان ساخت تخمینی (برای poolهایی که GeckoTerminal زمان ساخت آن‌ها را نداده)"""
+        placeholder = '%s' if db_manager.is_postgres else '?'
+        db_manager.execute_deferred(
+            f"UPDATE watchlist_tokens SET pool_created_at = {placeholder} WHERE address = {placeholder}",
+            (self._db_timestamp(created_at), address)
+        )
+
+    def get_health_verdicts(self, addresses):
+        """verdictهای سلامت کش شده برای چند توکن با یک کوئری"""
+        if not addresses:
+            return {}
+        placeholder = '%s' if db_manager.is_postgres else '?'
+        query = f'''
+            SELECT address, status, health_score, last_health_check, next_health_check, health_failures
+            FROM watchlist_tokens
+            WHERE next_health_check IS NOT NULL AND address IN ({", ".join([placeholder] * len(addresses))})
+        '''
+        verdicts = {}
+        for row in db_manager.fetchall(query, tuple(addresses)):
+            verdicts[row['address']] = {
+                'status': row['status'],
+                'health_score': row['health_score'],
+                'health_failures': row['health_failures'] or 0,
+                'last_health_check': self._parse_timestamp(row['last_health_check']),
+                'next_health_check': self._parse_timestamp(row['next_health_check']),
+            }
+        return verdicts
+
+    def save_health_verdict(self, address, verdict):
+        """ثبت verdict سلامت؛ وضعیت توکن هم با آن هماهنگ می‌شود (بازگشت به active پس از بهبود)"""
+        placeholder = '%s' if db_manager.is_postgres else '?'
+        # verdict سالم فقط rugged/warning را به active برمی‌گرداند؛ active/cold دست WatchlistManager است
+        db_manager.execute_deferred(
+            f"""
+            UPDATE watchlist_tokens SET
+                status = CASE WHEN {placeholder} = 'active' AND status NOT IN ('rugged', 'warning') THEN status ELSE {placeholder} END,
+                health_score = {placeholder},
+                last_health_check = {placeholder}, next_health_check = {placeholder}, health_failures = {placeholder}
+            WHERE address = {placeholder}
+            """,
+            (verdict['status'], verdict['status'], verdict['health_score'],
+             self._db_timestamp(verdict['last_health_check']), self._db_timestamp(verdict['next_health_check']),
+             verdict['health_failures'], address)
+        )
+
+    def get_health_recheck_tokens(self, limit=50):
+        """توکن‌های rugged/warning که زمان re-check آن‌ها (طبق backoff) رسیده است"""
+        placeholder = '%s' if db_manager.is_postgres else '?'
+        query = f'''
+            SELECT address, symbol, pool_id, first_seen, last_active, status, pool_created_at
+            FROM watchlist_tokens
+            WHERE status IN ('rugged', 'warning') AND next_health_check <= {placeholder}
+            ORDER BY next_health_check
+            LIMIT {placeholder}
+        '''
+        results = db_manager.fetchall(query, (self._db_timestamp(datetime.now()), limit))
+        return [dict(row, pool_created_at=self._parse_timestamp(row['pool_created_at'])) for row in results]
+
     def get_trending_tokens(self, limit=10):
         """Get trending tokens from database"""
         placeholder = '%s' if db_manager.is_postgres else '?'
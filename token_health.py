@@ -1,10 +1,14 @@
 # token_health.py
 import logging
 from datetime import datetime, timedelta
+from config import Config
 from database_manager import db_manager
 
 logger = logging.getLogger(__name__)
 
+UNHEALTHY_STATUSES = ('rugged', 'warning')
+
+
 class TokenHealthChecker:
     def __init__(self):
         # آستانه‌های جدید طبق نقشه راه
@@ -22,8 +26,10 @@ class TokenHealthChecker:
             return (last_ts - first_ts) / 3600
         return 0
 
-    async def check_token_health(self, token_data, price_history_df):
-        """بررسی جامع سلامت توکن و محاسبه امتیاز نهایی"""
+    async def check_token_health(self, token_data, price_history_df=None, context=None):
+        """بررسی جامع سلامت توکن و محاسبه امتیاز نهایی (کندل‌های 1 ساعته از context اسکن اگر df داده نشود)"""
+        if price_history_df is None and context is not None:
+            price_history_df = await context.candles("hour", "1", limit=100)
         health_score = 100.0
         issues = []
         symbol = token_data.get('symbol', 'N/A')
@@ -66,3 +72,33 @@ class TokenHealthChecker:
             'status': status,
             'issues': issues
         }
+
+    def next_check_delay(self, status, failures):
+        """فاصله تا بررسی بعدی: TTL ثابت برای سالم‌ها، backoff نمایی برای rugged/warning"""
+        if status not in UNHEALTHY_STATUSES:
+            return Config.HEALTH_TTL_HEALTHY
+        # rugged با پایه دو برابر کندتر از warning دوباره بررسی می‌شود
+        base = Config.HEALTH_BACKOFF_BASE * (2 if status == 'rugged' else 1)
+        return min(base * 2 ** min(max(failures - 1, 0), 16), Config.HEALTH_BACKOFF_MAX)
+
+    def build_verdict(self, health_result, previous=None, now=None):
+        """نتیجه health check را به verdict قابل کش (با زمان بررسی بعدی) تبدیل می‌کند"""
+        now = now or datetime.now()
+        status = health_result['status']
+        if status in UNHEALTHY_STATUSES:
+            failures = ((previous or {}).get('health_failures') or 0) + 1
+        else:
+            failures = 0
+        return {
+            'status': status,
+            'health_score': health_result['health_score'],
+            'health_failures': failures,
+            'last_health_check': now,
+            'next_health_check': now + timedelta(seconds=self.next_check_delay(status, failures)),
+        }
+
+    def is_fresh(self, verdict, now=None):
+        """آیا verdict کش شده هنوز معتبر است (زمان re-check نرسیده)؟"""
+        if not verdict or not verdict.get('next_health_check'):
+            return False
+        return (now or datetime.now()) < verdict['next_health_check']
@@ -0,0 +1,154 @@
+# watchlist_manager.py
+import logging
+import math
+from datetime import datetime, timedelta
+from config import Config
+from database_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+# وزن هر عامل در امتیاز فعالیت (جمع = 100)
+WEIGHTS = {'volume': 30, 'price': 20, 'signals': 20, 'health': 15, 'recency': 15}
+# حجم 24 ساعته (USD) که امتیاز کامل حجم می‌دهد
+VOLUME_FULL = 10_000_000
+# تغییر قیمت نسبت به rebalance قبلی که امتیاز کامل قیمت می‌دهد (20%)
+PRICE_MOVE_FULL = 0.20
+# تعداد سیگنال در پنجره که امتیاز کامل سیگنال می‌دهد
+SIGNALS_FULL = 3
+
+# توکن‌هایی که در این مدت در ترندها بوده‌اند حذف نمی‌شوند (حداکثر cold می‌شوند)
+EVICTION_GRACE = timedelta(hours=1)
+
+# وضعیت‌هایی که rebalance بین آن‌ها جابه‌جا می‌کند؛ rugged/warning دست health check است
+MANAGED_STATUSES = ('active', 'cold')
+
+
+def _clamp(value):
+    return max(0.0, min(1.0, value))
+
+
+def _parse_timestamp(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def activity_score(volume_24h=None, price_change=None, signal_count=0, health_score=None, hours_since_active=None):
+    """امتیاز فعالیت 0 تا 100 از حجم، حرکت قیمت، سیگنال‌های اخیر، سلامت و تازگی حضور در ترندها"""
+    score = 0.0
+    if volume_24h:
+        score += WEIGHTS['volume'] * _clamp(math.log10(max(volume_24h, 1)) / math.log10(VOLUME_FULL))
+    if price_change is not None:
+        score += WEIGHTS['price'] * _clamp(abs(price_change) / PRICE_MOVE_FULL)
+    score += WEIGHTS['signals'] * _clamp(signal_count / SIGNALS_FULL)
+    # توکن‌هایی که هنوز health check نشده‌اند امتیاز میانی می‌گیرند
+    score += WEIGHTS['health'] * (_clamp(health_score / 100) if health_score is not None else 0.5)
+    if hours_since_active is not None:
+        score += WEIGHTS['recency'] * _clamp(1 - hours_since_active / Config.WATCHLIST_STALE_HOURS)
+    return round(score, 2)
+
+
+class WatchlistManager:
+    """
+    مدیریت ظرفیت watchlist: همه توکن‌های active/cold امتیازدهی می‌شوند، WATCHLIST_HOT_SIZE
+    توکن برتر active (پوشش اسکنر) و بقیه cold می‌شوند و ضعیف‌ترین توکن‌های بیش از
+    WATCHLIST_MAX_SIZE حذف می‌شوند. بعد از هر دریافت ترندها اجرا می‌شود تا توکن‌های تازه ترند شده ارتقا یابند.
+    """
+
+    def __init__(self, hot_size=None, max_size=None):
+        self.hot_size = hot_size or Config.WATCHLIST_HOT_SIZE
+        self.max_size = max(max_size or Config.WATCHLIST_MAX_SIZE, self.hot_size)
+        self.last_report = None
+
+    def _signal_counts(self, now):
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        cutoff = now - timedelta(days=Config.WATCHLIST_SIGNAL_WINDOW_DAYS)
+        query = f"""
+            SELECT token_address, COUNT(*) AS signal_count FROM alert_history
+            WHERE timestamp >= {placeholder}
+            GROUP BY token_address
+        """
+        rows = db_manager.fetchall(query, (cutoff if db_manager.is_postgres else cutoff.isoformat(),))
+        return {row['token_address']: row['signal_count'] for row in rows}
+
+    def _load_candidates(self):
+        query = f"""
+            SELECT w.address, w.status, w.last_active, w.health_score, w.last_price,
+                   t.volume_24h, t.price_usd, t.updated_at AS trending_updated_at
+            FROM watchlist_tokens w
+            LEFT JOIN trending_tokens t ON t.address = w.address
+            WHERE w.status IN ({", ".join(f"'{s}'" for s in MANAGED_STATUSES)})
+        """
+        return db_manager.fetchall(query)
+
+    def score_candidates(self, rows, signal_counts, now=None):
+        """[(address, score, current_price, status, last_active)] به ترتیب نزولی امتیاز"""
+        now = now or datetime.now()
+        stale_after = timedelta(hours=Config.WATCHLIST_STALE_HOURS)
+        scored = []
+        for row in rows:
+            trending_updated_at = _parse_timestamp(row['trending_updated_at'])
+            # حجم و قیمت جدول ترند فقط تا وقتی توکن اخیراً در ترندها بوده معتبر است
+            fresh = trending_updated_at is not None and now - trending_updated_at < stale_after
+            price = row['price_usd'] if fresh else None
+            price_change = None
+            if price and row['last_price']:
+                price_change = price / row['last_price'] - 1
+            last_active = _parse_timestamp(row['last_active'])
+            score = activity_score(
+                volume_24h=row['volume_24h'] if fresh else None,
+                price_change=price_change,
+                signal_count=signal_counts.get(row['address'], 0),
+                health_score=row['health_score'],
+                hours_since_active=(now - last_active).total_seconds() / 3600 if last_active else None,
+            )
+            scored.append((row['address'], score, price or row['last_price'], row['status'], last_active))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+    def rebalance(self, now=None):
+        """امتیازدهی مجدد، ارتقا/تنزل بین active و cold و حذف مازاد؛ گزارش تغییرات را برمی‌گرداند"""
+        now = now or datetime.now()
+        scored = self.score_candidates(self._load_candidates(), self._signal_counts(now), now)
+
+        updates, evicted, promoted, demoted = [], [], 0, 0
+        for rank, (address, score, price, status, last_active) in enumerate(scored):
+            if rank >= self.max_size and not (last_active and now - last_active < EVICTION_GRACE):
+                evicted.append(address)
+                continue
+            new_status = 'active' if rank < self.hot_size else 'cold'
+            if new_status != status:
+                if new_status == 'active':
+                    promoted += 1
+                else:
+                    demoted += 1
+            updates.append((address, score, price, new_status))
+
+        db_manager.bulk_upsert(
+            'watchlist_tokens',
+            ['address', 'activity_score', 'last_price', 'status'],
+            updates,
+            conflict_columns=['address'],
+            update_columns=['activity_score', 'last_price', 'status']
+        )
+        placeholder = "%s" if db_manager.is_postgres else "?"
+        for i in range(0, len(evicted), 500):
+            chunk = evicted[i:i + 500]
+            db_manager.execute(
+                f"DELETE FROM watchlist_tokens WHERE address IN ({', '.join([placeholder] * len(chunk))})",
+                tuple(chunk)
+            )
+
+        self.last_report = {
+            'hot': min(len(updates), self.hot_size),
+            'cold': max(len(updates) - self.hot_size, 0),
+            'promoted': promoted,
+            'demoted': demoted,
+            'evicted': len(evicted),
+            'finished_at': now.isoformat(),
+        }
+        logger.info(f"📋 Watchlist rebalanced: {self.last_report}")
+        return self.last_report
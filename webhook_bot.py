@@ -5,6 +5,7 @@ print("DEBUG: Attempting to start webhook_bot.py...")
 
 import os
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from telegram import Update, Bot
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from config import Config
@@ -21,64 +22,109 @@ from subscription_manager import subscription_manager
 from ai_analyzer import ai_analyzer
 from analysis_engine import AnalysisEngine
 from background_scanner import BackgroundScanner
+from retention_service import RetentionService
+from scan_metrics import render_metrics
+from shared_cache import shared_cache
+from request_coalescer import RequestCoalescer, candle_key
 
 #<-- PASTE THE CODE BELOW THIS LINE -->
 
+async def resolve_best_pool(token_address: str):
+    """پرحجم‌ترین pool یک توکن از GeckoTerminal؛ نتیجه در کش مشترک نگه داشته می‌شود. (status_code, pool)"""
+    cache_key = f"pool:{token_address}"
+    best_pool = await shared_cache.get(cache_key)
+    if best_pool is not None:
+        return 200, best_pool
+
+    search_url = f"https://api.geckoterminal.com/api/v2/search/pools?query={token_address}"
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        response = await client.get(search_url)
+        if response.status_code != 200:
+            return response.status_code, None
+        pools = response.json().get('data', [])
+        if not pools:
+            return response.status_code, None
+
+    best_pool = pools[0]
+    max_volume = 0
+    for pool in pools:
+        try:
+            volume = float(pool.get('attributes', {}).get('volume_usd', {}).get('h24', 0))
+            if volume > max_volume:
+                max_volume = volume
+                best_pool = pool
+        except:
+            continue
+
+    await shared_cache.set(cache_key, best_pool, Config.CACHE_POOL_TTL)
+    return 200, best_pool
+
+# کاربرانی که همزمان روی یک توکن و تایم‌فریم می‌زنند (مثلاً بعد از سیگنال در گروه) یک تحلیل و رندر مشترک دارند
+chart_requests = RequestCoalescer("chart")
+ai_requests = RequestCoalescer("ai")
+
+async def _build_chart(token_address: str, timeframe: str, aggregate: str):
+    """pool، تحلیل و PNG چارت یک توکن: {'error', 'status_code', 'symbol', 'analysis_result', 'chart_bytes'}"""
+    status_code, best_pool = await resolve_best_pool(token_address)
+    if status_code != 200:
+        return {'error': 'api_error', 'status_code': status_code}
+    if not best_pool:
+        return {'error': 'pool_not_found', 'status_code': status_code}
+
+    pool_id = best_pool['id']
+
+    symbol = "Unknown"
+    try:
+        relationships = best_pool.get('relationships', {})
+        base_token = relationships.get('base_token', {}).get('data', {})
+        if base_token:
+            symbol = base_token.get('id', '').split('_')[-1]
+        if symbol == "Unknown" or not symbol:
+            attributes = best_pool.get('attributes', {})
+            symbol = attributes.get('name', 'Unknown').split('/')[0]
+    except:
+        symbol = "Unknown"
+
+    analysis_engine = AnalysisEngine()
+    analysis_result = await analysis_engine.perform_full_analysis(
+        pool_id, token_address, timeframe, aggregate, symbol
+    )
+    if not analysis_result:
+        return {'error': 'analysis_failed', 'status_code': status_code, 'symbol': symbol}
+
+    chart_bytes = await analysis_engine.get_chart_bytes(analysis_result)
+    if not chart_bytes:
+        return {'error': 'chart_failed', 'status_code': status_code, 'symbol': symbol}
+
+    return {'error': None, 'status_code': status_code, 'symbol': symbol,
+            'analysis_result': analysis_result, 'chart_bytes': chart_bytes}
+
+async def build_chart(token_address: str, timeframe: str, aggregate: str):
+    """_build_chart مشترک بین درخواست‌های همزمان با همان توکن، تایم‌فریم و کندل جاری"""
+    return await chart_requests.run(
+        candle_key(token_address, timeframe, aggregate),
+        lambda: _build_chart(token_address, timeframe, aggregate)
+    )
+
 async def async_generate_chart(chat_id: int, message_id: int, token_address: str, timeframe: str, aggregate: str):
     """Async chart generation logic"""
     try:
-        analysis_engine = AnalysisEngine()
         display_name = f"{aggregate}{timeframe[0].upper()}"
         
-        search_url = f"https://api.geckoterminal.com/api/v2/search/pools?query={token_address}"
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(search_url)
-            if response.status_code != 200:
-                await bot.send_message(chat_id, f"❌ API Error: {response.status_code}", reply_to_message_id=message_id)
-                return "API Error"
-                
-            pools = response.json().get('data', [])
-            if not pools:
-                await bot.send_message(chat_id, "❌ Token not found", reply_to_message_id=message_id)
-                return "Pool not found"
-        
-        best_pool = pools[0]
-        max_volume = 0
-        for pool in pools:
-            try:
-                volume = float(pool.get('attributes', {}).get('volume_usd', {}).get('h24', 0))
-                if volume > max_volume:
-                    max_volume = volume
-                    best_pool = pool
-            except:
-                continue
-                
-        pool_id = best_pool['id']
-        
-        symbol = "Unknown"
-        try:
-            relationships = best_pool.get('relationships', {})
-            base_token = relationships.get('base_token', {}).get('data', {})
-            if base_token:
-                symbol = base_token.get('id', '').split('_')[-1]
-            if symbol == "Unknown" or not symbol:
-                attributes = best_pool.get('attributes', {})
-                symbol = attributes.get('name', 'Unknown').split('/')[0]
-        except:
-            symbol = "Unknown"
-        
-        analysis_result = await analysis_engine.perform_full_analysis(
-            pool_id, token_address, timeframe, aggregate, symbol
-        )
-        
-        if not analysis_result:
+        chart = await build_chart(token_address, timeframe, aggregate)
+        if chart['error'] == 'api_error':
+            await bot.send_message(chat_id, f"❌ API Error: {chart['status_code']}", reply_to_message_id=message_id)
+            return "API Error"
+        if chart['error'] == 'pool_not_found':
+            await bot.send_message(chat_id, "❌ Token not found", reply_to_message_id=message_id)
+            return "Pool not found"
+        if chart['error'] == 'analysis_failed':
             await bot.send_message(chat_id, "❌ Analysis failed", reply_to_message_id=message_id)
             return "Analysis failed"
-            
-        chart_image = await analysis_engine.create_chart(analysis_result)
-        if not chart_image:
+        if chart['error'] == 'chart_failed':
             await bot.send_message(chat_id, "❌ Chart generation failed", reply_to_message_id=message_id)
             return "Chart generation failed"
+        symbol = chart['symbol']
         
         keyboard = [[
             InlineKeyboardButton(
@@ -90,7 +136,7 @@ async def async_generate_chart(chat_id: int, message_id: int, token_address: str
         
         await bot.send_photo(
             chat_id=chat_id,
-            photo=chart_image,
+            photo=chart['chart_bytes'],
             caption=f"📊 {symbol} {display_name} Chart\nContract: `{token_address}`",
             parse_mode='Markdown',
             reply_markup=reply_markup
@@ -106,47 +152,25 @@ async def async_generate_chart(chat_id: int, message_id: int, token_address: str
 async def async_ai_analysis(chat_id: int, message_id: int, token_address: str, timeframe: str, aggregate: str):
     """Async AI analysis logic"""
     try:
-        search_url = f"https://api.geckoterminal.com/api/v2/search/pools?query={token_address}"
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(search_url)
-            if response.status_code != 200:
-                await bot.send_message(chat_id, "❌ Token not found for AI analysis", reply_to_message_id=message_id)
-                return "Token not found"
-                
-            pools = response.json().get('data', [])
-            if not pools:
-                await bot.send_message(chat_id, "❌ Pool not found", reply_to_message_id=message_id)
-                return "Pool not found"
-        
-        best_pool = pools[0]
-        max_volume = 0
-        for pool in pools:
-            try:
-                volume = float(pool.get('attributes', {}).get('volume_usd', {}).get('h24', 0))
-                if volume > max_volume:
-                    max_volume = volume
-                    best_pool = pool
-            except:
-                continue
-                
-        pool_id = best_pool['id']
-        
-        analysis_engine = AnalysisEngine()
-        analysis_result = await analysis_engine.perform_full_analysis(
-            pool_id, token_address, timeframe, aggregate, "AI Analysis"
-        )
-        
-        if not analysis_result:
+        chart = await build_chart(token_address, timeframe, aggregate)
+        if chart['error'] == 'api_error':
+            await bot.send_message(chat_id, "❌ Token not found for AI analysis", reply_to_message_id=message_id)
+            return "Token not found"
+        if chart['error'] == 'pool_not_found':
+            await bot.send_message(chat_id, "❌ Pool not found", reply_to_message_id=message_id)
+            return "Pool not found"
+        if chart['error'] == 'analysis_failed':
             await bot.send_message(chat_id, "❌ Could not generate chart for AI", reply_to_message_id=message_id)
             return "Analysis failed"
-            
-        chart_image = await analysis_engine.create_chart(analysis_result)
-        if not chart_image:
+        if chart['error'] == 'chart_failed':
             await bot.send_message(chat_id, "❌ Chart creation failed", reply_to_message_id=message_id)
             return "Chart creation failed"
             
-        chart_image_bytes = chart_image.getvalue()
-        ai_response = await ai_analyzer.analyze_chart_with_gemini(chart_image_bytes)
+        # پاسخ Gemini برای همان چارت هم بین درخواست‌های همزمان مشترک است
+        ai_response = await ai_requests.run(
+            candle_key(token_address, timeframe, aggregate),
+            lambda: ai_analyzer.analyze_chart_with_gemini(chart['chart_bytes'])
+        )
         
         await bot.send_message(
             chat_id=chat_id,
@@ -188,17 +212,27 @@ async def lifespan(app: FastAPI):
     await application.initialize()
     print("🤖 Telegram application initialized")
     
-    # --- کد جدید برای اجرای اسکنر ---
-    print("🔍 Initializing background scanner...")
-    scanner = BackgroundScanner(
-        bot_token=BOT_TOKEN,
-        chat_id=Config.CHAT_ID
-    )
-    # اسکنر را به عنوان یک تسک پس‌زمینه اجرا می‌کنیم
-    scanner_task = asyncio.create_task(scanner.start_scanning())
-    app.state.scanner_task = scanner_task
-    print("✅ Background scanner started as a separate task.")
-    # --- پایان کد جدید ---
+    if Config.SCANNER_MODE == "standalone":
+        # اسکنر و retention در پروسه جدا (python -m scanner_worker) اجرا می‌شوند
+        print("🔍 Scanner runs as a standalone process (SCANNER_MODE=standalone).")
+    else:
+        # --- کد جدید برای اجرای اسکنر ---
+        print("🔍 Initializing background scanner...")
+        scanner = BackgroundScanner(
+            bot_token=BOT_TOKEN,
+            chat_id=Config.CHAT_ID
+        )
+        # اسکنر را به عنوان یک تسک پس‌زمینه اجرا می‌کنیم
+        scanner_task = asyncio.create_task(scanner.start_scanning())
+        app.state.scanner_task = scanner_task
+        print("✅ Background scanner started as a separate task.")
+        # --- پایان کد جدید ---
+
+        # سرویس retention برای جداول بی‌انتها
+        app.state.retention_task = asyncio.create_task(retention_service.run_forever())
+
+    # غیرفعال‌سازی دسته‌ای اشتراک‌های منقضی
+    app.state.subscription_sweeper_task = asyncio.create_task(subscription_manager.run_sweeper())
 
     yield
     
@@ -206,9 +240,18 @@ async def lifespan(app: FastAPI):
     print("🛑 Shutting down...")
     # --- کد جدید برای توقف اسکنر ---
     if scanner:
-        scanner.running = False
+        scanner.stop()
         print("🛑 Scanner stop signal sent.")
+        # بعد از توکن جاری، start_scanning صف ارسال را خالی و موقعیت اسکن نیمه‌تمام را در snapshot ذخیره می‌کند
+        try:
+            await asyncio.wait_for(app.state.scanner_task, timeout=30)
+        except asyncio.TimeoutError:
+            print("⚠️ Scanner did not stop within 30s - cancelled")
+        except Exception as e:
+            print(f"❌ Scanner task ended with error: {e}")
     # --- پایان کد جدید ---
+    retention_service.running = False
+    subscription_manager.running = False
     await application.shutdown()
     try:
         await bot.delete_webhook()
@@ -228,6 +271,9 @@ scanner = None
 # Token cache instance  
 token_cache = TokenCache()
 
+# Retention service instance
+retention_service = RetentionService()
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle any message"""
     user_message = update.message.text
@@ -466,6 +512,19 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "ok", "message": "Webhook bot is running"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: per-stage scan timings, DB time and token counters"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/scanner", response_class=PlainTextResponse)
+async def scanner_metrics():
+    """آخرین متریک‌های منتشر شده توسط اسکنر مستقل (در حالت embedded همان /metrics است)"""
+    if scanner:
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+    state = db_manager.get_service_state("scanner")
+    return PlainTextResponse((state or {}).get('metrics') or "", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/webhook/telegram")
 async def webhook_handler(request: Request):
     """Handle webhook updates from Telegram"""
@@ -556,13 +615,17 @@ async def scanner_status():
         last_signals = db_manager.fetchall(last_signals_query)
         active_cooldowns = db_manager.fetchall(cooldown_query)
 
+        if scanner:
+            scanner_state = scanner.status()
+        else:
+            # اسکنر مستقل وضعیتش را در service_state منتشر می‌کند
+            service_state = db_manager.get_service_state("scanner")
+            scanner_state = dict(service_state['state'] or {}, updated_at=service_state['updated_at']) if service_state else {"running": False}
+
+        retention_report = retention_service.last_report if scanner else scanner_state.get('retention')
+
         return {
-            "scanner_status": {
-                "running": getattr(scanner, 'running', False),
-                "scan_count": getattr(scanner, 'scan_count', 0),
-                "last_scan_time": getattr(scanner, 'last_scan_time', None),
-                "last_error": getattr(scanner, 'last_error', None)
-            },
+            "scanner_status": scanner_state,
             "trading_config": {
                 "zone_score_min": TradingConfig.ZONE_SCORE_MIN,
                 "scan_interval_seconds": Config.SCAN_INTERVAL,
@@ -572,7 +635,8 @@ async def scanner_status():
                 "tokens_in_cooldown": len(active_cooldowns) if active_cooldowns else 0,
                 "cooldown_details": active_cooldowns
             },
-            "recent_signals": last_signals
+            "recent_signals": last_signals,
+            "retention": retention_report
         }
     except Exception as e:
         # این لاگ برای دیباگ کردن بسیار مهم است
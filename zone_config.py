@@ -1,4 +1,5 @@
 # zone_config.py - تنظیمات الگوریتم تشخیص نواحی
+import math
 
 # Origin Zone Parameters
 ORIGIN_CONSOLIDATION_MIN = 20  # حداقل تعداد کندل در محدوده تجمع
@@ -50,6 +51,9 @@ TIER2_APPROACH_THRESHOLD = 0.015  # 1.5%
 TIER2_BREAKOUT_THRESHOLD = 0.01   # 1%
 TIER2_COOLDOWN_DISTANCE = 0.03    # 3%
 
+# فاصله‌ای که ماشین حالت zoneها (evaluate_zone_transitions) بیرون از آن state را به IDLE برمی‌گرداند
+RESET_DISTANCE = 0.05             # 5%
+
 # Zone States
 ZONE_STATES = {
     'IDLE': 'Far from zone',
@@ -69,3 +73,11 @@ SIGNAL_PRIORITY = {
     'TIER2_BREAKOUT': 5,
     'TIER2_APPROACHING': 3
 }
+
+# Zone Identity (شناسه پایدار zone برای جدول zone_states)
+ZONE_BUCKET_WIDTH = 0.001  # عرض هر bucket لگاریتمی = 0.1% (همان tolerance قبلی)
+
+
+def zone_bucket(price):
+    """شماره bucket لگاریتمی یک قیمت؛ zoneهای با فاصله کمتر از 0.1% در bucket یکسان یا مجاور قرار می‌گیرند"""
+    return int(math.floor(math.log(float(price)) / math.log1p(ZONE_BUCKET_WIDTH)))
@@ -0,0 +1,115 @@
+# zone_trigger.py
+import time
+from config import Config
+from zone_config import (
+    TIER1_APPROACH_THRESHOLD, TIER1_BREAKOUT_THRESHOLD,
+    TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD, RESET_DISTANCE
+)
+
+
+def level_band(price, level, approach_threshold, breakout_threshold):
+    """ناحیه قیمت نسبت به یک سطح، با همان مرزهای evaluate_zone_transitions"""
+    distance = (price - level) / level
+    if breakout_threshold < distance < RESET_DISTANCE:
+        return 'BROKEN_UP'
+    if -RESET_DISTANCE < distance < -breakout_threshold:
+        return 'BROKEN_DOWN'
+    if abs(distance) < approach_threshold:
+        return 'ABOVE_NEAR' if distance > 0 else 'BELOW_NEAR'
+    if abs(distance) > RESET_DISTANCE:
+        return 'FAR'
+    return 'GAP'
+
+
+class ZoneTriggerIndex:
+    """
+    ایندکس سبک سطوح هر توکن (zoneهای Tier 1/2 و اهداف فیبوناچی) از آخرین تحلیل کامل.
+    تحلیل کامل فقط وقتی لازم است که قیمت لحظه‌ای وارد ناحیه جدیدی نسبت به یکی از سطوح شود
+    یا سطوح کهنه شده باشند.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age or Config.ZONE_TRIGGER_MAX_AGE
+        # address -> {'levels': [...], 'built_at': float}
+        self._entries = {}
+        self.analyses_triggered = 0
+        self.analyses_skipped = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update(self, address, analysis_result, now=None):
+        """سطوح را از نتیجه تحلیل کامل استخراج و ناحیه فعلی قیمت نسبت به هرکدام را ثبت می‌کند"""
+        now = time.time() if now is None else now
+        if not analysis_result:
+            self._entries.pop(address, None)
+            return
+
+        technical_levels = analysis_result['technical_levels']
+        zones = technical_levels['zones']
+        levels = []
+        for zone in zones.get('tier1_critical', []):
+            levels.append((zone.get('level_price', zone.get('zone_bottom', 0)),
+                           TIER1_APPROACH_THRESHOLD, TIER1_BREAKOUT_THRESHOLD))
+        for zone in zones.get('tier2_major', []):
+            levels.append((zone.get('level_price', zone.get('zone_bottom', 0)),
+                           TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD))
+        # سطوح فیبوناچی و اهداف extension با thresholdهای Tier 2
+        for fib_key in ('fibonacci', 'fibonacci_extensions'):
+            fib_data = technical_levels.get(fib_key) or {}
+            for fib_price in (fib_data.get('levels') or {}).values():
+                levels.append((fib_price, TIER2_APPROACH_THRESHOLD, TIER2_BREAKOUT_THRESHOLD))
+
+        current_price = analysis_result['raw_data']['current_price']
+        entry_levels = []
+        for level, approach, breakout in levels:
+            if level and level > 0:
+                entry_levels.append({
+                    'price': float(level),
+                    'approach': approach,
+                    'breakout': breakout,
+                    'band': level_band(current_price, level, approach, breakout),
+                })
+        self._entries[address] = {'levels': entry_levels, 'built_at': now}
+
+    def nearest_distance(self, address, price):
+        """فاصله نسبی تا نزدیک‌ترین سطح ایندکس شده (یا None)"""
+        entry = self._entries.get(address)
+        if not entry or not price:
+            return None
+        distances = [abs(price - level['price']) / level['price'] for level in entry['levels']]
+        return min(distances) if distances else None
+
+    def should_analyze(self, address, price, now=None):
+        """(نیاز به تحلیل کامل؟, دلیل)"""
+        now = time.time() if now is None else now
+        entry = self._entries.get(address)
+        if entry is None:
+            reason = 'no_index'
+        elif now - entry['built_at'] > self.max_age:
+            reason = 'stale'
+        elif not price:
+            reason = 'no_price'
+        else:
+            reason = None
+            for level in entry['levels']:
+                band = level_band(price, level['price'], level['approach'], level['breakout'])
+                # ورود به ناحیه جدید (غیر از فاصله میانی) می‌تواند state را عوض کند
+                if band != level['band'] and band != 'GAP':
+                    reason = 'band_change'
+                    break
+
+        if reason:
+            self.analyses_triggered += 1
+            return True, reason
+        self.analyses_skipped += 1
+        return False, 'quiet'
+
+    def stats(self):
+        total = self.analyses_triggered + self.analyses_skipped
+        return {
+            'indexed': len(self._entries),
+            'triggered': self.analyses_triggered,
+            'skipped': self.analyses_skipped,
+            'skip_ratio': round(self.analyses_skipped / total, 3) if total else None,
+        }